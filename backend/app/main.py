@@ -1,14 +1,37 @@
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
-from app.routes import auth, portfolio, profile, stocks
+from app.routes import auth, portfolio, profile, stocks, market, stream
 from app.routes import admin_users, admin_portfolios, admin_simulations, admin_content, admin_support, admin_logs
+from app.services.compute_pool import compute_pool
+from app.services.prewarmer import prewarmer, PREWARM_ENABLED
+from app.services.quote_stream import quote_hub
+from app.services.simulation_cache import simulation_cache
+from app.services.simulation_jobs import simulation_jobs
+from app.services.simulation_store import simulation_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tareas de fondo que viven mientras vive la aplicación
+    compute_pool.start()
+    simulation_store.start()
+    simulation_cache.start()
+    simulation_jobs.start()
+    if PREWARM_ENABLED:
+        prewarmer.start()
+    yield
+    await quote_hub.stop()
+    prewarmer.stop()
+    await simulation_jobs.stop()
+    compute_pool.stop()
 
 app = FastAPI(
     title="PortafolioAI API",
     description="API para la gestión de portafolios de inversión impulsada por IA.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Configuración de CORS
@@ -18,6 +41,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Cursor de paginación de los listados de simulaciones
 )
 
 # Inclusión de rutas
@@ -25,6 +49,8 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Autenticación"])
 app.include_router(profile.router, prefix="/api", tags=["Perfil de Riesgo"])
 app.include_router(portfolio.router, prefix="/api", tags=["Portafolio"])
 app.include_router(stocks.router, prefix="/api", tags=["Datos de Acciones"])
+app.include_router(market.router, prefix="/api", tags=["Mercado"])
+app.include_router(stream.router, prefix="/api", tags=["Streaming de Cotizaciones"])
 app.include_router(admin_users.router, prefix="/api", tags=["Admin Usuarios"])
 app.include_router(admin_portfolios.router, prefix="/api", tags=["Admin Portafolios"])
 app.include_router(admin_simulations.router, prefix="/api", tags=["Admin Simulaciones"])
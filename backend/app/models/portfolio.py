@@ -15,14 +15,13 @@ class Portfolio(BaseModel):
     generated_at: datetime = Field(default_factory=datetime.utcnow)
     assets: List[Asset]
     metrics: Dict[str, Any]
-    simulation_history: Optional[List[Dict[str, Any]]] = None
+    risk_metrics: Optional[Dict[str, Any]] = None  # Riesgo realizado, ver app/services/risk_metrics.py
 
 class PortfolioCreate(BaseModel):
     user_id: str
     generated_at: datetime = Field(default_factory=datetime.utcnow)
     assets: List[Asset]
     metrics: Dict[str, Any]
-    simulation_history: Optional[List[Dict[str, Any]]] = None
 
     model_config = {
         "populate_by_name": True,
@@ -1,10 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
 from bson import ObjectId
+from pydantic import ValidationError
+from pymongo import UpdateOne
 from app.database import db
 from app.models.user import User
-from app.models.portfolio import Portfolio
+from app.models.portfolio import Asset, Portfolio
 from app.routes.auth import get_current_user, require_admin
+from app.routes.portfolio import run_compute, sync_prices
+from app.services.backtest import (
+    BACKTEST_COST_BPS, BACKTEST_MAX_COST_BPS, BACKTEST_MAX_CURVE_POINTS, BACKTEST_THRESHOLD, run_backtest
+)
+from app.services.optimizer_service import generate_rule_based_portfolio
+from app.services.rebalancing import REBALANCE_MIN_TRADE, REBALANCE_PERIOD_DAYS, REBALANCE_THRESHOLD, plan_rebalancing
+from app.services.risk_metrics import RISK_BENCHMARK, portfolio_weights, score_portfolios
+from app.services.simulation_store import simulation_store
+from app.services.stress_test import (
+    ASSET_CLASSES, ASSET_SECTORS, STRESS_MAX_TOP_PORTFOLIOS, STRESS_SCENARIOS, STRESS_TOP_PORTFOLIOS,
+    portfolios_fingerprint, resolve_scenarios, run_stress_test, scenario_key, stress_result_cache
+)
 
 router = APIRouter(prefix="/admin/portfolios", tags=["admin-portfolios"])
 
@@ -22,6 +38,258 @@ async def list_portfolios(current_user: User = Depends(require_admin)):
                 p["generated_at"] = p["generated_at"]["$date"]
     return portfolios
 
+@router.get("/risk", response_description="Risk metrics of every portfolio")
+async def list_portfolio_risk(current_user: User = Depends(require_admin)):
+    """
+    Métricas de riesgo realizadas de todos los portafolios en una sola pasada
+
+    Los retornos de todos los portafolios se calculan con una multiplicación de
+    matrices sobre el universo completo; sólo se recalculan los que tienen un
+    cierre nuevo o cambiaron de composición, y esos se guardan con un único
+    bulk_write.
+    """
+    portfolios = await run_in_threadpool(
+        lambda: list(db.portfolios.find({}, {"user_id": 1, "assets": 1, "risk_metrics": 1}))
+    )
+    if not portfolios:
+        return {"as_of": None, "scored": 0, "recomputed": 0, "portfolios": []}
+
+    # Los procesos de cálculo sólo leen el disco: precios de todos los portafolios y del índice de la beta al día
+    tickers = set().union(*(portfolio_weights(p.get("assets")) for p in portfolios))
+    await sync_prices(sorted(tickers | ({RISK_BENCHMARK} if RISK_BENCHMARK else set())))
+    try:
+        scores = await run_compute(score_portfolios, portfolios)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+    updates = [
+        UpdateOne({"_id": p["_id"]}, {"$set": {"risk_metrics": scores[str(p["_id"])]}})
+        for p in portfolios
+        if scores[str(p["_id"])] != p.get("risk_metrics")
+    ]
+    if updates:
+        await run_in_threadpool(db.portfolios.bulk_write, updates, ordered=False)
+
+    return {
+        "as_of": next(iter(scores.values()))["as_of"],
+        "scored": len(scores),
+        "recomputed": len(updates),
+        "portfolios": [
+            {"_id": str(p["_id"]), "user_id": p.get("user_id"), "risk_metrics": scores[str(p["_id"])]}
+            for p in portfolios
+        ]
+    }
+
+@router.get("/rebalance", response_description="Drift and rebalancing trades of every portfolio")
+async def list_rebalancing(
+    current_user: User = Depends(require_admin),
+    rule: str = Query("threshold", description="threshold | calendar"),
+    threshold: float = Query(REBALANCE_THRESHOLD, gt=0, lt=1, description="Desvío absoluto de peso (0-1) que dispara el rebalanceo"),
+    period_days: int = Query(REBALANCE_PERIOD_DAYS, ge=1, description="Días corridos entre rebalanceos (regla calendar)"),
+    min_trade: float = Query(REBALANCE_MIN_TRADE, ge=0, lt=1, description="Peso mínimo (0-1) de una operación"),
+    only_triggered: bool = Query(True, description="Devolver sólo los portafolios a rebalancear"),
+    user_id: Optional[str] = Query(None, description="Limitar a los portafolios de un usuario"),
+):
+    """
+    Deriva de los portafolios respecto de sus pesos objetivo y lista mínima de
+    operaciones para volver a ellos, con regla de umbral o de calendario
+
+    La deriva se mide desde el último rebalanceo (last_rebalanced_at) o, si no
+    hubo, desde la generación del portafolio, con los cierres del almacén de
+    precios. Todos los portafolios se evalúan juntos en una matriz de pesos.
+    El plan es sólo una propuesta: una vez ejecutadas las operaciones hay que
+    registrarlas con POST /{portfolio_id}/rebalance para que la deriva vuelva a
+    medirse desde ahí.
+    """
+    query = {"user_id": user_id} if user_id else {}
+    portfolios = await run_in_threadpool(
+        lambda: list(db.portfolios.find(query, {"user_id": 1, "assets": 1, "generated_at": 1, "last_rebalanced_at": 1}))
+    )
+    options = {
+        "rule": rule,
+        "threshold": threshold,
+        "period_days": period_days,
+        "min_trade": min_trade,
+        "only_triggered": only_triggered,
+    }
+    # Los procesos de cálculo sólo leen el disco: precios de todos los portafolios al día
+    await sync_prices(sorted(set().union(*(portfolio_weights(p.get("assets")) for p in portfolios))))
+    try:
+        return await run_compute(plan_rebalancing, portfolios, options)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/{portfolio_id}/rebalance", response_description="Record an executed rebalance")
+async def record_rebalance(
+    portfolio_id: str,
+    current_user: User = Depends(require_admin),
+    rebalance_data: Dict[str, Any] = Body(default={}),
+):
+    """
+    Registra que el portafolio se rebalanceó: desde ahora la deriva se mide
+    desde esta fecha (last_rebalanced_at)
+
+    Body (opcional):
+        assets: Nuevas asignaciones objetivo (ticker, name, allocation_pct,
+            reason), que deben sumar 100; por defecto se vuelve a las actuales
+        rebalanced_at: Fecha ISO en que se ejecutaron las operaciones (por defecto, ahora)
+    """
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid portfolio ID")
+
+    update: Dict[str, Any] = {"last_rebalanced_at": datetime.utcnow()}
+    if rebalance_data.get("rebalanced_at"):
+        try:
+            rebalanced_at = datetime.fromisoformat(rebalance_data["rebalanced_at"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="rebalanced_at must be an ISO date")
+        if rebalanced_at.tzinfo is not None:
+            # Las fechas se guardan en UTC sin zona, como generated_at
+            rebalanced_at = rebalanced_at.astimezone(timezone.utc).replace(tzinfo=None)
+        update["last_rebalanced_at"] = rebalanced_at
+    if update["last_rebalanced_at"] > datetime.utcnow():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="rebalanced_at cannot be in the future")
+
+    assets = rebalance_data.get("assets")
+    if assets is not None:
+        if not isinstance(assets, list) or not assets:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="assets must be a non-empty list")
+        try:
+            assets = [Asset.model_validate(asset).model_dump() for asset in assets]
+        except ValidationError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid assets: {e.errors()[0]['msg']}")
+        total = sum(asset["allocation_pct"] for asset in assets)
+        if abs(total - 100.0) > 0.5:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Allocations must add up to 100 (got {total:g})")
+        update["assets"] = assets
+
+    result = await run_in_threadpool(db.portfolios.update_one, {"_id": ObjectId(portfolio_id)}, {"$set": update})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
+    return {
+        "portfolio_id": portfolio_id,
+        "last_rebalanced_at": update["last_rebalanced_at"].isoformat(),
+        "assets_updated": "assets" in update,
+    }
+
+@router.post("/backtest", response_description="Backtest many portfolios over the same prices")
+async def backtest_portfolios(current_user: User = Depends(require_admin), backtest_data: Dict[str, Any] = Body(...)):
+    """
+    Backtest de muchos portafolios en una sola pasada sobre la misma matriz de precios
+
+    Body:
+        portfolio_ids: Portafolios guardados a evaluar (por defecto, todos)
+        include_rule_based: Agregar las asignaciones por reglas de cada nivel de
+            riesgo (ids 'rule_based:low', 'rule_based:medium', 'rule_based:high')
+        rebalance: 'none', 'monthly' o 'threshold'
+        threshold, cost_bps, lookback, curve_points: Como en /portfolio/{id}/backtest
+    """
+    try:
+        options = {
+            "rebalance": str(backtest_data.get("rebalance", "monthly")),
+            "threshold": float(backtest_data.get("threshold", BACKTEST_THRESHOLD)),
+            "cost_bps": float(backtest_data.get("cost_bps", BACKTEST_COST_BPS)),
+            "lookback": str(backtest_data.get("lookback", "3y")),
+            "curve_points": int(backtest_data.get("curve_points", 0)),
+        }
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="threshold and cost_bps must be numbers and curve_points an integer"
+        )
+    if not 0 < options["threshold"] < 1:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="threshold must be between 0 and 1")
+    if not 0 <= options["cost_bps"] <= BACKTEST_MAX_COST_BPS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"cost_bps must be between 0 and {BACKTEST_MAX_COST_BPS}")
+    if not 0 <= options["curve_points"] <= BACKTEST_MAX_CURVE_POINTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"curve_points must be between 0 and {BACKTEST_MAX_CURVE_POINTS}")
+
+    portfolio_ids = backtest_data.get("portfolio_ids")
+    query = {}
+    if portfolio_ids is not None:
+        if not isinstance(portfolio_ids, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="portfolio_ids must be a list")
+        invalid = [portfolio_id for portfolio_id in portfolio_ids if not ObjectId.is_valid(portfolio_id)]
+        if invalid:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid portfolio IDs: {invalid[:10]}")
+        query = {"_id": {"$in": [ObjectId(portfolio_id) for portfolio_id in portfolio_ids]}}
+    portfolios = await run_in_threadpool(lambda: list(db.portfolios.find(query, {"assets": 1})))
+    if backtest_data.get("include_rule_based", portfolio_ids is None):
+        for risk_level in ("low", "medium", "high"):
+            rule_based = generate_rule_based_portfolio({"risk_level": risk_level}, {})
+            portfolios.append({"id": f"rule_based:{risk_level}", "assets": rule_based["assets"]})
+    if not portfolios:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No portfolios to backtest")
+
+    # Los procesos de cálculo sólo leen el disco: precios de todos los portafolios al día
+    await sync_prices(sorted(set().union(*(portfolio_weights(p.get("assets")) for p in portfolios))))
+    try:
+        return await run_compute(run_backtest, portfolios, options)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/stress/scenarios", response_description="Asset classes, sectors and predefined stress scenarios")
+async def list_stress_scenarios(current_user: User = Depends(require_admin)):
+    return {
+        "asset_classes": ASSET_CLASSES,
+        "sectors": ASSET_SECTORS,
+        "scenarios": STRESS_SCENARIOS,
+        "cache": stress_result_cache.stats()
+    }
+
+@router.post("/stress", response_description="Stress-test every portfolio against shock scenarios")
+async def stress_test_portfolios(current_user: User = Depends(require_admin), stress_data: Dict[str, Any] = Body(...)):
+    """
+    Aplica escenarios de shock a todos los portafolios en una sola pasada
+
+    Body:
+        scenarios: Lista de nombres predefinidos (ver /stress/scenarios) o de
+            {'name', 'shocks'}, con shocks por ticker, sector o clase de activo
+            en fracción (ej: {"tech": -0.30, "gold": 0.10})
+        top: Portafolios más golpeados a devolver por escenario (1 a STRESS_MAX_TOP_PORTFOLIOS)
+
+    Los resultados se cachean por escenario mientras no cambie ningún portafolio.
+    """
+    try:
+        scenarios = resolve_scenarios(stress_data.get("scenarios") or [])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not scenarios:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At least one scenario is required")
+    top = stress_data.get("top", STRESS_TOP_PORTFOLIOS)
+    if isinstance(top, bool) or not isinstance(top, int) or not 1 <= top <= STRESS_MAX_TOP_PORTFOLIOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"top must be an integer between 1 and {STRESS_MAX_TOP_PORTFOLIOS}"
+        )
+
+    portfolios = await run_in_threadpool(lambda: list(db.portfolios.find({}, {"user_id": 1, "assets": 1})))
+    if not portfolios:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No portfolios to stress-test")
+
+    fingerprint = await run_in_threadpool(portfolios_fingerprint, portfolios)
+    keys = [scenario_key(scenario, fingerprint, top) for scenario in scenarios]
+    cached, missing = stress_result_cache.get_many(keys)
+    if missing:
+        pending = [scenario for scenario, key in zip(scenarios, keys) if key in missing]
+        try:
+            computed = await run_compute(run_stress_test, portfolios, pending, top)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        for scenario, result in zip(pending, computed):
+            key = scenario_key(scenario, fingerprint, top)
+            stress_result_cache.put(key, result)
+            cached[key] = result
+
+    return {
+        "portfolios": len(portfolios),
+        "computed": len(set(missing)),
+        "scenarios": [
+            {**cached[key], "name": scenario["name"], "cached": key not in missing}
+            for scenario, key in zip(scenarios, keys)
+        ]
+    }
+
 @router.get("/{portfolio_id}", response_description="Get portfolio by ID")
 async def get_portfolio(portfolio_id: str, current_user: User = Depends(require_admin)):
     portfolio = db.portfolios.find_one({"_id": ObjectId(portfolio_id)})
@@ -35,6 +303,7 @@ async def delete_portfolio(portfolio_id: str, current_user: User = Depends(requi
     result = db.portfolios.delete_one({"_id": ObjectId(portfolio_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Portfolio not found")
+    simulation_store.delete_for_portfolio(portfolio_id)
     return {"message": "Portfolio deleted"}
 
 @router.put("/{portfolio_id}", response_description="Update portfolio")
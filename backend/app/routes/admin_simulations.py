@@ -1,37 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from typing import List, Dict, Any
-from bson import ObjectId
-from app.database import db
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import Optional
 from app.models.user import User
 from app.routes.auth import require_admin
+from app.routes.portfolio import simulations_page
+from app.services.simulation_store import SIMULATION_MAX_PAGE_SIZE, SIMULATION_PAGE_SIZE, simulation_store
 
 router = APIRouter(prefix="/admin/simulations", tags=["admin-simulations"])
 
 @router.get("/", response_description="List all simulations")
-async def list_simulations(current_user: User = Depends(require_admin)):
-    portfolios = db.portfolios.find({"simulation_history": {"$exists": True, "$ne": None}})
-    simulations = []
-    for p in portfolios:
-        for sim in p.get("simulation_history", []):
-            sim_copy = sim.copy()
-            sim_copy["portfolio_id"] = str(p["_id"])
-            sim_copy["user_id"] = p["user_id"]
-            simulations.append(sim_copy)
-    return simulations
+async def list_simulations(
+    response: Response,
+    current_user: User = Depends(require_admin),
+    user_id: Optional[str] = None,
+    limit: int = Query(SIMULATION_PAGE_SIZE, ge=1, le=SIMULATION_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_result: bool = True,
+):
+    """
+    Simulaciones de todos los usuarios (o de uno), las más recientes primero
+
+    Se paginan por cursor: si hay más, la respuesta trae la cabecera
+    X-Next-Cursor con el valor a pasar como `cursor` para la página siguiente.
+    """
+    return simulations_page(response, include_result, user_id=user_id, limit=limit, cursor=cursor)
 
 @router.get("/portfolio/{portfolio_id}", response_description="Get simulations for a portfolio")
-async def get_simulations_for_portfolio(portfolio_id: str, current_user: User = Depends(require_admin)):
-    portfolio = db.portfolios.find_one({"_id": ObjectId(portfolio_id)})
-    if not portfolio or not portfolio.get("simulation_history"):
+async def get_simulations_for_portfolio(
+    portfolio_id: str,
+    response: Response,
+    current_user: User = Depends(require_admin),
+    limit: int = Query(SIMULATION_PAGE_SIZE, ge=1, le=SIMULATION_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_result: bool = True,
+):
+    simulations = simulations_page(response, include_result, portfolio_id=portfolio_id, limit=limit, cursor=cursor)
+    if not simulations and not cursor:
         raise HTTPException(status_code=404, detail="No simulations found for this portfolio")
-    return portfolio["simulation_history"]
+    return simulations
+
+@router.delete("/portfolio/{portfolio_id}", response_description="Delete every simulation of a portfolio")
+async def delete_simulations_for_portfolio(portfolio_id: str, current_user: User = Depends(require_admin)):
+    deleted = simulation_store.delete_for_portfolio(portfolio_id)
+    return {"message": "Simulations deleted", "deleted": deleted}
+
+@router.delete("/{simulation_id}", response_description="Delete a simulation by ID")
+async def delete_simulation_by_id(simulation_id: str, current_user: User = Depends(require_admin)):
+    if not simulation_store.delete(simulation_id):
+        raise HTTPException(status_code=404, detail="Simulation not found")
+    return {"message": "Simulation deleted"}
 
 @router.delete("/{portfolio_id}/{timestamp}", response_description="Delete a simulation by timestamp")
 async def delete_simulation(portfolio_id: str, timestamp: str, current_user: User = Depends(require_admin)):
-    result = db.portfolios.update_one(
-        {"_id": ObjectId(portfolio_id)},
-        {"$pull": {"simulation_history": {"timestamp": timestamp}}}
-    )
-    if result.modified_count == 0:
+    if not simulation_store.delete_at(portfolio_id, timestamp):
         raise HTTPException(status_code=404, detail="Simulation not found")
     return {"message": "Simulation deleted"}
@@ -1,54 +1,50 @@
 from fastapi import APIRouter, HTTPException
-from typing import List
-from pydantic import BaseModel
-from app.services.yahoo_service import YahooFinanceService
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from app.services.yahoo_finance_service import YahooFinanceService
+from app.services.history_format import CHART_TYPES, HISTORY_FORMATS, MIN_CHART_POINTS
 
 router = APIRouter()
 yahoo_service = YahooFinanceService()
 
-class StockRequest(BaseModel):
-    tickers: List[str]
-
-@router.post("/stock-data")
-async def get_stock_data(request: StockRequest):
-    """
-    Obtiene datos en tiempo real de múltiples acciones desde Yahoo Finance
-    
-    Body:
-        tickers: Lista de símbolos de acciones
-    
-    Returns:
-        Lista con información de cada acción
-    """
-    try:
-        if not request.tickers:
-            raise HTTPException(status_code=400, detail="La lista de tickers no puede estar vacía")
-        
-        stocks_data = yahoo_service.get_stock_data(request.tickers)
-        
-        return {
-            "success": True,
-            "count": len(stocks_data),
-            "stocks": stocks_data
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error obteniendo datos de mercado: {str(e)}")
-
 @router.get("/historical/{ticker}")
-async def get_historical_data(ticker: str, period: str = "1y"):
+async def get_historical_data(
+    ticker: str,
+    period: str = "1y",
+    format: str = "rows",
+    max_points: Optional[int] = None,
+    chart: str = "line",
+):
     """
     Obtiene datos históricos de una acción
     
     Args:
         ticker: Símbolo de la acción
         period: Período de tiempo (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
+        format: rows (lista de barras, por defecto) o columns (una lista por campo)
+        max_points: Cantidad máxima de puntos (opcional)
+        chart: line (por defecto) o candles (velas agregadas)
     
     Returns:
         Datos históricos de la acción
     """
     try:
-        historical_data = yahoo_service.get_historical_data(ticker, period)
+        if format not in HISTORY_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Formato inválido. Opciones: {', '.join(HISTORY_FORMATS)}")
+        
+        if chart not in CHART_TYPES:
+            raise HTTPException(status_code=400, detail=f"Tipo de gráfico inválido. Opciones: {', '.join(CHART_TYPES)}")
+        
+        if max_points is not None and max_points < MIN_CHART_POINTS:
+            raise HTTPException(status_code=400, detail=f"max_points debe ser al menos {MIN_CHART_POINTS}")
+        
+        historical_data = await run_in_threadpool(
+            yahoo_service.get_historical_data, ticker, period, format, max_points, chart
+        )
+        
+        if "error" in historical_data:
+            raise HTTPException(status_code=404, detail=historical_data["error"])
+        
         return {
             "success": True,
             **historical_data
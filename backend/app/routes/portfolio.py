@@ -1,32 +1,110 @@
-from fastapi import APIRouter, Body, Depends, HTTPException, status
-from typing import Annotated, Dict, Any, List
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Annotated, Dict, Any, List, Optional
 from datetime import datetime
 from bson import ObjectId
+import json
+import logging
+import os
 from app.database import db
 from app.models.user import User
 from app.models.portfolio import Portfolio, PortfolioCreate
-from app.routes.auth import get_current_user
-from app.services.optimizer_service import generate_portfolio
+from app.routes.auth import get_current_user, require_admin
+from app.services.backtest import (
+    BACKTEST_COST_BPS, BACKTEST_MAX_COST_BPS, BACKTEST_MAX_CURVE_POINTS, BACKTEST_THRESHOLD, run_backtest
+)
+from app.services.compute_pool import ComputePoolSaturated, ComputeTimeout, compute_pool
+from app.services.monte_carlo import run_simulation
+from app.services.optimizer_service import EXTENDED_ASSETS, generate_portfolio, generate_portfolios, profile_signature
+from app.services.price_store import price_store
+from app.services.risk_metrics import RISK_BENCHMARK, portfolio_weights, score_portfolios
+from app.services.simulation_cache import simulation_cache
+from app.services.simulation_jobs import JobLimitExceeded, simulation_jobs
+from app.services.simulation_store import SIMULATION_MAX_PAGE_SIZE, SIMULATION_PAGE_SIZE, simulation_store
+from app.services.simulation_stream import simulation_streamer
+from app.services.yahoo_finance_service import YahooFinanceService
 ## Chatbot eliminado: no se importa ni usa explain_concept
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Perfiles máximos por solicitud de /optimize/batch
+OPTIMIZE_BATCH_MAX_PROFILES = 10000
+# Segundos sugeridos al cliente para reintentar cuando el pool de cálculo está saturado
+COMPUTE_RETRY_AFTER_SECONDS = 2
+# Segundos máximos de una simulación (las grandes superan el tiempo por defecto del pool)
+SIMULATION_TIMEOUT = float(os.getenv("SIMULATION_TIMEOUT", "300"))
+# Cabecera con el cursor de la página siguiente (ausente en la última página)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+async def run_compute(fn, *args, timeout: Optional[float] = None):
+    """Ejecuta trabajo de CPU en el pool de procesos, traduciendo saturación y vencimiento a HTTP"""
+    try:
+        return await compute_pool.run(fn, *args, timeout=timeout)
+    except ComputePoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Server busy, retry later",
+            headers={"Retry-After": str(COMPUTE_RETRY_AFTER_SECONDS)}
+        )
+    except ComputeTimeout as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+
+
+async def sync_prices(tickers: List[str]) -> None:
+    """
+    Pone al día en disco los precios que va a leer una tarea del pool de cálculo
+    (sus procesos no consultan a la fuente de datos)
+    """
+    missing = await run_in_threadpool(price_store.sync_many, tickers)
+    if missing:
+        logger.warning(f"Sin historial para {len(missing)} tickers: {', '.join(missing[:10])}")
+
+
+def simulations_page(response: Response, include_result: bool = True, **filters: Any) -> List[Dict[str, Any]]:
+    """
+    Página de simulaciones para una respuesta HTTP: la lista en el cuerpo y el
+    cursor de la siguiente en la cabecera X-Next-Cursor
+
+    Raises:
+        HTTPException: 400 si el cursor es inválido
+    """
+    try:
+        simulations, next_cursor = simulation_store.list_simulations(include_result=include_result, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    for simulation in simulations:
+        simulation["_id"] = str(simulation["_id"])
+    return simulations
+
+
+def _profile_from_payload(portfolio_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "risk_level": portfolio_data.get("risk_level"),
+        "investment_goal": portfolio_data.get("investment_goal"),
+        "experience_level": portfolio_data.get("experience_level"),
+        "country": portfolio_data.get("country"),
+    }
+
 @router.post("/optimize", response_description="Generate and save user portfolio")
 async def optimize_portfolio(
     current_user: Annotated[User, Depends(get_current_user)],
     portfolio_data: Dict[str, Any] = Body(...)
 ):
     user_id = str(current_user["_id"])
-    user_profile = {
-        "risk_level": portfolio_data.get("risk_level"),
-        "investment_goal": portfolio_data.get("investment_goal"),
-        "experience_level": portfolio_data.get("experience_level"),
-        "country": portfolio_data.get("country"),
-    }
+    user_profile = _profile_from_payload(portfolio_data)
     preferences = portfolio_data.get("preferences", {})
 
-    # Generar portafolio usando el servicio de optimización (simple o avanzado)
-    optimized_portfolio = generate_portfolio(user_profile, preferences)
+    # Generar portafolio usando el servicio de optimización (media-varianza, o reglas fijas sin historial)
+    await sync_prices([asset["ticker"] for asset in EXTENDED_ASSETS])
+    optimized_portfolio = await run_compute(generate_portfolio, user_profile, preferences)
+    if optimized_portfolio["metrics"].get("method") == "rule_based":
+        logger.warning(f"Portafolio de {user_id} generado con las reglas fijas: no se pudo optimizar")
 
     # Opcional: Usar Gemini para generar el portafolio (si está configurado y se desea)
     # gemini_portfolio_response = generate_portfolio_prompt(user_profile, preferences)
@@ -51,6 +129,65 @@ async def optimize_portfolio(
     
     return created_portfolio
 
+@router.post("/optimize/batch", response_description="Generate and save portfolios for many users")
+async def optimize_portfolios_batch(
+    current_user: Annotated[User, Depends(require_admin)],
+    batch_data: Dict[str, Any] = Body(...)
+):
+    """
+    Genera y guarda los portafolios de muchos usuarios en una sola pasada (solo admin)
+
+    Body:
+        profiles: Lista de perfiles, cada uno con user_id, risk_level,
+            investment_goal, experience_level, country y preferences (los mismos
+            campos que /optimize)
+
+    Los perfiles con los mismos datos de riesgo se resuelven una sola vez y
+    todos los portafolios se guardan con un único insert_many.
+
+    Returns:
+        requested, distinct_profiles, inserted y los ids de los portafolios
+        creados en el mismo orden que los perfiles
+    """
+    profiles = batch_data.get("profiles") or []
+    if not profiles:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Profiles list is required")
+    if len(profiles) > OPTIMIZE_BATCH_MAX_PROFILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Maximum {OPTIMIZE_BATCH_MAX_PROFILES} profiles per request"
+        )
+    missing = [i for i, profile in enumerate(profiles) if not profile.get("user_id")]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"user_id is required (profiles without it: {missing[:10]})"
+        )
+
+    inputs = [(_profile_from_payload(profile), profile.get("preferences") or {}) for profile in profiles]
+    await sync_prices([asset["ticker"] for asset in EXTENDED_ASSETS])
+    portfolios = await run_compute(generate_portfolios, inputs)
+    fallbacks = sum(1 for portfolio in portfolios if portfolio["metrics"].get("method") == "rule_based")
+    if fallbacks:
+        logger.warning(f"{fallbacks} de {len(portfolios)} portafolios generados con las reglas fijas: no se pudo optimizar")
+
+    documents = [
+        PortfolioCreate(
+            user_id=str(profile["user_id"]),
+            assets=portfolio["assets"],
+            metrics=portfolio["metrics"]
+        ).model_dump(by_alias=True, exclude_unset=True)
+        for profile, portfolio in zip(profiles, portfolios)
+    ]
+    result = await run_in_threadpool(db.portfolios.insert_many, documents, ordered=False)
+
+    return {
+        "requested": len(profiles),
+        "distinct_profiles": len({profile_signature(*profile_input) for profile_input in inputs}),
+        "inserted": len(result.inserted_ids),
+        "portfolio_ids": [str(inserted_id) for inserted_id in result.inserted_ids]
+    }
+
 @router.get("/portfolio/{user_id}", response_description="Get user portfolio and simulations")
 async def get_user_portfolio(user_id: str, current_user: Annotated[User, Depends(get_current_user)]):
     if str(current_user["_id"]) != user_id:
@@ -61,33 +198,272 @@ async def get_user_portfolio(user_id: str, current_user: Annotated[User, Depends
         return portfolio
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found")
 
+@router.get("/portfolio/{portfolio_id}/risk", response_description="Get realized risk metrics of a portfolio")
+async def get_portfolio_risk(portfolio_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    """
+    Métricas de riesgo realizadas del portafolio (volatilidad, VaR/CVaR históricos
+    y paramétricos, máxima caída, beta y Sharpe) sobre los retornos diarios
+    cacheados. Se guardan en el portafolio y sólo se recalculan cuando hay un
+    cierre nuevo o cambió la composición.
+    """
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid portfolio ID")
+    portfolio = db.portfolios.find_one(
+        {"_id": ObjectId(portfolio_id), "user_id": str(current_user["_id"])},
+        {"assets": 1, "risk_metrics": 1}
+    )
+    if not portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found or not authorized")
+
+    # Los procesos de cálculo sólo leen el disco: precios del portafolio y del índice de la beta al día
+    await sync_prices([*portfolio_weights(portfolio.get("assets")), *([RISK_BENCHMARK] if RISK_BENCHMARK else [])])
+    try:
+        risk_metrics = (await run_compute(score_portfolios, [portfolio]))[portfolio_id]
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if risk_metrics != portfolio.get("risk_metrics"):
+        await run_in_threadpool(db.portfolios.update_one, {"_id": portfolio["_id"]}, {"$set": {"risk_metrics": risk_metrics}})
+    return {"portfolio_id": portfolio_id, "risk_metrics": risk_metrics}
+
+@router.get("/portfolio/{portfolio_id}/backtest", response_description="Backtest a portfolio over historical prices")
+async def backtest_portfolio(
+    portfolio_id: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+    rebalance: str = Query("monthly", description="none | monthly | threshold"),
+    threshold: float = Query(BACKTEST_THRESHOLD, gt=0, lt=1, description="Desvío de peso (0-1) que dispara el rebalanceo"),
+    cost_bps: float = Query(BACKTEST_COST_BPS, ge=0, le=BACKTEST_MAX_COST_BPS, description="Costo de transacción en puntos básicos"),
+    lookback: str = Query("3y", description="Período de historia: 1y, 3y, 5y, 10y, max..."),
+    curve_points: int = Query(120, ge=0, le=BACKTEST_MAX_CURVE_POINTS, description="Puntos de la curva de valor (0 = sin curva)"),
+):
+    """
+    Cómo le habría ido al portafolio con sus pesos sobre los cierres históricos,
+    con la política de rebalanceo y los costos de transacción indicados
+    """
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid portfolio ID")
+    portfolio = db.portfolios.find_one({"_id": ObjectId(portfolio_id), "user_id": str(current_user["_id"])}, {"assets": 1})
+    if not portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found or not authorized")
+
+    options = {
+        "rebalance": rebalance,
+        "threshold": threshold,
+        "cost_bps": cost_bps,
+        "lookback": lookback,
+        "curve_points": curve_points,
+    }
+    # Los procesos de cálculo sólo leen el disco: precios del portafolio al día
+    await sync_prices(list(portfolio_weights(portfolio.get("assets"))))
+    try:
+        return await run_compute(run_backtest, [portfolio], options)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.post("/simulate", response_description="Execute or save a simulation")
 async def simulate_portfolio(
     current_user: Annotated[User, Depends(get_current_user)],
     simulation_data: Dict[str, Any] = Body(...)
 ):
+    """
+    Ejecuta una simulación Monte Carlo del portafolio y la guarda en su historial
+
+    Body:
+        portfolio_id: Portafolio a simular (del usuario)
+        params: method ('gbm' | 'bootstrap'), paths, horizon_years, amount y seed
+            (opcional; sin semilla se sortea una y se devuelve para repetir la corrida)
+
+    Una simulación idéntica (mismos pesos, parámetros y datos de mercado) se
+    responde desde la cache de resultados sin recalcular, con cached=true.
+    """
     user_id = str(current_user["_id"])
     portfolio_id = simulation_data.get("portfolio_id")
     if not portfolio_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Portfolio ID is required for simulation")
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid portfolio ID")
+
+    portfolio = db.portfolios.find_one({"_id": ObjectId(portfolio_id), "user_id": user_id}, {"assets": 1})
+    if not portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found or not authorized")
+
+    params = simulation_data.get("params")
+    try:
+        cache_key = await run_in_threadpool(simulation_cache.key_for, portfolio["assets"], params)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    cached = simulation_cache.get(cache_key) if cache_key else None
 
-    # Aquí iría la lógica de simulación. Por ahora, solo guardamos los datos.
-    # En una implementación real, esto ejecutaría cálculos complejos.
-    simulation_result = {
-        "timestamp": datetime.utcnow().isoformat(),
-        "params": simulation_data.get("params"),
-        "result": {"mock_performance": [10000, 10100, 10250, 10400, 10500]}
+    if cached:
+        params, result = cached["params"], cached["result"]
+    else:
+        try:
+            result = await run_compute(run_simulation, portfolio["assets"], params, timeout=SIMULATION_TIMEOUT)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        params = result.pop("params")
+        if cache_key:
+            simulation_cache.put(cache_key, params, result)
+
+    simulation = simulation_store.save(user_id, portfolio_id, params, result, cached=bool(cached))
+    simulation["_id"] = str(simulation["_id"])
+
+    return {
+        "message": "Simulation saved successfully",
+        "simulation": simulation,
+        "cached": bool(cached),
+        "cached_at": cached["cached_at"] if cached else None
     }
 
-    update_result = db.portfolios.update_one(
-        {"_id": ObjectId(portfolio_id), "user_id": user_id},
-        {"$push": {"simulation_history": simulation_result}}
+@router.post("/simulate/stream", response_description="Stream progress and partial results of a simulation")
+async def stream_simulation(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    simulation_data: Dict[str, Any] = Body(...),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$", description="ndjson (una línea JSON por evento) o sse"),
+    tolerance: Optional[float] = Query(None, gt=0, lt=1, description="Detener cuando los percentiles del valor final cambian menos que esta fracción entre estimaciones"),
+):
+    """
+    Ejecuta una simulación informando el avance mientras corre
+
+    Mismo body que /simulate. Eventos: 'started', 'progress' (caminos hechos y
+    percentiles estimados con ellos), y al final 'result' (guardado en el
+    historial) o 'error'. Si el cliente corta la conexión, la simulación se
+    cancela y libera su plaza del pool; con `tolerance` se detiene sola cuando
+    las bandas convergen.
+    """
+    user_id = str(current_user["_id"])
+    portfolio_id = simulation_data.get("portfolio_id")
+    if not portfolio_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Portfolio ID is required for simulation")
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid portfolio ID")
+
+    portfolio = db.portfolios.find_one({"_id": ObjectId(portfolio_id), "user_id": user_id}, {"assets": 1})
+    if not portfolio:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found or not authorized")
+
+    stream = simulation_streamer.stream(
+        user_id, portfolio_id, portfolio["assets"], simulation_data.get("params"),
+        tolerance=tolerance, timeout=SIMULATION_TIMEOUT
+    )
+    # El primer evento valida los parámetros y toma la plaza del pool: sus errores son HTTP
+    try:
+        first = await stream.__anext__()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ComputePoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Server busy, retry later",
+            headers={"Retry-After": str(COMPUTE_RETRY_AFTER_SECONDS)}
+        )
+
+    def encode(event: Dict[str, Any]) -> str:
+        data = json.dumps(event, default=str)
+        return f"event: {event['type']}\ndata: {data}\n\n" if format == "sse" else data + "\n"
+
+    async def events():
+        try:
+            yield encode(first)
+            async for event in stream:
+                if await request.is_disconnected():
+                    break
+                yield encode(event)
+        except Exception as e:
+            logger.error(f"Error en la simulación en stream: {str(e)}")
+            yield encode({"type": "error", "detail": str(e)})
+        finally:
+            # Cierra el generador: si la simulación sigue corriendo, se cancela
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/simulate/cache/stats", response_description="Simulation result cache statistics")
+async def get_simulation_cache_stats(current_user: Annotated[User, Depends(require_admin)]):
+    return simulation_cache.stats()
+
+@router.get("/simulations", response_description="List the user's saved simulations")
+async def list_user_simulations(
+    response: Response,
+    current_user: Annotated[User, Depends(get_current_user)],
+    portfolio_id: Optional[str] = None,
+    limit: int = Query(SIMULATION_PAGE_SIZE, ge=1, le=SIMULATION_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_result: bool = True,
+):
+    """
+    Simulaciones guardadas del usuario (o de uno de sus portafolios), las más
+    recientes primero. Si hay más, la cabecera X-Next-Cursor trae el `cursor`
+    de la página siguiente.
+    """
+    return simulations_page(
+        response, include_result,
+        user_id=str(current_user["_id"]), portfolio_id=portfolio_id, limit=limit, cursor=cursor
     )
 
-    if update_result.modified_count == 0:
+@router.delete("/simulations/{simulation_id}", response_description="Delete a saved simulation")
+async def delete_user_simulation(simulation_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    if not simulation_store.delete(simulation_id, str(current_user["_id"])):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Simulation not found")
+    return {"message": "Simulation deleted"}
+
+def _job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    job = {key: value for key, value in job.items() if key not in ("cancel_requested", "heartbeat_at", "expire_at")}
+    job["_id"] = str(job["_id"])
+    return job
+
+@router.post("/simulate/jobs", status_code=status.HTTP_202_ACCEPTED, response_description="Queue a background simulation")
+async def submit_simulation_job(
+    current_user: Annotated[User, Depends(get_current_user)],
+    simulation_data: Dict[str, Any] = Body(...)
+):
+    """
+    Encola una simulación en segundo plano y devuelve el id del trabajo sin esperar
+
+    Mismo body que /simulate. El avance y el resultado se consultan en
+    GET /simulate/jobs/{job_id}; al terminar, el resultado se guarda también en
+    el historial de simulaciones (GET /simulations).
+    """
+    user_id = str(current_user["_id"])
+    portfolio_id = simulation_data.get("portfolio_id")
+    if not portfolio_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Portfolio ID is required for simulation")
+    if not ObjectId.is_valid(portfolio_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid portfolio ID")
+
+    portfolio = db.portfolios.find_one({"_id": ObjectId(portfolio_id), "user_id": user_id}, {"assets": 1})
+    if not portfolio:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Portfolio not found or not authorized")
-    
-    return {"message": "Simulation saved successfully", "simulation": simulation_result}
+
+    try:
+        job = await simulation_jobs.submit(user_id, portfolio_id, portfolio["assets"], simulation_data.get("params"))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    return {"job_id": str(job["_id"]), "status": job["status"], "cached": job.get("cached", False)}
+
+@router.get("/simulate/jobs", response_description="List the user's simulation jobs")
+async def list_simulation_jobs(current_user: Annotated[User, Depends(get_current_user)]):
+    return [_job_response(job) for job in simulation_jobs.list_jobs(str(current_user["_id"]))]
+
+@router.get("/simulate/jobs/{job_id}", response_description="Get status, progress and result of a simulation job")
+async def get_simulation_job(job_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    job = simulation_jobs.get(job_id, str(current_user["_id"]))
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Simulation job not found")
+    return _job_response(job)
+
+@router.delete("/simulate/jobs/{job_id}", response_description="Cancel a simulation job")
+async def cancel_simulation_job(job_id: str, current_user: Annotated[User, Depends(get_current_user)]):
+    job = simulation_jobs.cancel(job_id, str(current_user["_id"]))
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Simulation job not found")
+    return _job_response(job)
 
 @router.post("/support/contact", response_description="Submit a contact message")
 async def submit_contact_message(
@@ -144,57 +520,26 @@ async def get_stock_data(
     """
     Obtiene datos en tiempo real de acciones desde Yahoo Finance.
     Recibe una lista de tickers y retorna precios, nombres y métricas.
+    Con 'fields' (opcional) se devuelven sólo esos campos; si sólo se piden
+    precios no se consultan los fundamentales.
     """
     tickers = stock_data.get("tickers", [])
     if not tickers:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tickers list is required")
     
+    fields = stock_data.get("fields")
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(field, str) for field in fields)):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="fields debe ser una lista de nombres de campo")
+    try:
+        YahooFinanceService.resolve_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
     try:
-        import yfinance as yf
-        
-        stock_info = []
-        for ticker in tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                info = stock.info
-                
-                # Obtener precio actual
-                current_price = info.get('currentPrice') or info.get('regularMarketPrice') or info.get('previousClose', 0)
-                
-                # Obtener cambio del día
-                previous_close = info.get('previousClose', current_price)
-                price_change = current_price - previous_close
-                price_change_percent = (price_change / previous_close * 100) if previous_close else 0
-                
-                stock_info.append({
-                    "ticker": ticker,
-                    "name": info.get('longName') or info.get('shortName') or ticker,
-                    "current_price": round(current_price, 2),
-                    "previous_close": round(previous_close, 2),
-                    "price_change": round(price_change, 2),
-                    "price_change_percent": round(price_change_percent, 2),
-                    "currency": info.get('currency', 'USD'),
-                    "market_cap": info.get('marketCap'),
-                    "volume": info.get('volume'),
-                    "pe_ratio": info.get('trailingPE'),
-                    "dividend_yield": info.get('dividendYield')
-                })
-            except Exception as e:
-                # Si falla un ticker específico, agregar datos de error
-                stock_info.append({
-                    "ticker": ticker,
-                    "name": ticker,
-                    "current_price": 0,
-                    "error": str(e)
-                })
-        
+        # Misma fuente (y misma cache) que los endpoints públicos de /stock-data
+        stock_info = await run_in_threadpool(YahooFinanceService.get_stock_data, tickers, fields)
         return {"stocks": stock_info}
     
-    except ImportError:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="yfinance library is not installed. Please install it with: pip install yfinance"
-        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,7 +1,13 @@
 from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from app.services.yahoo_finance_service import YahooFinanceService
+from app.services.quote_cache import quote_cache, fundamentals_cache
+from app.services.single_flight import upstream_flight
+from app.services.upstream_guard import upstream_guard
+from app.services.prewarmer import prewarmer
+from app.services.history_format import CHART_TYPES, HISTORY_FORMATS, MIN_CHART_POINTS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,10 +16,14 @@ router = APIRouter()
 
 class StockDataRequest(BaseModel):
     tickers: List[str]
+    fields: Optional[List[str]] = None
 
 class HistoricalDataRequest(BaseModel):
     ticker: str
     period: str = "1y"
+    format: str = "rows"
+    max_points: Optional[int] = None
+    chart: str = "line"
 
 @router.post("/stock-data")
 async def get_stock_data(request: StockDataRequest):
@@ -22,6 +32,8 @@ async def get_stock_data(request: StockDataRequest):
     
     Request body:
         tickers: Lista de símbolos de acciones (ej: ["AAPL", "GOOGL", "MSFT"])
+        fields: Campos a devolver (opcional, ej: ["current_price", "price_change_percent"]).
+            Si sólo se piden precios no se consultan los fundamentales.
     
     Returns:
         stocks: Lista con información detallada de cada acción
@@ -34,9 +46,14 @@ async def get_stock_data(request: StockDataRequest):
         if len(request.tickers) > 50:
             raise HTTPException(status_code=400, detail="Máximo 50 tickers por solicitud")
         
+        try:
+            YahooFinanceService.resolve_fields(request.fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         logger.info(f"Obteniendo datos para {len(request.tickers)} tickers: {request.tickers}")
         
-        stocks_data = YahooFinanceService.get_stock_data(request.tickers)
+        stocks_data = await run_in_threadpool(YahooFinanceService.get_stock_data, request.tickers, request.fields)
         
         return {
             "success": True,
@@ -58,6 +75,10 @@ async def get_historical_data(request: HistoricalDataRequest):
     Request body:
         ticker: Símbolo de la acción
         period: Período ('1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max')
+        format: 'rows' (lista de barras, por defecto) o 'columns' ({"date": [...], "close": [...], ...})
+        max_points: Cantidad máxima de puntos (opcional); la serie se reduce en el servidor
+        chart: 'line' (conserva mínimos y máximos del cierre, por defecto) o
+            'candles' (velas semanales/mensuales/trimestrales/anuales según haga falta)
     
     Returns:
         Datos históricos de la acción
@@ -66,9 +87,25 @@ async def get_historical_data(request: HistoricalDataRequest):
         if not request.ticker:
             raise HTTPException(status_code=400, detail="El ticker es requerido")
         
+        if request.format not in HISTORY_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Formato inválido. Opciones: {', '.join(HISTORY_FORMATS)}")
+        
+        if request.chart not in CHART_TYPES:
+            raise HTTPException(status_code=400, detail=f"Tipo de gráfico inválido. Opciones: {', '.join(CHART_TYPES)}")
+        
+        if request.max_points is not None and request.max_points < MIN_CHART_POINTS:
+            raise HTTPException(status_code=400, detail=f"max_points debe ser al menos {MIN_CHART_POINTS}")
+        
         logger.info(f"Obteniendo datos históricos para {request.ticker} con período {request.period}")
         
-        historical_data = YahooFinanceService.get_historical_data(request.ticker, request.period)
+        historical_data = await run_in_threadpool(
+            YahooFinanceService.get_historical_data,
+            request.ticker,
+            request.period,
+            request.format,
+            request.max_points,
+            request.chart,
+        )
         
         if "error" in historical_data:
             raise HTTPException(status_code=404, detail=historical_data["error"])
@@ -84,28 +121,70 @@ async def get_historical_data(request: HistoricalDataRequest):
         logger.error(f"Error en get_historical_data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al obtener datos históricos: {str(e)}")
 
+@router.get("/stock-data/cache/stats")
+async def get_quote_cache_stats():
+    """
+    Devuelve los contadores de la cache de cotizaciones y de la coalescencia de llamadas a Yahoo
+    
+    Returns:
+        cache: Aciertos, fallos, refrescos en segundo plano y tamaño actual de la cache de precios
+        fundamentals_cache: Lo mismo para la cache de fundamentales
+        single_flight: Llamadas ejecutadas y solicitudes que compartieron una llamada en curso
+        upstream: Estado del circuit breaker, límite de concurrencia actual y llamadas limitadas
+    """
+    return {
+        "success": True,
+        "cache": quote_cache.stats(),
+        "fundamentals_cache": fundamentals_cache.stats(),
+        "single_flight": upstream_flight.stats(),
+        "upstream": upstream_guard.stats()
+    }
+
+@router.get("/market-data/prewarm/status")
+async def get_prewarm_status():
+    """
+    Devuelve el estado del precalentador de datos de mercado
+    
+    Returns:
+        running, intervalo configurado, última ronda y, por ticker, la fecha de la
+        última actualización de cotización y de barras diarias
+    """
+    return {
+        "success": True,
+        **prewarmer.status()
+    }
+
 @router.get("/stock-data/{ticker}")
-async def get_single_stock_data(ticker: str):
+async def get_single_stock_data(ticker: str, fields: Optional[str] = None):
     """
     Obtiene datos actuales de una sola acción
     
     Path parameter:
         ticker: Símbolo de la acción
     
+    Query parameter:
+        fields: Campos a devolver separados por comas (opcional, ej: current_price,price_change_percent)
+    
     Returns:
         Información detallada de la acción
     """
     try:
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        try:
+            YahooFinanceService.resolve_fields(field_list)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         logger.info(f"Obteniendo datos para ticker individual: {ticker}")
         
-        stocks_data = YahooFinanceService.get_stock_data([ticker])
+        stocks_data = await run_in_threadpool(YahooFinanceService.get_stock_data, [ticker], field_list)
         
         if not stocks_data:
             raise HTTPException(status_code=404, detail=f"No se encontraron datos para {ticker}")
         
         stock = stocks_data[0]
         
-        if "error" in stock and stock["current_price"] == 0:
+        if "error" in stock and not stock.get("current_price"):
             raise HTTPException(status_code=404, detail=stock["error"])
         
         return {
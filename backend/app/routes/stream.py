@@ -0,0 +1,115 @@
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import logging
+
+from app.services.quote_stream import quote_hub, QUOTE_STREAM_MAX_TICKERS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Segundos sin mensajes tras los que se envía un comentario SSE para mantener viva la conexión
+SSE_KEEPALIVE_SECONDS = 15
+
+
+@router.websocket("/stream/quotes")
+async def stream_quotes_ws(websocket: WebSocket):
+    """
+    Stream de cotizaciones por WebSocket
+
+    Query params:
+        tickers: Lista inicial separada por comas (opcional)
+
+    Mensajes del cliente:
+        {"action": "subscribe", "tickers": ["AAPL", ...]}
+        {"action": "unsubscribe", "tickers": ["AAPL", ...]}
+
+    Mensajes del servidor:
+        {"type": "quotes", "quotes": [{"ticker": "AAPL", <sólo los campos que cambiaron; null si se quitaron>}, ...]}
+        {"type": "error", "detail": "..."}
+    """
+    await websocket.accept()
+    initial = [t for t in websocket.query_params.get("tickers", "").split(",") if t]
+    if len(initial) > QUOTE_STREAM_MAX_TICKERS:
+        await websocket.close(code=1008, reason=f"Máximo {QUOTE_STREAM_MAX_TICKERS} tickers por suscripción")
+        return
+    subscription = quote_hub.subscribe(initial)
+
+    async def sender():
+        while True:
+            message = await subscription.queue.get()
+            await websocket.send_json(message)
+
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            data = await websocket.receive_json()
+            action = data.get("action")
+            tickers = data.get("tickers") or []
+            try:
+                if action == "subscribe":
+                    quote_hub.update(subscription, add=tickers)
+                elif action == "unsubscribe":
+                    quote_hub.update(subscription, remove=tickers)
+                else:
+                    await websocket.send_json({"type": "error", "detail": f"Acción desconocida: {action}"})
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error en el stream de cotizaciones: {str(e)}")
+    finally:
+        send_task.cancel()
+        quote_hub.unsubscribe(subscription)
+
+
+@router.get("/stream/quotes/sse")
+async def stream_quotes_sse(request: Request, tickers: str):
+    """
+    Stream de cotizaciones por Server-Sent Events
+
+    Query params:
+        tickers: Tickers separados por comas (ej: AAPL,MSFT,GLD)
+
+    Returns:
+        Eventos "quotes" con el mismo formato que el WebSocket: el primero trae las
+        cotizaciones completas y los siguientes sólo los campos que cambiaron (null
+        si el campo se quitó)
+    """
+    symbols = [t for t in tickers.split(",") if t.strip()]
+    if not symbols:
+        raise HTTPException(status_code=400, detail="La lista de tickers no puede estar vacía")
+    if len(symbols) > QUOTE_STREAM_MAX_TICKERS:
+        raise HTTPException(status_code=400, detail=f"Máximo {QUOTE_STREAM_MAX_TICKERS} tickers por suscripción")
+
+    subscription = quote_hub.subscribe(symbols)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscription.queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: quotes\ndata: {json.dumps(message)}\n\n"
+        finally:
+            quote_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stream/stats")
+async def stream_stats():
+    """Suscriptores activos, refrescos compartidos y mensajes enviados por el stream"""
+    return {
+        "success": True,
+        **quote_hub.stats()
+    }
@@ -0,0 +1,276 @@
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.frontier_table import RISK_FREE_RATE
+from app.services.return_matrix import BATCH_MIN_HISTORY, RETURNS_LOOKBACK, TRADING_DAYS, ReturnMatrixCache, return_matrix_cache
+from app.services.risk_metrics import portfolio_weights
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Costo de transacción por defecto, en puntos básicos sobre el monto operado
+BACKTEST_COST_BPS = float(os.getenv("BACKTEST_COST_BPS", "10"))
+# Desvío absoluto de peso (0-1) que dispara el rebalanceo por umbral
+BACKTEST_THRESHOLD = float(os.getenv("BACKTEST_THRESHOLD", "0.05"))
+# Días que se evalúan juntos al buscar el próximo rebalanceo (la simulación avanza de a tramos, no de a días)
+BACKTEST_WINDOW_DAYS = 63
+# Portafolios por bloque en el modo masivo (acota el arreglo portafolios x días x activos)
+BACKTEST_CHUNK_PORTFOLIOS = 256
+
+# Políticas de rebalanceo
+REBALANCE_MODES = ("none", "monthly", "threshold")
+# Límites de los parámetros de las rutas de backtest
+BACKTEST_MAX_COST_BPS = 500
+BACKTEST_MAX_CURVE_POINTS = 1000
+
+
+def month_starts(dates: np.ndarray) -> np.ndarray:
+    """
+    Días de rebalanceo mensual: el primer cierre de cada mes
+
+    Args:
+        dates: Fechas de los retornos (la del cierre final de cada día)
+
+    Returns:
+        Máscara de largo len(dates) + 1 alineada con la curva de valor (índice 0 = inicio)
+    """
+    months = dates.astype("datetime64[M]")
+    mask = np.zeros(len(dates) + 1, dtype=bool)
+    mask[2:] = months[1:] != months[:-1]
+    return mask
+
+
+def simulate_rebalancing(
+    returns: np.ndarray,
+    weights: np.ndarray,
+    rebalance: str = "none",
+    threshold: float = BACKTEST_THRESHOLD,
+    cost: float = BACKTEST_COST_BPS / 10000,
+    calendar: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Curvas de valor de muchos portafolios con rebalanceo y costos, sin recorrer día por día
+
+    Cada portafolio avanza desde su último rebalanceo: para los próximos
+    BACKTEST_WINDOW_DAYS días se calculan de una vez (portafolios x días x activos)
+    las tenencias derivadas, el valor y la deriva, y se ubica el primer día que
+    dispara la regla. Las iteraciones son una por tramo o por rebalanceo, no por día.
+
+    Args:
+        returns: Retornos diarios de los activos (días x activos)
+        weights: Pesos objetivo (portafolios x activos, filas que suman 1)
+        rebalance: 'none' (comprar y mantener), 'monthly' o 'threshold'
+        threshold: Desvío absoluto de peso que dispara el rebalanceo por umbral
+        cost: Costo por unidad de monto operado (la compra inicial también paga)
+        calendar: Máscara (días + 1) de rebalanceo periódico para 'monthly'
+
+    Returns:
+        values (días + 1 x portafolios, valor inicial 1), rebalances, turnover
+        (suma de la mitad del monto operado en cada rebalanceo) y costs (valor
+        pagado en costos, en unidades del capital inicial)
+    """
+    days, _ = returns.shape
+    count = len(weights)
+    log_growth = np.vstack([np.zeros(returns.shape[1]), np.cumsum(np.log1p(returns), axis=0)])
+
+    holdings = weights * (1.0 - cost)
+    values = np.empty((days + 1, count))
+    values[0] = holdings.sum(axis=1)
+    anchor = np.zeros(count, dtype=int)
+    rebalances = np.zeros(count, dtype=int)
+    turnover = np.zeros(count)
+    costs = np.full(count, cost)
+    offsets = np.arange(1, BACKTEST_WINDOW_DAYS + 1)
+
+    while True:
+        active = np.flatnonzero(anchor < days)
+        if len(active) == 0:
+            break
+        start = anchor[active]
+        window = start[:, None] + offsets
+        valid = window <= days
+        window = np.minimum(window, days)
+
+        growth = np.exp(log_growth[window] - log_growth[start][:, None, :])
+        held = holdings[active][:, None, :] * growth
+        total = held.sum(axis=2)
+
+        event = np.zeros_like(valid)
+        if rebalance == "monthly" and calendar is not None:
+            event |= calendar[window]
+        elif rebalance == "threshold":
+            drift = np.abs(held / total[..., None] - weights[active][:, None, :]).max(axis=2)
+            event |= drift >= threshold
+        event &= valid
+        triggered = event.any(axis=1)
+        # Hasta el primer rebalanceo del tramo, o hasta el final del tramo si no hubo
+        last = np.where(triggered, event.argmax(axis=1), valid.sum(axis=1) - 1)
+
+        filled = valid & (offsets[None, :] - 1 <= last[:, None])
+        values[window[filled], np.broadcast_to(active[:, None], window.shape)[filled]] = total[filled]
+
+        rows = np.arange(len(active))
+        end_held = held[rows, last]
+        end_total = total[rows, last]
+        traded = np.abs(end_held / end_total[:, None] - weights[active]).sum(axis=1)
+        fee = np.where(triggered, cost * traded, 0.0)
+        net_total = end_total * (1.0 - fee)
+        holdings[active] = np.where(triggered[:, None], weights[active] * net_total[:, None], end_held)
+        values[window[rows, last], active] = net_total
+
+        rebalances[active] += triggered
+        turnover[active] += np.where(triggered, traded / 2.0, 0.0)
+        costs[active] += end_total * fee
+        anchor[active] = window[rows, last]
+
+    return {"values": values, "rebalances": rebalances, "turnover": turnover, "costs": costs}
+
+
+def performance_summary(values: np.ndarray, risk_free: float = RISK_FREE_RATE) -> Dict[str, np.ndarray]:
+    """Retorno total, CAGR, volatilidad, Sharpe y máxima caída de curvas de valor (días + 1 x portafolios)"""
+    daily = values[1:] / values[:-1] - 1.0
+    years = len(daily) / TRADING_DAYS
+    total_return = values[-1] - 1.0
+    cagr = np.power(np.maximum(values[-1], 1e-12), 1.0 / years) - 1.0
+    volatility = daily.std(axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+    sharpe = np.divide(daily.mean(axis=0) * TRADING_DAYS - risk_free, volatility, out=np.zeros_like(volatility), where=volatility > 0)
+    peaks = np.maximum.accumulate(np.maximum(values, 1.0), axis=0)
+    max_drawdown = (1.0 - values / peaks).max(axis=0)
+    return {
+        "total_return": total_return,
+        "cagr": cagr,
+        "volatility": volatility,
+        "sharpe_ratio": sharpe,
+        "max_drawdown": max_drawdown,
+    }
+
+
+class BacktestEngine:
+    """
+    Backtest histórico de portafolios guardados (o de asignaciones cualesquiera)
+    sobre los cierres diarios cacheados, con rebalanceo y costos de transacción.
+
+    Todos los portafolios de una corrida comparten la misma matriz de retornos
+    (la unión de sus activos en las fechas comunes) y se simulan por bloques en
+    una sola pasada. Con varios portafolios, los activos de historia corta (ver
+    BATCH_MIN_HISTORY) quedan fuera de la matriz como los que no tienen datos,
+    para que no acorten el período de todos.
+    """
+
+    def __init__(self, matrices: Optional[ReturnMatrixCache] = None, risk_free: float = RISK_FREE_RATE):
+        """
+        Args:
+            matrices: Cache de matrices de retornos (por defecto la compartida)
+            risk_free: Tasa libre de riesgo anual del Sharpe
+        """
+        self.matrices = matrices or return_matrix_cache
+        self.risk_free = risk_free
+
+    def run(
+        self,
+        portfolios: List[Dict[str, Any]],
+        rebalance: str = "monthly",
+        threshold: float = BACKTEST_THRESHOLD,
+        cost_bps: float = BACKTEST_COST_BPS,
+        lookback: str = RETURNS_LOOKBACK,
+        curve_points: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Backtest de varios portafolios sobre la misma matriz de precios
+
+        Args:
+            portfolios: Elementos con 'id' (o '_id') y 'assets' (ticker, allocation_pct)
+            rebalance: 'none', 'monthly' o 'threshold'
+            threshold: Desvío absoluto de peso de la regla de umbral
+            cost_bps: Costo de transacción en puntos básicos del monto operado
+            lookback: Período de historia ('1y', '3y', '5y', 'max', ...)
+            curve_points: Puntos de la curva de valor a devolver por portafolio (0 = ninguna)
+
+        Returns:
+            Período, parámetros y por portafolio: cobertura (y activos excluidos),
+            retorno total, CAGR, volatilidad, Sharpe, máxima caída, rebalanceos,
+            rotación y costos
+
+        Raises:
+            ValueError: Si los parámetros son inválidos o no hay historial suficiente
+        """
+        if rebalance not in REBALANCE_MODES:
+            raise ValueError(f"Rebalanceo desconocido: {rebalance}. Opciones: {', '.join(REBALANCE_MODES)}")
+        if not portfolios:
+            raise ValueError("No hay portafolios para evaluar")
+
+        allocations = [portfolio_weights(p.get("assets")) for p in portfolios]
+        universe = sorted(set().union(*allocations))
+        matrix = self.matrices.get(universe, lookback, BATCH_MIN_HISTORY if len(portfolios) > 1 else None)
+        columns = {ticker: col for col, ticker in enumerate(matrix.tickers)}
+
+        weights = np.zeros((len(portfolios), len(matrix.tickers)))
+        for row, allocation in enumerate(allocations):
+            for ticker, weight in allocation.items():
+                if ticker in columns:
+                    weights[row, columns[ticker]] += weight
+        coverage = weights.sum(axis=1)
+        priced = coverage > 0
+        weights[priced] /= coverage[priced, None]
+
+        calendar = month_starts(matrix.dates)
+        cost = cost_bps / 10000
+        days = matrix.observations
+        points = np.unique(np.linspace(0, days, min(curve_points, days + 1)).round().astype(int)) if curve_points else None
+        start_date = matrix.dates[0] - np.timedelta64(1, "D")
+
+        results = []
+        for first in range(0, len(portfolios), BACKTEST_CHUNK_PORTFOLIOS):
+            chunk = slice(first, first + BACKTEST_CHUNK_PORTFOLIOS)
+            simulated = simulate_rebalancing(matrix.returns, weights[chunk], rebalance, threshold, cost, calendar)
+            summary = performance_summary(simulated["values"], self.risk_free)
+            for offset, portfolio in enumerate(portfolios[chunk]):
+                row = first + offset
+                result = {
+                    "id": str(portfolio.get("id", portfolio.get("_id"))),
+                    "coverage": round(float(coverage[row]), 4),
+                    "excluded": sorted(ticker for ticker in allocations[row] if ticker not in columns),
+                    "rebalances": int(simulated["rebalances"][offset]),
+                    "turnover": round(float(simulated["turnover"][offset]), 4),
+                    "costs": round(float(simulated["costs"][offset]), 6),
+                }
+                for name, values in summary.items():
+                    result[name] = round(float(values[offset]), 6) if priced[row] else None
+                if points is not None and priced[row]:
+                    result["curve"] = [round(float(v), 6) for v in simulated["values"][points, offset]]
+                results.append(result)
+
+        logger.info(
+            f"Backtest ({rebalance}, {cost_bps:g} bps) de {len(portfolios)} portafolios: "
+            f"{len(matrix.tickers)} activos x {days} días"
+        )
+        response = {
+            "start": str(pd.Timestamp(start_date).date()),
+            "end": str(pd.Timestamp(matrix.dates[-1]).date()),
+            "lookback": lookback,
+            "observations": days,
+            "rebalance": rebalance,
+            "threshold": threshold if rebalance == "threshold" else None,
+            "cost_bps": cost_bps,
+            "tickers": matrix.tickers,
+            "results": results,
+        }
+        if points is not None:
+            # La fecha del punto 0 es el cierre anterior al primer retorno (aproximada como el día previo)
+            dates = np.concatenate([[start_date], matrix.dates])
+            response["curve_dates"] = [str(pd.Timestamp(d).date()) for d in dates[points]]
+        return response
+
+
+def run_backtest(portfolios: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Backtest con el motor compartido (función de módulo, para el pool de procesos)"""
+    return backtest_engine.run(portfolios, **options)
+
+
+# Motor compartido por las rutas de portafolio y de administración
+backtest_engine = BacktestEngine()
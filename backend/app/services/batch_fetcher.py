@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional
+from app.services.market_data_provider import MarketDataProvider, get_provider
+from app.services.single_flight import SingleFlight, upstream_flight
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchQuoteFetcher:
+    """
+    Motor de descarga por lotes: el historial de todos los tickers se pide en una
+    única descarga masiva y los metadatos de cada ticker se consultan en un pool
+    de hilos acotado, con un timeout por ticker.
+    """
+
+    def __init__(
+        self,
+        provider: Optional[MarketDataProvider] = None,
+        max_workers: int = 8,
+        info_timeout: float = 5.0,
+        total_timeout: float = 20.0,
+        history_period: str = "5d",
+        flight: Optional[SingleFlight] = None,
+    ):
+        """
+        Args:
+            provider: Proveedor de datos de mercado (por defecto el configurado por entorno);
+                en benchmarks se puede pasar uno falso local.
+            max_workers: Cantidad máxima de consultas de metadatos simultáneas
+            info_timeout: Segundos máximos por consulta de metadatos, medidos desde que arranca
+            total_timeout: Segundos máximos de espera para el lote completo
+            history_period: Período de historial usado para calcular el precio actual
+            flight: Coalescencia de llamadas idénticas en curso (por defecto la compartida)
+        """
+        self.provider = provider or get_provider()
+        self.max_workers = max_workers
+        self.info_timeout = info_timeout
+        self.total_timeout = total_timeout
+        self.history_period = history_period
+        self.flight = flight or upstream_flight
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="quote-info"
+                )
+            return self._executor
+
+    def fetch(
+        self,
+        tickers: List[str],
+        include_history: bool = True,
+        include_info: bool = True,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Obtiene historial y metadatos de un lote de tickers
+
+        Args:
+            tickers: Lista de símbolos de acciones (se ignoran duplicados)
+            include_history: Descargar el historial reciente (precios)
+            include_info: Consultar los metadatos (nombre, moneda, fundamentales), la llamada más lenta
+
+        Returns:
+            Diccionario ticker -> {"history": DataFrame o None, "info": dict o None,
+            "error": str o None, "timed_out": bool}. "error" indica que falló la
+            descarga de historial; los tickers cuya consulta de metadatos falla o
+            excede el timeout se devuelven igual, sólo con el historial.
+        """
+        unique = list(dict.fromkeys(tickers))
+        results: Dict[str, Dict[str, Any]] = {
+            ticker: {"history": None, "info": None, "error": None, "timed_out": False}
+            for ticker in unique
+        }
+        if not unique:
+            return results
+
+        # Los metadatos se lanzan primero para que corran en paralelo con la descarga masiva
+        started: Dict[str, float] = {}
+
+        def lookup(ticker: str) -> Dict[str, Any]:
+            started[ticker] = time.monotonic()
+            return self.flight.do((ticker, "info", None), lambda: self.provider.get_info(ticker))
+
+        futures = {}
+        batch_start = time.monotonic()
+        if include_info:
+            executor = self._get_executor()
+            futures = {executor.submit(lookup, ticker): ticker for ticker in unique}
+
+        histories = {}
+        if include_history:
+            try:
+                histories = self._download_history(unique)
+            except Exception as e:
+                logger.error(f"Error en la descarga masiva de historial: {str(e)}")
+                for ticker in unique:
+                    results[ticker]["error"] = f"Error: {str(e)}"
+
+        for ticker, history in histories.items():
+            if ticker in results:
+                results[ticker]["history"] = history
+
+        self._collect_info(futures, started, batch_start, results)
+        return results
+
+    def _download_history(self, tickers: List[str]) -> Dict[str, Any]:
+        """Descarga masiva de historial; los tickers que ya se están descargando se esperan"""
+        period = self.history_period
+
+        def load(keys):
+            histories = self.provider.download_history([key[0] for key in keys], period)
+            return {(ticker, "history", period): history for ticker, history in histories.items()}
+
+        loaded = self.flight.do_many([(ticker, "history", period) for ticker in tickers], load)
+        return {key[0]: history for key, history in loaded.items() if history is not None}
+
+    def _collect_info(
+        self,
+        futures: Dict[Any, str],
+        started: Dict[str, float],
+        batch_start: float,
+        results: Dict[str, Dict[str, Any]],
+    ) -> None:
+        """Espera las consultas de metadatos respetando el timeout por ticker y el total del lote"""
+        total_deadline = batch_start + self.total_timeout
+        pending = set(futures)
+
+        while pending:
+            done, pending = wait(pending, timeout=0, return_when=FIRST_COMPLETED)
+            for future in done:
+                ticker = futures[future]
+                try:
+                    results[ticker]["info"] = future.result()
+                except Exception as e:
+                    # Sin metadatos el ticker se devuelve igual, sólo con el historial
+                    logger.error(f"Error al obtener metadatos para {ticker}: {str(e)}")
+            if not pending:
+                break
+
+            now = time.monotonic()
+            expired = set()
+            for future in pending:
+                ticker = futures[future]
+                began = started.get(ticker)
+                if now >= total_deadline or (began is not None and now - began >= self.info_timeout):
+                    expired.add(future)
+
+            for future in expired:
+                # Un hilo ya en ejecución no puede interrumpirse; sólo se deja de esperar su resultado
+                future.cancel()
+                ticker = futures[future]
+                results[ticker]["timed_out"] = True
+                logger.warning(f"Timeout al obtener metadatos para {ticker}")
+            pending -= expired
+            if not pending:
+                break
+
+            # Dormir hasta el próximo vencimiento posible (o hasta que termine alguna consulta)
+            expiries = [total_deadline]
+            for future in pending:
+                began = started.get(futures[future])
+                expiries.append(began + self.info_timeout if began is not None else now + self.info_timeout)
+            timeout = max(0.0, min(expiries) - now)
+            wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
@@ -0,0 +1,207 @@
+import asyncio
+import multiprocessing
+import threading
+from functools import partial
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import SyncManager
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+import os
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Procesos de cálculo; 0 ejecuta en hilos del propio proceso (desarrollo, entornos sin multiprocessing)
+COMPUTE_POOL_WORKERS = int(os.getenv("COMPUTE_POOL_WORKERS", str(os.cpu_count() or 1)))
+# Tareas que pueden esperar turno además de las que se están ejecutando; más allá se responde 429
+COMPUTE_POOL_QUEUE_SIZE = int(os.getenv("COMPUTE_POOL_QUEUE_SIZE", "32"))
+# Segundos máximos que una solicitud espera el resultado de su tarea
+COMPUTE_TASK_TIMEOUT = float(os.getenv("COMPUTE_TASK_TIMEOUT", "30"))
+
+
+class ComputePoolSaturated(Exception):
+    """El pool tiene todas sus plazas ocupadas; el cliente debe reintentar más tarde"""
+
+
+class ComputeTimeout(Exception):
+    """La tarea no terminó dentro del tiempo máximo"""
+
+
+def _init_worker() -> None:
+    """
+    Inicialización de cada proceso de cálculo
+
+    Los procesos sólo leen los precios que el proceso principal mantiene al día
+    en disco: así no consultan a Yahoo por su cuenta, fuera del control de
+    límites y del circuito del proceso principal.
+    """
+    from app.services.price_store import price_store
+
+    price_store.offline = True
+
+
+class ComputePool:
+    """
+    Pool de procesos para el trabajo de CPU (optimización, simulaciones) de los
+    handlers async, que de otro modo bloquearía el event loop del worker.
+
+    La cantidad de tareas admitidas (en ejecución + en espera) está acotada: si
+    no hay plaza se rechaza de inmediato con ComputePoolSaturated en lugar de
+    encolar sin límite. Cada tarea tiene un tiempo máximo de espera.
+    """
+
+    def __init__(
+        self,
+        workers: int = COMPUTE_POOL_WORKERS,
+        queue_size: int = COMPUTE_POOL_QUEUE_SIZE,
+        timeout: float = COMPUTE_TASK_TIMEOUT,
+    ):
+        """
+        Args:
+            workers: Procesos de cálculo (0 para usar hilos del propio proceso)
+            queue_size: Tareas que pueden esperar turno además de las que se ejecutan
+            timeout: Segundos máximos por tarea (por defecto para `run`)
+        """
+        self.workers = workers
+        self.capacity = max(workers, 1) + queue_size
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+        self._manager: Optional[SyncManager] = None
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0, "timeouts": 0, "restarts": 0}
+
+    def start(self) -> None:
+        """Crea el pool (idempotente); los procesos se lanzan a medida que llegan tareas"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            if self.workers > 0:
+                # 'spawn': los procesos no heredan los hilos ni los sockets del servidor
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="compute")
+            logger.info(f"Pool de cálculo iniciado: {self.workers or 'hilos'} workers, {self.capacity} plazas")
+
+    def stop(self) -> None:
+        """Detiene el pool cancelando las tareas que todavía no empezaron"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            manager, self._manager = self._manager, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.info("Pool de cálculo detenido")
+        if manager is not None:
+            manager.shutdown()
+
+    def manager(self) -> SyncManager:
+        """
+        Manager de multiprocessing para los objetos que comparten una tarea y
+        quien la espera (avance, cancelación, colas de resultados parciales).
+        Se lanza con el primer uso y bloquea mientras arranca: llamarlo fuera
+        del event loop.
+        """
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context("spawn").Manager()
+            return self._manager
+
+    def _restart(self, broken: Executor) -> None:
+        """Reemplaza un pool roto (un proceso murió) por uno nuevo"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self._counters["restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        logger.error("Un proceso de cálculo terminó inesperadamente, se reinicia el pool")
+        self.start()
+
+    def _done(self, executor: Executor, future: Future) -> None:
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                self._counters["cancelled"] += 1
+            else:
+                self._counters["failed" if error is not None else "completed"] += 1
+        self._slots.release()
+        if isinstance(error, BrokenProcessPool):
+            self._restart(executor)
+
+    def _submit(self, fn: Callable[..., Any], args: tuple):
+        self.start()
+        executor = self._executor
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            executor = self._executor
+            return executor, executor.submit(fn, *args)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """
+        Encola fn(*args) y devuelve el future sin esperarlo (para quien controla
+        la espera por su cuenta, como los trabajos en segundo plano)
+
+        Raises:
+            ComputePoolSaturated: Si no hay plazas libres
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise ComputePoolSaturated(f"Pool de cálculo saturado ({self.capacity} tareas en curso)")
+
+        try:
+            executor, future = self._submit(fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending += 1
+            self._counters["submitted"] += 1
+        future.add_done_callback(partial(self._done, executor))
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta fn(*args) en el pool y espera el resultado sin bloquear el event loop
+
+        La función y sus argumentos deben poder serializarse (funciones de módulo).
+        Una tarea que vence sigue ocupando su plaza hasta que termina: el proceso
+        no se puede interrumpir a mitad de cálculo.
+
+        Raises:
+            ComputePoolSaturated: Si no hay plazas libres
+            ComputeTimeout: Si la tarea no terminó a tiempo
+        """
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._counters["timeouts"] += 1
+            raise ComputeTimeout(f"La tarea {getattr(fn, '__name__', fn)} superó {timeout or self.timeout:g} s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Plazas ocupadas y contadores del pool"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "pending": self._pending,
+                "running": self._executor is not None,
+                **self._counters,
+            }
+
+
+# Pool compartido por las rutas; se inicia y se detiene con la aplicación
+compute_pool = ComputePool()
@@ -0,0 +1,411 @@
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.price_store import PriceStore, price_store
+from app.services.return_matrix import MIN_OBSERVATIONS, TRADING_DAYS, align_closes
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+COVARIANCE_STORE_DIR = os.getenv("COVARIANCE_STORE_DIR")
+# Estimador por defecto y ventana de observaciones diarias (756 ≈ 3 años)
+COVARIANCE_ESTIMATOR = os.getenv("COVARIANCE_ESTIMATOR", "shrinkage")
+COVARIANCE_WINDOW = int(os.getenv("COVARIANCE_WINDOW", "756"))
+# Vida media en días del estimador EWMA
+COVARIANCE_EWMA_HALFLIFE = float(os.getenv("COVARIANCE_EWMA_HALFLIFE", "63"))
+# Segundos mínimos entre dos búsquedas de barras nuevas para la misma estimación
+COVARIANCE_REFRESH_INTERVAL = float(os.getenv("COVARIANCE_REFRESH_INTERVAL", os.getenv("PRICE_STORE_SYNC_INTERVAL", "900")))
+
+ESTIMATORS = ("sample", "ewma", "shrinkage")
+
+
+class CovarianceEstimate:
+    """Media y covarianza anualizadas listas para el optimizador"""
+
+    def __init__(
+        self,
+        tickers: List[str],
+        mean: np.ndarray,
+        cov: np.ndarray,
+        observations: int,
+        as_of: np.datetime64,
+        estimator: str,
+        shrinkage: Optional[float] = None,
+    ):
+        self.tickers = tickers
+        self.mean = mean
+        self.cov = cov
+        self.observations = observations
+        self.as_of = as_of
+        self.estimator = estimator
+        self.shrinkage = shrinkage
+
+
+class RollingMoments:
+    """
+    Momentos de una ventana móvil de retornos: sumas de x, de x·xᵀ y de
+    (x∘x)·(x∘x)ᵀ. Agregar un día y quitar el más viejo cuesta O(n²); de aquí
+    salen la covarianza muestral y la de Ledoit-Wolf.
+    """
+
+    def __init__(self, window: int, n: int):
+        self.window = window
+        self.ring = np.zeros((window, n))
+        self.count = 0
+        self.position = 0
+        self.sum = np.zeros(n)
+        self.sum_outer = np.zeros((n, n))
+        self.sum_fourth = np.zeros((n, n))
+
+    def add(self, returns: np.ndarray) -> None:
+        if self.count == self.window:
+            old = self.ring[self.position]
+            self.sum -= old
+            self.sum_outer -= np.outer(old, old)
+            squared = old * old
+            self.sum_fourth -= np.outer(squared, squared)
+        else:
+            self.count += 1
+        self.ring[self.position] = returns
+        self.position = (self.position + 1) % self.window
+        self.sum += returns
+        self.sum_outer += np.outer(returns, returns)
+        squared = returns * returns
+        self.sum_fourth += np.outer(squared, squared)
+
+    def mean(self) -> np.ndarray:
+        return self.sum / self.count
+
+    def sample_cov(self) -> np.ndarray:
+        mean = self.mean()
+        return (self.sum_outer - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+    def shrunk_cov(self) -> Tuple[np.ndarray, float]:
+        """
+        Ledoit-Wolf hacia una identidad escalada: (1 − δ)·S + δ·(tr(S)/n)·I
+
+        La varianza de los productos cruzados se estima con los momentos sin
+        centrar (la media diaria es despreciable frente a la dispersión).
+        """
+        t = self.count
+        sample = self.sample_cov()
+        second = self.sum_outer / t
+        target = np.trace(sample) / len(sample)
+        dispersion = float(np.sum((sample - target * np.eye(len(sample))) ** 2))
+        noise = float(np.sum(self.sum_fourth) / t - np.sum(second ** 2))
+        shrinkage = 0.0 if dispersion <= 0 else float(np.clip(noise / (t * dispersion), 0.0, 1.0))
+        shrunk = (1.0 - shrinkage) * sample
+        shrunk[np.diag_indices_from(shrunk)] += shrinkage * target
+        return shrunk, shrinkage
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "ring": self.ring, "count": np.array(self.count), "position": np.array(self.position),
+            "sum": self.sum, "sum_outer": self.sum_outer, "sum_fourth": self.sum_fourth,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "RollingMoments":
+        moments = cls(*arrays["ring"].shape)
+        moments.ring = arrays["ring"].copy()
+        moments.count = int(arrays["count"])
+        moments.position = int(arrays["position"])
+        moments.sum = arrays["sum"].copy()
+        moments.sum_outer = arrays["sum_outer"].copy()
+        moments.sum_fourth = arrays["sum_fourth"].copy()
+        return moments
+
+
+class EwmaMoments:
+    """Media y covarianza con ponderación exponencial (RiskMetrics); cada día nuevo cuesta O(n²)"""
+
+    def __init__(self, n: int, halflife: float):
+        self.decay = 0.5 ** (1.0 / halflife)
+        self.count = 0
+        self.avg = np.zeros(n)
+        self.cov = np.zeros((n, n))
+
+    def add(self, returns: np.ndarray) -> None:
+        if self.count == 0:
+            self.avg = returns.copy()
+        else:
+            deviation = returns - self.avg
+            self.avg = self.avg + (1.0 - self.decay) * deviation
+            self.cov = self.decay * (self.cov + (1.0 - self.decay) * np.outer(deviation, deviation))
+        self.count += 1
+
+    def mean(self) -> np.ndarray:
+        return self.avg
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"decay": np.array(self.decay), "count": np.array(self.count), "avg": self.avg, "cov": self.cov}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "EwmaMoments":
+        moments = cls(len(arrays["avg"]), 1.0)
+        moments.decay = float(arrays["decay"])
+        moments.count = int(arrays["count"])
+        moments.avg = arrays["avg"].copy()
+        moments.cov = arrays["cov"].copy()
+        return moments
+
+
+class _Entry:
+    """Estado de una estimación: tickers efectivos, último cierre usado y momentos acumulados"""
+
+    def __init__(self, tickers: List[str], last_date: np.datetime64, last_close: np.ndarray, moments: Any):
+        self.tickers = tickers
+        self.last_date = last_date
+        self.last_close = last_close
+        self.moments = moments
+        # Días agregados incrementalmente desde la última reconstrucción completa
+        self.updates = 0
+        self.checked_at = time.monotonic()
+        self.estimate: Optional[CovarianceEstimate] = None
+
+
+class CovarianceService:
+    """
+    Estimaciones de media y covarianza por (universo, ventana, estimador), que
+    se actualizan con cada barra diaria nueva en O(n²) en lugar de recalcular
+    sobre toda la historia, y se guardan en disco para sobrevivir reinicios.
+
+    Estimadores: 'sample' (ventana móvil), 'ewma' (ponderación exponencial) y
+    'shrinkage' (Ledoit-Wolf sobre la ventana móvil).
+    """
+
+    def __init__(
+        self,
+        store: Optional[PriceStore] = None,
+        directory: Optional[str] = COVARIANCE_STORE_DIR,
+        refresh_interval: float = COVARIANCE_REFRESH_INTERVAL,
+        halflife: float = COVARIANCE_EWMA_HALFLIFE,
+    ):
+        """
+        Args:
+            store: Almacén de precios del que se leen los cierres (por defecto el compartido)
+            directory: Carpeta de los estados persistidos. Por defecto data/covariance, o
+                data/covariance_<proveedor> si el proveedor no es Yahoo
+            refresh_interval: Segundos mínimos entre dos búsquedas de barras nuevas por estimación
+            halflife: Vida media en días del estimador EWMA
+        """
+        self.store = store or price_store
+        if directory is None:
+            provider = self.store.provider.name
+            folder = "covariance" if provider == "yahoo" else f"covariance_{provider}"
+            directory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", folder)
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.halflife = halflife
+        self._entries: Dict[Tuple[Tuple[str, ...], int, str], _Entry] = {}
+        self._locks: Dict[Tuple[Tuple[str, ...], int, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def get(
+        self,
+        tickers: List[str],
+        window: int = COVARIANCE_WINDOW,
+        estimator: str = COVARIANCE_ESTIMATOR,
+    ) -> CovarianceEstimate:
+        """
+        Devuelve la estimación del universo, incorporando antes las barras nuevas si las hay
+
+        Args:
+            tickers: Universo (los tickers sin historial se omiten)
+            window: Observaciones diarias de la ventana (en EWMA, las usadas para arrancar)
+            estimator: 'sample', 'ewma' o 'shrinkage'
+
+        Raises:
+            ValueError: Estimador desconocido o historial insuficiente
+        """
+        if estimator not in ESTIMATORS:
+            raise ValueError(f"Estimador desconocido: {estimator}. Opciones: {', '.join(ESTIMATORS)}")
+        key = (tuple(tickers), window, estimator)
+        with self._lock(key):
+            entry = self._entries.get(key) or self._load(key)
+            if entry is None:
+                entry = self._rebuild(key)
+            elif time.monotonic() - entry.checked_at >= self.refresh_interval or entry.estimate is None:
+                entry = self._update(key, entry)
+            self._entries[key] = entry
+            if entry.estimate is None:
+                entry.estimate = self._estimate(entry, estimator)
+            return entry.estimate
+
+    def refresh_all(self) -> None:
+        """Incorpora las barras nuevas en todas las estimaciones conocidas (lo llama el precalentador)"""
+        for key in list(self._entries):
+            try:
+                with self._lock(key):
+                    entry = self._update(key, self._entries[key])
+                    entry.estimate = self._estimate(entry, key[2])
+                    self._entries[key] = entry
+            except Exception as e:
+                logger.error(f"Error al actualizar la covarianza de {len(key[0])} activos ({key[2]}): {str(e)}")
+
+    def _lock(self, key) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _closes(self, tickers: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        series = {}
+        for ticker in tickers:
+            try:
+                bars = self.store.get(ticker, "max")
+            except Exception as e:
+                logger.error(f"Error al leer precios de {ticker} para la covarianza: {str(e)}")
+                continue
+            if len(bars) > 1:
+                series[ticker] = bars
+        if len(series) < 2:
+            raise ValueError("Se necesitan al menos dos activos con historial para estimar la covarianza")
+        dates, closes = align_closes(series)
+        return list(series), dates, closes
+
+    def _new_moments(self, estimator: str, window: int, n: int):
+        if estimator == "ewma":
+            return EwmaMoments(n, self.halflife)
+        return RollingMoments(window, n)
+
+    def _rebuild(self, key) -> _Entry:
+        """Recalcula la estimación completa desde los cierres guardados"""
+        universe, window, estimator = key
+        tickers, dates, closes = self._closes(list(universe))
+        closes = closes[-(window + 1):]
+        dates = dates[-(window + 1):]
+        if len(closes) <= MIN_OBSERVATIONS:
+            raise ValueError(f"Sólo hay {max(len(closes) - 1, 0)} retornos diarios en común (mínimo {MIN_OBSERVATIONS})")
+
+        moments = self._new_moments(estimator, window, len(tickers))
+        for returns in closes[1:] / closes[:-1] - 1.0:
+            moments.add(returns)
+        entry = _Entry(tickers, dates[-1], closes[-1], moments)
+        self._save(key, entry)
+        logger.info(f"Covarianza {estimator} reconstruida: {len(tickers)} activos x {moments.count} días")
+        return entry
+
+    def _update(self, key, entry: _Entry) -> _Entry:
+        """Agrega los retornos de las barras posteriores a la última procesada (O(n²) por día)"""
+        tickers, dates, closes = self._closes(entry.tickers)
+        entry.checked_at = time.monotonic()
+        if tickers != entry.tickers:
+            return self._rebuild(key)
+
+        first_new = np.searchsorted(dates, entry.last_date, side="right")
+        if first_new == len(dates):
+            return entry
+        previous = np.searchsorted(dates, entry.last_date)
+        if previous >= len(dates) or dates[previous] != entry.last_date or not np.allclose(
+            closes[previous], entry.last_close, rtol=1e-4
+        ):
+            # La serie cambió hacia atrás (ajuste por dividendos/splits): no se puede seguir sumando
+            logger.info("Cierres reajustados en origen, se reconstruye la covarianza")
+            return self._rebuild(key)
+
+        window = key[1]
+        if entry.updates + len(dates) - first_new >= window:
+            # Cada `window` días se recalcula desde cero para no acumular error de redondeo
+            return self._rebuild(key)
+
+        block = closes[previous:]
+        for returns in block[1:] / block[:-1] - 1.0:
+            entry.moments.add(returns)
+        entry.updates += len(block) - 1
+        entry.last_date = dates[-1]
+        entry.last_close = closes[-1]
+        entry.estimate = None
+        self._save(key, entry)
+        return entry
+
+    def _estimate(self, entry: _Entry, estimator: str) -> CovarianceEstimate:
+        moments = entry.moments
+        shrinkage = None
+        if estimator == "ewma":
+            cov = moments.cov
+        elif estimator == "shrinkage":
+            cov, shrinkage = moments.shrunk_cov()
+        else:
+            cov = moments.sample_cov()
+        return CovarianceEstimate(
+            tickers=entry.tickers,
+            mean=moments.mean() * TRADING_DAYS,
+            cov=cov * TRADING_DAYS,
+            observations=moments.count,
+            as_of=entry.last_date,
+            estimator=estimator,
+            shrinkage=shrinkage,
+        )
+
+    def _path(self, key) -> str:
+        universe, window, estimator = key
+        digest = hashlib.sha1(",".join(universe).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{estimator}_{window}_{digest}.npz")
+
+    def _save(self, key, entry: _Entry) -> None:
+        """Guarda el estado de forma atómica (archivo temporal + rename)"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp,
+                universe=np.array(key[0]),
+                tickers=np.array(entry.tickers),
+                last_date=np.array(entry.last_date),
+                last_close=entry.last_close,
+                updates=np.array(entry.updates),
+                **entry.moments.to_arrays(),
+            )
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"No se pudo guardar la covarianza en disco: {str(e)}")
+
+    def _load(self, key) -> Optional[_Entry]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            if tuple(arrays["universe"].tolist()) != key[0]:
+                return None
+            moments_cls = EwmaMoments if key[2] == "ewma" else RollingMoments
+            entry = _Entry(
+                arrays["tickers"].tolist(),
+                arrays["last_date"][()],
+                arrays["last_close"],
+                moments_cls.from_arrays(arrays),
+            )
+            entry.updates = int(arrays["updates"])
+            # Forzar la búsqueda de barras nuevas al primer uso tras el reinicio
+            entry.checked_at = float("-inf")
+            return entry
+        except Exception as e:
+            logger.error(f"No se pudo leer la covarianza guardada ({path}): {str(e)}")
+            return None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Estimaciones en memoria: universo, estimador, observaciones y fecha de la última barra"""
+        return [
+            {
+                "tickers": entry.tickers,
+                "window": key[1],
+                "estimator": key[2],
+                "observations": entry.moments.count,
+                "as_of": str(pd.Timestamp(entry.last_date).date()),
+                "incremental_updates": entry.updates,
+            }
+            for key, entry in list(self._entries.items())
+        ]
+
+
+# Servicio compartido por el optimizador y el precalentador
+covariance_service = CovarianceService()
@@ -0,0 +1,358 @@
+import hashlib
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.covariance_estimator import COVARIANCE_ESTIMATOR, CovarianceService, covariance_service
+from app.services.mean_variance import MeanVarianceOptimizer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Peso máximo por activo en los portafolios optimizados (0-1)
+OPTIMIZER_MAX_WEIGHT = float(os.getenv("OPTIMIZER_MAX_WEIGHT", "0.35"))
+# Tasa libre de riesgo anual usada en el ratio de Sharpe
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.04"))
+FRONTIER_STORE_DIR = os.getenv("FRONTIER_STORE_DIR")
+# Puntos de la grilla de volatilidades objetivo, del mínimo al máximo alcanzable
+FRONTIER_GRID_POINTS = int(os.getenv("FRONTIER_GRID_POINTS", "201"))
+
+
+class FrontierTable:
+    """
+    Frontera eficiente precalculada: una grilla uniforme de volatilidades con sus
+    pesos, retorno esperado y Sharpe, más el portafolio de máximo Sharpe. Una
+    consulta por volatilidad es un índice directo más una interpolación lineal
+    entre los dos puntos vecinos.
+    """
+
+    def __init__(
+        self,
+        tickers: List[str],
+        volatility: np.ndarray,
+        weights: np.ndarray,
+        tangent_weights: np.ndarray,
+        mean: np.ndarray,
+        cov: np.ndarray,
+        risk_free: float,
+        estimator: str,
+        as_of: np.datetime64,
+        observations: int,
+    ):
+        """
+        Args:
+            tickers: Activos en el orden de las columnas de `weights`
+            volatility: Volatilidades de la grilla (uniforme y creciente)
+            weights: Pesos de cada punto de la grilla (puntos x activos)
+            tangent_weights: Pesos del portafolio de máximo Sharpe
+            mean: Retornos esperados anualizados usados para construirla
+            cov: Covarianza anualizada usada para construirla
+            risk_free: Tasa libre de riesgo del Sharpe
+            estimator: Estimador de covarianza de origen
+            as_of: Fecha de la última barra de la estimación de origen
+            observations: Observaciones diarias de la estimación de origen
+        """
+        self.tickers = tickers
+        self.volatility = volatility
+        self.weights = weights
+        self.tangent_weights = tangent_weights
+        self.mean = mean
+        self.cov = cov
+        self.risk_free = risk_free
+        self.estimator = estimator
+        self.as_of = as_of
+        self.observations = observations
+        self.expected_return = weights @ mean
+        self.sharpe = np.where(volatility > 0, (self.expected_return - risk_free) / np.where(volatility > 0, volatility, 1.0), 0.0)
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, optimizer: MeanVarianceOptimizer, tickers: List[str], points: int, **source: Any) -> "FrontierTable":
+        """Muestrea la frontera del optimizador en `points` volatilidades equiespaciadas"""
+        lowest = optimizer.min_variance()["volatility"]
+        highest = optimizer.max_return()["volatility"]
+        grid = np.linspace(lowest, highest, points) if highest > lowest else np.full(points, lowest)
+        weights = np.vstack([optimizer.target_risk(float(volatility))["weights"] for volatility in grid])
+        return cls(
+            tickers=tickers,
+            volatility=grid,
+            weights=weights,
+            tangent_weights=optimizer.max_sharpe()["weights"],
+            mean=optimizer.mean,
+            cov=optimizer.cov,
+            risk_free=optimizer.risk_free,
+            **source,
+        )
+
+    def _performance(self, weights: np.ndarray) -> Dict[str, Any]:
+        expected_return = float(self.mean @ weights)
+        volatility = float(np.sqrt(max(weights @ self.cov @ weights, 0.0)))
+        return {
+            "weights": weights,
+            "expected_return": expected_return,
+            "volatility": volatility,
+            "sharpe_ratio": float((expected_return - self.risk_free) / volatility) if volatility > 0 else 0.0,
+        }
+
+    def lookup(self, volatility: float) -> Dict[str, Any]:
+        """
+        Portafolio de la frontera para una volatilidad objetivo, por interpolación
+
+        Fuera del rango alcanzable se devuelve el extremo más cercano (mínima
+        varianza o máximo retorno).
+        """
+        last = len(self.volatility) - 1
+        step = (self.volatility[-1] - self.volatility[0]) / last if last else 0.0
+        position = (volatility - self.volatility[0]) / step if step > 0 else 0.0
+        position = min(max(position, 0.0), float(last))
+        index = min(int(position), last - 1) if last else 0
+        fraction = position - index
+        weights = self.weights[index] if not last else (1.0 - fraction) * self.weights[index] + fraction * self.weights[index + 1]
+        return self._performance(weights)
+
+    def min_variance(self) -> Dict[str, Any]:
+        return self._performance(self.weights[0])
+
+    def max_return(self) -> Dict[str, Any]:
+        return self._performance(self.weights[-1])
+
+    def max_sharpe(self) -> Dict[str, Any]:
+        return self._performance(self.tangent_weights)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "tickers": np.array(self.tickers),
+            "volatility": self.volatility,
+            "weights": self.weights,
+            "tangent_weights": self.tangent_weights,
+            "mean": self.mean,
+            "cov": self.cov,
+            "risk_free": np.array(self.risk_free),
+            "estimator": np.array(self.estimator),
+            "as_of": np.array(self.as_of),
+            "observations": np.array(self.observations),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "FrontierTable":
+        return cls(
+            tickers=arrays["tickers"].tolist(),
+            volatility=arrays["volatility"],
+            weights=arrays["weights"],
+            tangent_weights=arrays["tangent_weights"],
+            mean=arrays["mean"],
+            cov=arrays["cov"],
+            risk_free=float(arrays["risk_free"]),
+            estimator=str(arrays["estimator"]),
+            as_of=arrays["as_of"][()],
+            observations=int(arrays["observations"]),
+        )
+
+
+class FrontierService:
+    """
+    Mantiene una tabla de frontera por (universo, estimador) en memoria y en
+    disco. Las solicitudes sólo leen la última tabla guardada (si otro proceso
+    la reescribió en disco, se recarga); la reconstrucción cuando cambia la
+    estimación de origen la hace el precalentador con refresh_all. Sólo si no
+    hay ninguna tabla guardada se construye en la propia solicitud.
+    """
+
+    def __init__(
+        self,
+        covariance: Optional[CovarianceService] = None,
+        directory: Optional[str] = FRONTIER_STORE_DIR,
+        points: int = FRONTIER_GRID_POINTS,
+        max_weight: float = OPTIMIZER_MAX_WEIGHT,
+        risk_free: float = RISK_FREE_RATE,
+    ):
+        """
+        Args:
+            covariance: Servicio de estimaciones de covarianza (por defecto el compartido)
+            directory: Carpeta de las tablas persistidas. Por defecto data/frontier, o
+                data/frontier_<proveedor> si el proveedor no es Yahoo
+            points: Puntos de la grilla de volatilidades
+            max_weight: Peso máximo por activo
+            risk_free: Tasa libre de riesgo anual
+        """
+        self.covariance = covariance or covariance_service
+        if directory is None:
+            provider = self.covariance.store.provider.name
+            folder = "frontier" if provider == "yahoo" else f"frontier_{provider}"
+            directory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", folder)
+        self.directory = directory
+        self.points = points
+        self.max_weight = max_weight
+        self.risk_free = risk_free
+        self._tables: Dict[Tuple[Tuple[str, ...], str], FrontierTable] = {}
+        # Fecha de modificación del archivo del que salió cada tabla en memoria
+        self._mtimes: Dict[Tuple[Tuple[str, ...], str], Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "reloads": 0, "rebuilds": 0}
+
+    def get(self, tickers: List[str], estimator: Optional[str] = None) -> FrontierTable:
+        """
+        Última tabla guardada del universo, sin consultar la estimación de origen
+
+        Raises:
+            ValueError: Si no hay tabla guardada y no hay historial suficiente
+                para construirla, o el estimador no existe
+        """
+        estimator = estimator or COVARIANCE_ESTIMATOR
+        key = (tuple(tickers), estimator)
+        with self._lock:
+            self._counters["lookups"] += 1
+            table = self._stored(key)
+        if table is not None:
+            return table
+        # Ninguna tabla en memoria ni en disco: se construye una vez
+        return self.refresh(tickers, estimator)
+
+    def refresh(self, tickers: List[str], estimator: Optional[str] = None) -> FrontierTable:
+        """
+        Tabla vigente del universo; se reconstruye si la estimación de origen cambió
+
+        Raises:
+            ValueError: Si no hay historial suficiente o el estimador no existe
+        """
+        estimator = estimator or COVARIANCE_ESTIMATOR
+        key = (tuple(tickers), estimator)
+        estimate = self.covariance.get(tickers, estimator=estimator)
+        with self._lock:
+            table = self._stored(key)
+            if (
+                table is None
+                or table.as_of != estimate.as_of
+                or table.observations != estimate.observations
+                or table.tickers != estimate.tickers
+            ):
+                table = self._build(key, estimate)
+                self._tables[key] = table
+                self._mtimes[key] = self._mtime(key)
+            return table
+
+    def _stored(self, key) -> Optional[FrontierTable]:
+        """Tabla en memoria, recargada del disco si el archivo cambió desde que se leyó"""
+        table = self._tables.get(key)
+        mtime = self._mtime(key)
+        if mtime is None or (table is not None and mtime == self._mtimes.get(key)):
+            return table
+        loaded = self._load(key)
+        if loaded is None:
+            return table
+        if table is not None:
+            self._counters["reloads"] += 1
+        self._tables[key] = loaded
+        self._mtimes[key] = mtime
+        return loaded
+
+    def _mtime(self, key) -> Optional[int]:
+        try:
+            return os.stat(self._path(key)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _build(self, key, estimate) -> FrontierTable:
+        started = time.monotonic()
+        optimizer = MeanVarianceOptimizer(estimate.mean, estimate.cov, self.max_weight, self.risk_free)
+        table = FrontierTable.build(
+            optimizer,
+            estimate.tickers,
+            self.points,
+            estimator=estimate.estimator,
+            as_of=estimate.as_of,
+            observations=estimate.observations,
+        )
+        self._counters["rebuilds"] += 1
+        self._save(key, table)
+        logger.info(
+            f"Frontera {estimate.estimator} recalculada: {len(estimate.tickers)} activos, "
+            f"{self.points} puntos en {(time.monotonic() - started) * 1000:.1f} ms"
+        )
+        return table
+
+    def refresh_all(self) -> None:
+        """
+        Reconstruye las tablas cuyas estimaciones cambiaron (lo llama el
+        precalentador): las de memoria y las guardadas en disco por otros
+        procesos (las solicitudes de /optimize corren en el pool de cálculo)
+        """
+        with self._lock:
+            keys = set(self._tables) | self._saved_keys()
+        for tickers, estimator in keys:
+            try:
+                self.refresh(list(tickers), estimator)
+            except Exception as e:
+                logger.error(f"Error al actualizar la frontera ({estimator}): {str(e)}")
+
+    def _saved_keys(self) -> set:
+        """(universo, estimador) de las tablas guardadas en disco"""
+        keys = set()
+        if not os.path.isdir(self.directory):
+            return keys
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz") or ".tmp." in name:
+                continue
+            try:
+                with np.load(os.path.join(self.directory, name)) as data:
+                    keys.add((tuple(data["universe"].tolist()), str(data["estimator"])))
+            except Exception as e:
+                logger.error(f"No se pudo leer la frontera guardada ({name}): {str(e)}")
+        return keys
+
+    def _path(self, key) -> str:
+        universe, estimator = key
+        digest = hashlib.sha1(",".join(universe).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{estimator}_{digest}.npz")
+
+    def _save(self, key, table: FrontierTable) -> None:
+        """Guarda la tabla de forma atómica (archivo temporal + rename)"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp, universe=np.array(key[0]), **table.to_arrays())
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.error(f"No se pudo guardar la frontera en disco: {str(e)}")
+
+    def _load(self, key) -> Optional[FrontierTable]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+            if tuple(arrays["universe"].tolist()) != key[0] or len(arrays["volatility"]) != self.points:
+                return None
+            return FrontierTable.from_arrays(arrays)
+        except Exception as e:
+            logger.error(f"No se pudo leer la frontera guardada ({path}): {str(e)}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Tablas en memoria y contadores de consultas y reconstrucciones"""
+        with self._lock:
+            return {
+                **self._counters,
+                "tables": [
+                    {
+                        "tickers": table.tickers,
+                        "estimator": estimator,
+                        "points": len(table.volatility),
+                        "volatility_range": [round(float(table.volatility[0]), 4), round(float(table.volatility[-1]), 4)],
+                        "as_of": str(pd.Timestamp(table.as_of).date()),
+                    }
+                    for (_, estimator), table in self._tables.items()
+                ],
+            }
+
+
+# Frontera compartida por el optimizador y el precalentador
+frontier_service = FrontierService()
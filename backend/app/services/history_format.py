@@ -0,0 +1,255 @@
+import numpy as np
+import pandas as pd
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+# Una fila por día: fecha + OHLCV (es también el formato de los archivos del almacén de precios)
+BAR_DTYPE = np.dtype([
+    ("date", "datetime64[D]"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+    ("volume", "i8"),
+])
+
+# Campos de cada barra en el orden en que se devuelven
+HISTORY_FIELDS = ["date", "open", "high", "low", "close", "volume"]
+
+# Formatos de respuesta soportados para datos históricos
+HISTORY_FORMATS = ("rows", "columns")
+
+# Tipos de gráfico para la reducción de puntos: 'line' conserva barras diarias
+# representativas, 'candles' agrega las barras en velas de mayor período
+CHART_TYPES = ("line", "candles")
+
+# Mínimo de puntos aceptado para `max_points`
+MIN_CHART_POINTS = 10
+
+# Resoluciones de agregación OHLC, de la más fina a la más gruesa (mismos nombres que los intervalos de yfinance)
+CANDLE_RESOLUTIONS = (
+    ("1wk", "datetime64[W]"),
+    ("1mo", "datetime64[M]"),
+    ("3mo", None),
+    ("1y", "datetime64[Y]"),
+)
+
+
+def bars_to_columns(bars: np.ndarray) -> Dict[str, List[Any]]:
+    """
+    Convierte barras OHLCV en listas por columna, operando sobre cada columna completa
+
+    Args:
+        bars: Arreglo estructurado con campos date/open/high/low/close/volume
+
+    Returns:
+        Diccionario campo -> lista de valores ({"date": [...], "close": [...], ...})
+    """
+    return {
+        "date": np.datetime_as_string(bars["date"], unit="D").tolist(),
+        "open": np.round(bars["open"], 2).tolist(),
+        "high": np.round(bars["high"], 2).tolist(),
+        "low": np.round(bars["low"], 2).tolist(),
+        "close": np.round(bars["close"], 2).tolist(),
+        "volume": bars["volume"].astype(np.int64).tolist(),
+    }
+
+
+def bars_to_rows(bars: np.ndarray) -> List[Dict[str, Any]]:
+    """Convierte barras OHLCV en una lista de diccionarios (una fila por fecha)"""
+    columns = bars_to_columns(bars)
+    return [dict(zip(HISTORY_FIELDS, values)) for values in zip(*(columns[field] for field in HISTORY_FIELDS))]
+
+
+def serialize_history(bars: np.ndarray, data_format: str = "rows") -> Any:
+    """
+    Serializa barras en el formato pedido
+
+    Args:
+        bars: Arreglo estructurado de barras
+        data_format: 'rows' (lista de diccionarios) o 'columns' (diccionario de listas)
+    """
+    if data_format not in HISTORY_FORMATS:
+        raise ValueError(f"Formato no soportado: {data_format}")
+    if data_format == "columns":
+        return bars_to_columns(bars)
+    return bars_to_rows(bars)
+
+
+def columns_to_bars(columns: Dict[str, List[Any]]) -> np.ndarray:
+    """Inversa de `bars_to_columns`: arma barras a partir de un diccionario de listas"""
+    bars = np.empty(len(columns.get("date", [])), dtype=BAR_DTYPE)
+    for field in HISTORY_FIELDS:
+        bars[field] = np.asarray(columns[field], dtype=BAR_DTYPE[field])
+    return bars
+
+
+def frame_to_bars(history: pd.DataFrame) -> np.ndarray:
+    """Convierte un DataFrame con el formato de yfinance (Open/High/Low/Close/Volume) en barras"""
+    if history is None or history.empty:
+        return np.empty(0, dtype=BAR_DTYPE)
+    history = history.dropna(subset=["Close"])
+    index = history.index
+    if getattr(index, "tz", None) is not None:
+        index = index.tz_localize(None)
+    bars = np.empty(len(history), dtype=BAR_DTYPE)
+    bars["date"] = index.values.astype("datetime64[D]")
+    bars["open"] = history["Open"].to_numpy(dtype="f8")
+    bars["high"] = history["High"].to_numpy(dtype="f8")
+    bars["low"] = history["Low"].to_numpy(dtype="f8")
+    bars["close"] = history["Close"].to_numpy(dtype="f8")
+    bars["volume"] = history["Volume"].fillna(0).to_numpy(dtype="i8")
+    return bars
+
+
+def bars_to_frame(bars: np.ndarray) -> pd.DataFrame:
+    """Convierte barras en un DataFrame con el mismo formato que `yf.Ticker(t).history()`"""
+    return pd.DataFrame(
+        {
+            "Open": bars["open"],
+            "High": bars["high"],
+            "Low": bars["low"],
+            "Close": bars["close"],
+            "Volume": bars["volume"],
+        },
+        index=pd.DatetimeIndex(bars["date"], name="Date"),
+    )
+
+
+def slice_period(bars: np.ndarray, period: str, as_of: Optional[pd.Timestamp] = None) -> np.ndarray:
+    """
+    Recorta las barras al período pedido, con la misma semántica que yfinance
+
+    Args:
+        bars: Barras ordenadas por fecha
+        period: Período ('1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max')
+        as_of: Fecha de referencia del período (por defecto hoy)
+    """
+    if period == "max" or len(bars) == 0:
+        return bars
+
+    match = re.fullmatch(r"(\d+)(d|mo|y)", period)
+    today = (as_of if as_of is not None else pd.Timestamp.today()).normalize()
+    if period == "ytd":
+        start = pd.Timestamp(year=today.year, month=1, day=1)
+    elif match:
+        amount, unit = int(match.group(1)), match.group(2)
+        if unit == "d":
+            # En días yfinance cuenta sesiones, no días calendario
+            return bars[-amount:]
+        offset = pd.DateOffset(months=amount) if unit == "mo" else pd.DateOffset(years=amount)
+        start = today - offset
+    else:
+        raise ValueError(f"Período no soportado: {period}")
+
+    first = np.searchsorted(bars["date"], np.datetime64(start.date(), "D"), side="left")
+    return bars[first:]
+
+
+def downsample_line(bars: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Reduce la serie a lo sumo `max_points` barras conservando su forma (min-max por bloques)
+
+    La serie se divide en bloques de igual tamaño y de cada uno se conservan las
+    barras con el cierre mínimo y máximo, además de la primera y la última barra,
+    de modo que los picos y valles visibles en el gráfico no se pierden. Todo se
+    calcula sobre los arreglos completos, sin recorrer los bloques uno por uno.
+
+    Args:
+        bars: Barras ordenadas por fecha
+        max_points: Cantidad máxima de barras a devolver
+
+    Returns:
+        Subconjunto de las barras originales, en orden cronológico
+    """
+    n = len(bars)
+    if n <= max_points:
+        return bars
+
+    buckets = max((max_points - 2) // 2, 1)
+    size = -(-n // buckets)
+    close = bars["close"]
+    # Se rellena con el último valor para poder armar una matriz bloques x tamaño;
+    # argmin/argmax devuelven la primera aparición, así que nunca eligen el relleno
+    padded = np.pad(close, (0, buckets * size - n), mode="edge").reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = np.minimum(offsets + padded.argmin(axis=1), n - 1)
+    highs = np.minimum(offsets + padded.argmax(axis=1), n - 1)
+
+    keep = np.unique(np.concatenate(([0, n - 1], lows, highs)))
+    return bars[keep]
+
+
+def _candle_keys(dates: np.ndarray, unit: Optional[str]) -> np.ndarray:
+    if unit is None:
+        # Trimestres: meses desde 1970 agrupados de a tres
+        return dates.astype("datetime64[M]").astype(np.int64) // 3
+    return dates.astype(unit).astype(np.int64)
+
+
+def aggregate_candles(bars: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """
+    Agrega barras consecutivas con la misma clave en una sola vela OHLC
+
+    Args:
+        bars: Barras ordenadas por fecha
+        keys: Clave de agrupación de cada barra (semana, mes, ...), no decreciente
+
+    Returns:
+        Una barra por grupo: fecha y apertura de la primera, cierre de la última,
+        máximo/mínimo del grupo y volumen sumado
+    """
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.concatenate((starts[1:], [len(bars)])) - 1
+
+    candles = np.empty(len(starts), dtype=BAR_DTYPE)
+    candles["date"] = bars["date"][starts]
+    candles["open"] = bars["open"][starts]
+    candles["close"] = bars["close"][ends]
+    candles["high"] = np.maximum.reduceat(bars["high"], starts)
+    candles["low"] = np.minimum.reduceat(bars["low"], starts)
+    candles["volume"] = np.add.reduceat(bars["volume"], starts)
+    return candles
+
+
+def downsample_candles(bars: np.ndarray, max_points: int) -> Tuple[np.ndarray, str]:
+    """
+    Agrega las barras diarias en velas semanales, mensuales, trimestrales o anuales,
+    eligiendo la resolución más fina que entra en `max_points`
+
+    Returns:
+        Tupla (velas, resolución) con la resolución en notación de yfinance ('1d', '1wk', '1mo', ...)
+    """
+    if len(bars) <= max_points:
+        return bars, "1d"
+
+    candles, resolution = bars, "1d"
+    for resolution, unit in CANDLE_RESOLUTIONS:
+        candles = aggregate_candles(bars, _candle_keys(bars["date"], unit))
+        if len(candles) <= max_points:
+            break
+    return candles, resolution
+
+
+def downsample_history(bars: np.ndarray, max_points: Optional[int], chart: str = "line") -> Tuple[np.ndarray, str]:
+    """
+    Reduce la cantidad de barras para graficar
+
+    Args:
+        bars: Barras ordenadas por fecha
+        max_points: Cantidad máxima de puntos (None para no reducir)
+        chart: 'line' (min-max sobre el cierre) o 'candles' (agregación OHLC)
+
+    Returns:
+        Tupla (barras, resolución); en 'line' la resolución es siempre '1d'
+        porque las barras conservadas son diarias
+    """
+    if chart not in CHART_TYPES:
+        raise ValueError(f"Tipo de gráfico no soportado: {chart}")
+    if max_points is None:
+        return bars, "1d"
+    if max_points < MIN_CHART_POINTS:
+        raise ValueError(f"max_points debe ser al menos {MIN_CHART_POINTS}")
+    if chart == "candles":
+        return downsample_candles(bars, max_points)
+    return downsample_line(bars, max_points), "1d"
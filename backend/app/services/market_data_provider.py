@@ -0,0 +1,304 @@
+import json
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.history_format import (
+    bars_to_columns,
+    bars_to_frame,
+    columns_to_bars,
+    frame_to_bars,
+    slice_period,
+)
+from app.services.upstream_guard import UPSTREAM_GUARD_ENABLED, UpstreamGuard, upstream_guard
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# 'yahoo' (por defecto), 'replay' (fixtures locales) o 'record' (Yahoo + grabación de fixtures)
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "yahoo")
+MARKET_DATA_FIXTURES_DIR = os.getenv(
+    "MARKET_DATA_FIXTURES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "fixtures", "market_data"),
+)
+MARKET_DATA_REPLAY_LATENCY_MS = float(os.getenv("MARKET_DATA_REPLAY_LATENCY_MS", "0"))
+
+
+class MarketDataProvider(ABC):
+    """
+    Interfaz de acceso a datos de mercado. Todos los servicios (cotizaciones,
+    almacén de precios) pasan por aquí; Yahoo Finance es una implementación más.
+    """
+
+    name = "base"
+    # Si es True los períodos ('1y', 'ytd', ...) se cuentan desde la última barra disponible y no desde hoy
+    periods_from_last_bar = False
+
+    @abstractmethod
+    def get_info(self, ticker: str) -> Dict[str, Any]:
+        """Metadatos del ticker con las mismas claves que `yf.Ticker(t).info`"""
+
+    @abstractmethod
+    def get_history(self, ticker: str, period: Optional[str] = None, start: Optional[str] = None) -> pd.DataFrame:
+        """
+        Historial diario con columnas Open/High/Low/Close/Volume indexado por fecha
+
+        Args:
+            ticker: Símbolo de la acción
+            period: Período ('5d', '1y', 'max', ...); se ignora si se indica `start`
+            start: Fecha inicial 'YYYY-MM-DD' (inclusive)
+        """
+
+    def download_history(self, tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """
+        Historial de varios tickers; por defecto una llamada por ticker, las
+        implementaciones con descarga masiva lo sobrescriben
+
+        Returns:
+            Diccionario ticker -> DataFrame (los tickers sin datos se omiten)
+        """
+        histories = {}
+        for ticker in tickers:
+            history = self.get_history(ticker, period=period)
+            if history is not None and not history.empty:
+                histories[ticker] = history
+        return histories
+
+
+class YahooProvider(MarketDataProvider):
+    """Datos de mercado en vivo desde Yahoo Finance"""
+
+    name = "yahoo"
+
+    def get_info(self, ticker: str) -> Dict[str, Any]:
+        return yf.Ticker(ticker).info
+
+    def get_history(self, ticker: str, period: Optional[str] = None, start: Optional[str] = None) -> pd.DataFrame:
+        if start is not None:
+            return yf.Ticker(ticker).history(start=start)
+        return yf.Ticker(ticker).history(period=period or "1mo")
+
+    def download_history(self, tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """Descarga el historial de todos los tickers en una sola llamada a `yf.download`"""
+        frame = yf.download(
+            tickers,
+            period=period,
+            group_by="ticker",
+            auto_adjust=True,
+            threads=True,
+            progress=False,
+        )
+        if frame is None or frame.empty:
+            return {}
+
+        histories = {}
+        if isinstance(frame.columns, pd.MultiIndex):
+            available = set(frame.columns.get_level_values(0))
+            for ticker in tickers:
+                if ticker in available:
+                    histories[ticker] = frame[ticker].dropna(how="all")
+        elif len(tickers) == 1:
+            histories[tickers[0]] = frame.dropna(how="all")
+        return histories
+
+
+def _fixture_path(directory: str, ticker: str) -> str:
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", ticker.upper())
+    return os.path.join(directory, f"{safe}.json")
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Sirve cotizaciones y OHLCV desde fixtures locales, con latencia inyectada,
+    para hacer pruebas de carga y benchmarks sin depender de Yahoo.
+
+    Cada ticker es un archivo `<TICKER>.json` con la forma
+    {"info": {...}, "history": {"date": [...], "open": [...], ..., "volume": [...]}}
+    (el mismo formato columnar de /stock-data/historical?format=columns).
+    Los períodos se calculan respecto de la última fecha del fixture, no de hoy,
+    para que las respuestas sean deterministas.
+    """
+
+    name = "replay"
+    periods_from_last_bar = True
+
+    def __init__(self, directory: str = MARKET_DATA_FIXTURES_DIR, latency_ms: float = MARKET_DATA_REPLAY_LATENCY_MS):
+        """
+        Args:
+            directory: Carpeta de los fixtures
+            latency_ms: Milisegundos de espera inyectados en cada llamada
+        """
+        self.directory = directory
+        self.latency = latency_ms / 1000.0
+        self._fixtures: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, ticker: str) -> Optional[Dict[str, Any]]:
+        key = ticker.upper()
+        with self._lock:
+            if key in self._fixtures:
+                return self._fixtures[key]
+        path = _fixture_path(self.directory, ticker)
+        fixture = None
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+            fixture = {"info": raw.get("info") or {}, "bars": columns_to_bars(raw.get("history") or {"date": []})}
+        else:
+            logger.warning(f"No hay fixture de mercado para {ticker}")
+        with self._lock:
+            self._fixtures[key] = fixture
+        return fixture
+
+    def _sleep(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def get_info(self, ticker: str) -> Dict[str, Any]:
+        self._sleep()
+        fixture = self._load(ticker)
+        return dict(fixture["info"]) if fixture else {}
+
+    def _bars(self, ticker: str, period: Optional[str], start: Optional[str]) -> np.ndarray:
+        fixture = self._load(ticker)
+        if not fixture:
+            return frame_to_bars(None)
+        bars = fixture["bars"]
+        if start is not None:
+            return bars[bars["date"] >= np.datetime64(start, "D")]
+        as_of = pd.Timestamp(bars["date"][-1]) if len(bars) else None
+        return slice_period(bars, period or "1mo", as_of=as_of)
+
+    def get_history(self, ticker: str, period: Optional[str] = None, start: Optional[str] = None) -> pd.DataFrame:
+        self._sleep()
+        return bars_to_frame(self._bars(ticker, period, start))
+
+    def download_history(self, tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """Imita la descarga masiva: una sola espera para todo el lote"""
+        self._sleep()
+        histories = {}
+        for ticker in tickers:
+            bars = self._bars(ticker, period, None)
+            if len(bars):
+                histories[ticker] = bars_to_frame(bars)
+        return histories
+
+
+class RecordingProvider(MarketDataProvider):
+    """
+    Delegado sobre otro proveedor (Yahoo) que guarda cada respuesta como
+    fixture, para luego reproducirlas con ReplayProvider.
+    """
+
+    def __init__(self, inner: MarketDataProvider, directory: str = MARKET_DATA_FIXTURES_DIR):
+        self.inner = inner
+        self.directory = directory
+        self.name = inner.name
+        self.periods_from_last_bar = inner.periods_from_last_bar
+        self._lock = threading.Lock()
+
+    def _record(self, ticker: str, info: Optional[Dict[str, Any]] = None, history: Optional[pd.DataFrame] = None) -> None:
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = _fixture_path(self.directory, ticker)
+            fixture = {"info": {}, "history": None}
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    fixture = json.load(f)
+            if info is not None:
+                fixture["info"] = info
+            if history is not None and not history.empty:
+                bars = frame_to_bars(history)
+                if fixture.get("history"):
+                    # Fusionar por fecha: lo recién descargado reemplaza lo grabado
+                    previous = columns_to_bars(fixture["history"])
+                    previous = previous[~np.isin(previous["date"], bars["date"])]
+                    bars = np.sort(np.concatenate([previous, bars]), order="date")
+                fixture["history"] = bars_to_columns(bars)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(fixture, f, default=str)
+
+    def get_info(self, ticker: str) -> Dict[str, Any]:
+        info = self.inner.get_info(ticker)
+        self._record(ticker, info=info)
+        return info
+
+    def get_history(self, ticker: str, period: Optional[str] = None, start: Optional[str] = None) -> pd.DataFrame:
+        history = self.inner.get_history(ticker, period=period, start=start)
+        self._record(ticker, history=history)
+        return history
+
+    def download_history(self, tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        histories = self.inner.download_history(tickers, period)
+        for ticker, history in histories.items():
+            self._record(ticker, history=history)
+        return histories
+
+
+class GuardedProvider(MarketDataProvider):
+    """
+    Delegado que pasa cada llamada por el UpstreamGuard compartido (límite de
+    tasa, concurrencia adaptativa y circuit breaker). Con el circuito abierto
+    las llamadas fallan al instante con UpstreamUnavailable.
+    """
+
+    def __init__(self, inner: MarketDataProvider, guard: UpstreamGuard = upstream_guard):
+        self.inner = inner
+        self.guard = guard
+        self.name = inner.name
+        self.periods_from_last_bar = inner.periods_from_last_bar
+
+    def get_info(self, ticker: str) -> Dict[str, Any]:
+        return self.guard.call(lambda: self.inner.get_info(ticker), label=f"info {ticker}")
+
+    def get_history(self, ticker: str, period: Optional[str] = None, start: Optional[str] = None) -> pd.DataFrame:
+        return self.guard.call(
+            lambda: self.inner.get_history(ticker, period=period, start=start), label=f"historial {ticker}"
+        )
+
+    def download_history(self, tickers: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        return self.guard.call(
+            lambda: self.inner.download_history(tickers, period), label=f"descarga de {len(tickers)} tickers"
+        )
+
+
+_provider: Optional[MarketDataProvider] = None
+_provider_lock = threading.Lock()
+
+
+def create_provider(kind: str = MARKET_DATA_PROVIDER) -> MarketDataProvider:
+    """
+    Crea el proveedor indicado
+
+    Args:
+        kind: 'yahoo', 'replay' o 'record'. Las llamadas a Yahoo pasan por el
+            UpstreamGuard compartido salvo que UPSTREAM_GUARD_ENABLED sea false;
+            los fixtures locales no se limitan.
+    """
+    if kind == "yahoo":
+        return GuardedProvider(YahooProvider()) if UPSTREAM_GUARD_ENABLED else YahooProvider()
+    if kind == "replay":
+        return ReplayProvider()
+    if kind == "record":
+        yahoo = GuardedProvider(YahooProvider()) if UPSTREAM_GUARD_ENABLED else YahooProvider()
+        return RecordingProvider(yahoo)
+    raise ValueError(f"Proveedor de datos de mercado desconocido: {kind}")
+
+
+def get_provider() -> MarketDataProvider:
+    """Proveedor compartido, elegido con la variable de entorno MARKET_DATA_PROVIDER"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = create_provider()
+            logger.info(f"Proveedor de datos de mercado: {MARKET_DATA_PROVIDER}")
+        return _provider
@@ -0,0 +1,316 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tolerancia de las condiciones de optimalidad del método de conjunto activo
+_TOL = 1e-10
+# Holgura con que los pesos de un tramo de la frontera pueden salirse de sus cotas (redondeo)
+_BOUND_TOL = 1e-8
+# Estados de cada activo en el conjunto activo
+_FREE, _AT_LOWER, _AT_UPPER = 0, -1, 1
+
+
+def solve_long_only(
+    cov: np.ndarray,
+    linear: np.ndarray,
+    upper: float = 1.0,
+    start: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resuelve min ½·wᵀΣw − linearᵀw sujeto a Σw = 1 y 0 ≤ w ≤ upper
+    con un método primal de conjunto activo sobre sistemas KKT chicos
+
+    Args:
+        cov: Matriz de covarianza (n x n)
+        linear: Término lineal (τ·μ en la frontera media-varianza)
+        upper: Peso máximo por activo (se eleva a 1/n si no alcanza para invertir el 100%)
+        start: (pesos, conjunto activo) de una solución anterior para arrancar en caliente;
+            las restricciones no dependen de `linear`, así que siempre es un punto factible
+
+    Returns:
+        Tupla (pesos, conjunto activo final)
+    """
+    n = len(linear)
+    upper = max(upper, 1.0 / n)
+    if start is None:
+        w = np.full(n, 1.0 / n)
+        state = np.where(w >= upper, _AT_UPPER, _FREE).astype(np.int8)
+    else:
+        w, state = start[0].copy(), start[1].copy()
+
+    for _ in range(10 * n + 20):
+        free = np.flatnonzero(state == _FREE)
+        grad = cov @ w - linear
+
+        # Paso dentro del conjunto activo: min ½pᵀΣp + gᵀp con p = 0 en las cotas y Σp = 0
+        k = len(free)
+        step = np.zeros(n)
+        nu = 0.0
+        if k:
+            kkt = np.empty((k + 1, k + 1))
+            kkt[:k, :k] = cov[np.ix_(free, free)]
+            kkt[:k, k] = 1.0
+            kkt[k, :k] = 1.0
+            kkt[k, k] = 0.0
+            rhs = np.zeros(k + 1)
+            rhs[:k] = -grad[free]
+            try:
+                solution = np.linalg.solve(kkt, rhs)
+            except np.linalg.LinAlgError:
+                solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+            step[free], nu = solution[:k], solution[k]
+
+        if np.abs(step).max() <= _TOL:
+            # Multiplicadores de las cotas: en la inferior el gradiente debe ser ≥ 0, en la superior ≤ 0
+            if not k:
+                nu = -float(np.median(grad))
+            reduced = grad + nu
+            violation = np.where(state == _AT_LOWER, -reduced, 0.0) + np.where(state == _AT_UPPER, reduced, 0.0)
+            worst = int(np.argmax(violation))
+            if violation[worst] <= _TOL:
+                break
+            state[worst] = _FREE
+            continue
+
+        # Prueba de razón: avanzar hasta la primera cota que bloquee el paso
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(step < -_TOL, -w / step, np.where(step > _TOL, (upper - w) / step, np.inf))
+        blocking = int(np.argmin(ratios))
+        alpha = min(1.0, float(ratios[blocking]))
+        w = w + alpha * step
+        if alpha < 1.0:
+            if step[blocking] < 0:
+                w[blocking], state[blocking] = 0.0, _AT_LOWER
+            else:
+                w[blocking], state[blocking] = upper, _AT_UPPER
+    else:
+        logger.warning("El método de conjunto activo no convergió, se usa la última solución factible")
+
+    w = np.clip(w, 0.0, upper)
+    return w / w.sum(), state
+
+
+class MeanVarianceOptimizer:
+    """
+    Optimizador media-varianza long-only sobre retornos y covarianzas anualizados.
+
+    Todos los portafolios salen de la misma familia min ½·wᵀΣw − τ·μᵀw: τ = 0 es
+    el de mínima varianza y al crecer τ se recorre la frontera eficiente hasta el
+    de máximo retorno. Mientras no cambia el conjunto de activos en sus cotas los
+    pesos son lineales en τ, así que la frontera completa se describe con unos
+    pocos tramos w(τ) = w0 + τ·w1 (algoritmo de la línea crítica). Sobre cada
+    tramo el máximo Sharpe y el riesgo objetivo tienen solución cerrada.
+    """
+
+    def __init__(self, mean: np.ndarray, cov: np.ndarray, max_weight: float = 1.0, risk_free: float = 0.0):
+        """
+        Args:
+            mean: Retornos esperados anualizados
+            cov: Matriz de covarianza anualizada
+            max_weight: Peso máximo por activo (0-1)
+            risk_free: Tasa libre de riesgo anual para el ratio de Sharpe
+        """
+        self.mean = np.asarray(mean, dtype=float)
+        self.cov = np.asarray(cov, dtype=float)
+        self.max_weight = max(max_weight, 1.0 / len(self.mean))
+        self.risk_free = risk_free
+        self._segments: Optional[List[Tuple[float, float, np.ndarray, np.ndarray]]] = None
+
+    def performance(self, weights: np.ndarray) -> Dict[str, Any]:
+        """Retorno esperado, volatilidad y Sharpe de unos pesos"""
+        expected_return = float(self.mean @ weights)
+        volatility = float(np.sqrt(max(weights @ self.cov @ weights, 0.0)))
+        sharpe = (expected_return - self.risk_free) / volatility if volatility > 0 else 0.0
+        return {
+            "weights": weights,
+            "expected_return": expected_return,
+            "volatility": volatility,
+            "sharpe_ratio": float(sharpe),
+        }
+
+    def segments(self) -> List[Tuple[float, float, np.ndarray, np.ndarray]]:
+        """
+        Tramos de la frontera eficiente
+
+        Returns:
+            Lista de (τ inicial, τ final, w0, w1) con pesos w0 + τ·w1 en el tramo;
+            el último termina en infinito
+        """
+        if self._segments is None:
+            self._segments = self._trace_frontier()
+        return self._segments
+
+    def _trace_frontier(self) -> List[Tuple[float, float, np.ndarray, np.ndarray]]:
+        n = len(self.mean)
+        upper = self.max_weight
+        weights, state = solve_long_only(self.cov, np.zeros(n), upper)
+        segments = []
+        tau = 0.0
+        last_changed = -1
+
+        for _ in range(4 * n + 10):
+            free = np.flatnonzero(state == _FREE)
+            fixed = np.where(state == _AT_UPPER, upper, 0.0)
+            k = len(free)
+            if k == 0:
+                segments.append((tau, np.inf, fixed, np.zeros(n)))
+                break
+
+            kkt = np.empty((k + 1, k + 1))
+            kkt[:k, :k] = self.cov[np.ix_(free, free)]
+            kkt[:k, k] = 1.0
+            kkt[k, :k] = 1.0
+            kkt[k, k] = 0.0
+            rhs = np.zeros((k + 1, 2))
+            rhs[:k, 0] = -(self.cov[free] @ fixed)
+            rhs[k, 0] = 1.0 - fixed.sum()
+            rhs[:k, 1] = self.mean[free]
+            try:
+                solution = np.linalg.solve(kkt, rhs)
+            except np.linalg.LinAlgError:
+                solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+
+            w0, w1 = fixed.copy(), np.zeros(n)
+            w0[free], w1[free] = solution[:k, 0], solution[:k, 1]
+            nu0, nu1 = solution[k]
+            # Gradiente reducido de los activos en cota (sus multiplicadores), también lineal en τ
+            g0 = self.cov @ w0 + nu0
+            g1 = self.cov @ w1 - self.mean + nu1
+
+            # Próximo τ en que un activo libre toca una cota o uno en cota debe liberarse
+            events = np.full(n, np.inf)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                events[free] = np.where(
+                    w1[free] < -_TOL, -w0[free] / w1[free],
+                    np.where(w1[free] > _TOL, (upper - w0[free]) / w1[free], np.inf),
+                )
+                at_lower = state == _AT_LOWER
+                at_upper = state == _AT_UPPER
+                events[at_lower & (g1 < -_TOL)] = (-g0 / g1)[at_lower & (g1 < -_TOL)]
+                events[at_upper & (g1 > _TOL)] = (-g0 / g1)[at_upper & (g1 > _TOL)]
+            events[events < tau - 1e-12 * max(1.0, tau)] = np.inf
+            # El activo que acaba de cambiar de estado no vuelve a cambiar en el mismo τ,
+            # pero sí más adelante (uno liberado de la cota superior puede llegar a la inferior)
+            if last_changed >= 0 and events[last_changed] <= tau + 1e-9 * max(1.0, tau):
+                events[last_changed] = np.inf
+
+            index = int(np.argmin(events))
+            following = float(events[index])
+            self._check_bounds(w0, w1, tau, following)
+            segments.append((tau, following, w0, w1))
+            if not np.isfinite(following):
+                break
+
+            if state[index] == _FREE:
+                state[index] = _AT_LOWER if w1[index] < 0 else _AT_UPPER
+            else:
+                state[index] = _FREE
+            tau = max(tau, following)
+            last_changed = index
+        return segments
+
+    def _check_bounds(self, w0: np.ndarray, w1: np.ndarray, start: float, end: float) -> None:
+        """
+        Verifica que los pesos del tramo queden en [0, max_weight] (son lineales en τ,
+        basta con los extremos)
+
+        Raises:
+            RuntimeError: Si el trazado de la frontera produjo pesos fuera de las cotas
+        """
+        for tau in (start, end) if np.isfinite(end) else (start,):
+            weights = w0 + tau * w1
+            if weights.min() < -_BOUND_TOL or weights.max() > self.max_weight + _BOUND_TOL:
+                raise RuntimeError(f"Tramo de la frontera fuera de las cotas en τ={tau:.6g}")
+
+    def frontier_point(self, tau: float) -> Dict[str, Any]:
+        """Portafolio de la frontera para un nivel de tolerancia al riesgo τ"""
+        for start, end, w0, w1 in self.segments():
+            if tau <= end:
+                return self._point(w0 + max(tau, start) * w1)
+        start, _, w0, w1 = self.segments()[-1]
+        return self._point(w0 + start * w1)
+
+    def _point(self, weights: np.ndarray) -> Dict[str, Any]:
+        # Los tramos ya se verificaron dentro de las cotas al trazarlos (ver _check_bounds)
+        return self.performance(weights)
+
+    def _segment_moments(self, w0: np.ndarray, w1: np.ndarray) -> Tuple[float, float, float, float, float]:
+        """Retorno r0 + τ·r1 y varianza v0 + 2τ·v1 + τ²·v2 de un tramo"""
+        cov_w0, cov_w1 = self.cov @ w0, self.cov @ w1
+        return (
+            float(self.mean @ w0), float(self.mean @ w1),
+            float(w0 @ cov_w0), float(w0 @ cov_w1), float(w1 @ cov_w1),
+        )
+
+    def min_variance(self) -> Dict[str, Any]:
+        if self._segments is None:
+            # No hace falta trazar la frontera completa para el extremo inferior
+            weights, _ = solve_long_only(self.cov, np.zeros(len(self.mean)), self.max_weight)
+            return self.performance(weights)
+        return self.frontier_point(0.0)
+
+    def max_return(self) -> Dict[str, Any]:
+        """Llena los activos de mayor retorno hasta el peso máximo (extremo superior de la frontera)"""
+        weights = np.zeros(len(self.mean))
+        remaining = 1.0
+        for index in np.argsort(-self.mean):
+            weights[index] = min(self.max_weight, remaining)
+            remaining -= weights[index]
+            if remaining <= 0:
+                break
+        return self.performance(weights)
+
+    def max_sharpe(self) -> Dict[str, Any]:
+        """
+        Portafolio tangente: máximo ratio de Sharpe sobre la frontera
+
+        En cada tramo la derivada del Sharpe respecto de τ se anula en un único
+        punto (la condición resulta lineal en τ); se evalúan esos candidatos y
+        los extremos de los tramos.
+        """
+        best_sharpe, best_weights = -np.inf, None
+        for start, end, w0, w1 in self.segments():
+            r0, r1, v0, v1, v2 = self._segment_moments(w0, w1)
+            candidates = [start] if not np.isfinite(end) else [start, end]
+            denominator = r1 * v1 - (r0 - self.risk_free) * v2
+            if abs(denominator) > _TOL:
+                critical = -(r1 * v0 - (r0 - self.risk_free) * v1) / denominator
+                if start < critical < end:
+                    candidates.append(critical)
+            for tau in candidates:
+                variance = v0 + 2 * tau * v1 + tau * tau * v2
+                if variance <= 0:
+                    continue
+                sharpe = (r0 + tau * r1 - self.risk_free) / np.sqrt(variance)
+                if sharpe > best_sharpe:
+                    best_sharpe, best_weights = sharpe, w0 + tau * w1
+        if best_weights is None:
+            return self.min_variance()
+        return self._point(best_weights)
+
+    def target_risk(self, volatility: float) -> Dict[str, Any]:
+        """
+        Portafolio de mayor retorno con una volatilidad anual dada
+
+        Si el objetivo está por debajo del mínimo alcanzable se devuelve el de
+        mínima varianza, y si está por encima el de máximo retorno.
+        """
+        lowest = self.min_variance()
+        if volatility <= lowest["volatility"]:
+            return lowest
+        target = volatility ** 2
+        for start, end, w0, w1 in self.segments():
+            if not np.isfinite(end):
+                break
+            r0, r1, v0, v1, v2 = self._segment_moments(w0, w1)
+            if v0 + 2 * end * v1 + end * end * v2 < target:
+                continue
+            # v2·τ² + 2·v1·τ + (v0 − σ²) = 0, raíz dentro del tramo
+            if v2 > _TOL:
+                tau = (-v1 + np.sqrt(max(v1 * v1 - v2 * (v0 - target), 0.0))) / v2
+            else:
+                tau = (target - v0) / (2 * v1) if abs(v1) > _TOL else end
+            return self._point(w0 + min(max(tau, start), end) * w1)
+        return self.max_return()
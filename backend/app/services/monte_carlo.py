@@ -0,0 +1,275 @@
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.return_matrix import RETURNS_LOOKBACK, TRADING_DAYS, ReturnMatrixCache, return_matrix_cache
+from app.services.risk_metrics import portfolio_weights
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Memoria máxima (MB) del bloque de retornos simulados (caminos x pasos x activos) en un momento dado
+SIMULATION_CHUNK_MB = float(os.getenv("SIMULATION_CHUNK_MB", "256"))
+# Límites de una simulación
+SIMULATION_MAX_PATHS = int(os.getenv("SIMULATION_MAX_PATHS", "100000"))
+SIMULATION_MAX_YEARS = 30
+# Puntos temporales de las bandas de percentiles (se guardan sólo esos pasos de cada camino)
+SIMULATION_BAND_POINTS = 121
+# Caminos por sub-generador aleatorio y pasos por tramo de generación: con ambos fijos los
+# resultados no dependen de cuántos caminos se procesen juntos
+SIMULATION_SEED_BLOCK = 256
+SIMULATION_STEP_BLOCK = TRADING_DAYS
+
+# Métodos de generación de caminos
+SIMULATION_METHODS = ("gbm", "bootstrap")
+# Percentiles reportados en las bandas y en la distribución del valor final
+SIMULATION_PERCENTILES = (5, 25, 50, 75, 95)
+HISTOGRAM_BINS = 50
+
+# Valores por defecto de los parámetros
+DEFAULT_SIMULATION_PARAMS = {"method": "gbm", "paths": 10000, "horizon_years": 1.0, "amount": 10000.0, "seed": None}
+
+
+class SimulationCancelled(Exception):
+    """La simulación se detuvo porque se pidió cancelarla"""
+
+
+def _convert(resolved: Dict[str, Any], name: str, cast: type) -> Any:
+    """Convierte un parámetro a número, con ValueError (no TypeError) si no se puede"""
+    value = resolved[name]
+    try:
+        if isinstance(value, bool):
+            raise TypeError(name)
+        return cast(value)
+    except (TypeError, ValueError, OverflowError):
+        kind = "un entero" if cast is int else "un número"
+        raise ValueError(f"{name} debe ser {kind}")
+
+
+def resolve_simulation_params(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Completa y valida los parámetros de una simulación
+
+    Raises:
+        ValueError: Si los parámetros no son un objeto o alguno tiene un tipo
+            inválido o está fuera de rango
+    """
+    if params is not None and not isinstance(params, dict):
+        raise ValueError("params debe ser un objeto")
+    resolved = {**DEFAULT_SIMULATION_PARAMS, **{k: v for k, v in (params or {}).items() if v is not None}}
+    if not isinstance(resolved["method"], str) or resolved["method"] not in SIMULATION_METHODS:
+        raise ValueError(f"Método desconocido: {resolved['method']}. Opciones: {', '.join(SIMULATION_METHODS)}")
+    resolved["paths"] = _convert(resolved, "paths", int)
+    if not 1 <= resolved["paths"] <= SIMULATION_MAX_PATHS:
+        raise ValueError(f"paths debe estar entre 1 y {SIMULATION_MAX_PATHS}")
+    resolved["horizon_years"] = _convert(resolved, "horizon_years", float)
+    if not 0 < resolved["horizon_years"] <= SIMULATION_MAX_YEARS:
+        raise ValueError(f"horizon_years debe estar entre 0 y {SIMULATION_MAX_YEARS}")
+    resolved["amount"] = _convert(resolved, "amount", float)
+    if not 0 < resolved["amount"] < float("inf"):
+        raise ValueError("amount debe ser positivo")
+    if resolved["seed"] is None:
+        # Sin semilla se sortea una y se devuelve, para poder repetir la corrida
+        resolved["seed"] = int(np.random.SeedSequence().generate_state(1)[0])
+    resolved["seed"] = _convert(resolved, "seed", int)
+    if resolved["seed"] < 0:
+        raise ValueError("seed no puede ser negativa")
+    return {key: resolved[key] for key in DEFAULT_SIMULATION_PARAMS}
+
+
+def band_steps(horizon_years: float) -> Tuple[int, np.ndarray]:
+    """Pasos diarios del horizonte y pasos (0..pasos) en que se registran las bandas"""
+    steps = max(1, int(round(horizon_years * TRADING_DAYS)))
+    return steps, np.unique(np.linspace(0, steps, min(SIMULATION_BAND_POINTS, steps + 1)).round().astype(int))
+
+
+def band_times(horizon_years: float) -> List[float]:
+    """Tiempo en años de cada punto de las bandas"""
+    return [round(float(step) / TRADING_DAYS, 4) for step in band_steps(horizon_years)[1]]
+
+
+def summarize_bands(bands: np.ndarray, amount: float) -> Dict[str, Any]:
+    """
+    Percentiles por punto temporal y estadísticas del valor final de un conjunto
+    de caminos (caminos x puntos de las bandas); sirve tanto para el resultado
+    final como para las estimaciones parciales mientras la simulación avanza
+    """
+    terminal = bands[:, -1]
+    percentiles = np.percentile(bands, SIMULATION_PERCENTILES, axis=0)
+    terminal_percentiles = np.percentile(terminal, SIMULATION_PERCENTILES)
+    return {
+        "bands": {f"p{p}": [round(float(v), 2) for v in row] for p, row in zip(SIMULATION_PERCENTILES, percentiles)},
+        "probability_of_loss": round(float((terminal < amount).mean()), 4),
+        "terminal": {
+            "mean": round(float(terminal.mean()), 2),
+            "std": round(float(terminal.std()), 2),
+            "min": round(float(terminal.min()), 2),
+            "max": round(float(terminal.max()), 2),
+            "percentiles": {f"p{p}": round(float(v), 2) for p, v in zip(SIMULATION_PERCENTILES, terminal_percentiles)},
+        },
+    }
+
+
+class MonteCarloEngine:
+    """
+    Simulación Monte Carlo del valor de un portafolio (rebalanceado a pesos
+    constantes) con los retornos diarios cacheados de sus activos.
+
+    - 'gbm': movimiento browniano geométrico correlacionado; los log-retornos de
+      los activos se generan como un arreglo (caminos x pasos x activos) con la
+      media y la covarianza históricas (Cholesky).
+    - 'bootstrap': se remuestrean días históricos completos, lo que conserva la
+      correlación y las colas observadas. Con pesos constantes alcanza con
+      remuestrear el retorno diario del portafolio.
+
+    El arreglo (caminos x pasos x activos) se genera por partes: grupos de
+    caminos que respetan SIMULATION_CHUNK_MB, avanzando de a SIMULATION_STEP_BLOCK
+    pasos y arrastrando el valor alcanzado. De cada camino sólo se guardan los
+    pasos de las bandas, así que 100k caminos a 10 años de pasos diarios corren
+    con memoria acotada. Cada grupo de SIMULATION_SEED_BLOCK caminos tiene su
+    propio generador derivado de la semilla: misma semilla, mismo resultado,
+    con cualquier presupuesto de memoria.
+    """
+
+    def __init__(
+        self,
+        matrices: Optional[ReturnMatrixCache] = None,
+        lookback: str = RETURNS_LOOKBACK,
+        chunk_mb: float = SIMULATION_CHUNK_MB,
+    ):
+        """
+        Args:
+            matrices: Cache de matrices de retornos (por defecto la compartida)
+            lookback: Período de historia usado para calibrar
+            chunk_mb: Memoria máxima del bloque de retornos simulados
+        """
+        self.matrices = matrices or return_matrix_cache
+        self.lookback = lookback
+        self.chunk_mb = chunk_mb
+
+    def _inputs(self, assets: List[Dict[str, Any]]):
+        weights = portfolio_weights(assets)
+        if not weights:
+            raise ValueError("El portafolio no tiene activos")
+        matrix = self.matrices.get(sorted(weights), self.lookback)
+        vector = np.array([weights[ticker] for ticker in matrix.tickers])
+        coverage = float(vector.sum())
+        if coverage <= 0:
+            raise ValueError("Ningún activo del portafolio tiene historial de precios")
+        return matrix, vector / coverage, coverage
+
+    def _chunk_blocks(self, assets: int) -> int:
+        """Bloques de SIMULATION_SEED_BLOCK caminos que entran en el presupuesto de memoria"""
+        path_bytes = SIMULATION_STEP_BLOCK * max(assets, 1) * 8 * 3  # normales, log-retornos correlacionados y retornos
+        return max(1, int(self.chunk_mb * 1024 * 1024 // (path_bytes * SIMULATION_SEED_BLOCK)))
+
+    def simulate(
+        self,
+        assets: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None,
+        progress: Optional[Any] = None,
+        chunk_paths: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Simula el valor del portafolio
+
+        Args:
+            assets: Activos del portafolio (ticker, allocation_pct)
+            params: method ('gbm' | 'bootstrap'), paths, horizon_years, amount, seed
+            progress: Callback opcional progress(caminos_hechos, caminos_totales, bandas)
+                que se llama al terminar cada grupo; `bandas` son los caminos ya
+                terminados (caminos_hechos x puntos). Puede cortar la simulación
+                lanzando una excepción.
+            chunk_paths: Caminos máximos por grupo (por defecto, los que entran en
+                el presupuesto de memoria); grupos chicos dan avances más seguidos
+                sin cambiar el resultado
+
+        Returns:
+            Parámetros efectivos, bandas de percentiles por punto temporal,
+            probabilidad de pérdida y distribución del valor final
+
+        Raises:
+            ValueError: Si los parámetros son inválidos o no hay historial suficiente
+        """
+        params = resolve_simulation_params(params)
+        matrix, weights, coverage = self._inputs(assets)
+        paths, amount = params["paths"], params["amount"]
+        steps, points = band_steps(params["horizon_years"])
+
+        if params["method"] == "gbm":
+            log_returns = np.log1p(matrix.returns)
+            drift = log_returns.mean(axis=0)
+            # Pequeña regularización por si la covarianza es semidefinida (activos casi idénticos)
+            cov = np.cov(log_returns, rowvar=False) + np.eye(len(weights)) * 1e-12
+            cholesky = np.linalg.cholesky(cov)
+            asset_count = len(weights)
+        else:
+            history = matrix.returns @ weights
+            asset_count = 1
+
+        blocks = -(-paths // SIMULATION_SEED_BLOCK)
+        generators = [np.random.default_rng(child) for child in np.random.SeedSequence(params["seed"]).spawn(blocks)]
+        chunk_blocks = self._chunk_blocks(asset_count)
+        if chunk_paths:
+            chunk_blocks = max(1, min(chunk_blocks, chunk_paths // SIMULATION_SEED_BLOCK))
+
+        bands = np.empty((paths, len(points)))
+        bands[:, 0] = amount
+        done = 0
+        for first in range(0, blocks, chunk_blocks):
+            chunk_generators = generators[first:first + chunk_blocks]
+            sizes = [
+                min(SIMULATION_SEED_BLOCK, paths - block * SIMULATION_SEED_BLOCK)
+                for block in range(first, first + len(chunk_generators))
+            ]
+            level = np.full(sum(sizes), amount)
+            for start in range(0, steps, SIMULATION_STEP_BLOCK):
+                window = min(SIMULATION_STEP_BLOCK, steps - start)
+                parts = []
+                for generator, size in zip(chunk_generators, sizes):
+                    if params["method"] == "gbm":
+                        shocks = generator.standard_normal((size, window, asset_count))
+                        parts.append(np.expm1(shocks @ cholesky.T + drift) @ weights)
+                    else:
+                        parts.append(history[generator.integers(0, len(history), (size, window))])
+                daily = np.concatenate(parts) if len(parts) > 1 else parts[0]
+                values = level[:, None] * np.cumprod(1.0 + daily, axis=1)
+                # Pasos de las bandas (1..steps) que caen en este tramo
+                inside = (points > start) & (points <= start + window)
+                bands[done:done + len(level), inside] = values[:, points[inside] - start - 1]
+                level = values[:, -1]
+            done += len(level)
+            if progress is not None:
+                progress(done, paths, bands[:done])
+
+        terminal = bands[:, -1]
+        counts, edges = np.histogram(terminal, bins=HISTOGRAM_BINS)
+        summary = summarize_bands(bands, amount)
+        summary["terminal"]["histogram"] = {"edges": [round(float(e), 2) for e in edges], "counts": counts.tolist()}
+        logger.info(
+            f"Simulación {params['method']}: {paths} caminos x {steps} pasos x {len(weights)} activos "
+            f"(grupos de {chunk_blocks * SIMULATION_SEED_BLOCK} caminos)"
+        )
+
+        return {
+            "params": params,
+            "tickers": matrix.tickers,
+            "weights": [round(float(w), 6) for w in weights],
+            "coverage": round(coverage, 4),
+            "steps": steps,
+            "calibration": {"lookback": self.lookback, "observations": matrix.observations},
+            "time_years": band_times(params["horizon_years"]),
+            **summary,
+        }
+
+
+def run_simulation(assets: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Simulación con el motor compartido (función de módulo, para el pool de procesos)"""
+    return monte_carlo_engine.simulate(assets, params)
+
+
+# Motor compartido por las rutas de simulación
+monte_carlo_engine = MonteCarloEngine()
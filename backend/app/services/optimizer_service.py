@@ -1,10 +1,27 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import numpy as np
 import pandas as pd
-# import yfinance as yf
-# from pypfopt.efficient_frontier import EfficientFrontier
-# from pypfopt import risk_models
-# from pypfopt import expected_returns
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.covariance_estimator import COVARIANCE_ESTIMATOR
+from app.services.frontier_table import FrontierTable, frontier_service
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Asignaciones menores a este porcentaje se descartan y se redistribuyen
+MIN_ALLOCATION_PCT = 0.5
+
+# Objetivos de optimización disponibles
+OBJECTIVES = ("min_variance", "max_sharpe", "target_risk")
+
+# Punto de la frontera eficiente para cada nivel de riesgo
+RISK_LEVEL_OBJECTIVES = {"low": "min_variance", "medium": "max_sharpe", "high": "target_risk"}
+# Para 'high': fracción del tramo entre el portafolio de máximo Sharpe y el de máximo retorno
+HIGH_RISK_FRONTIER_POSITION = 0.5
 
 # Mapeo de tickers de referencia a tickers reales de Yahoo Finance
 TICKER_MAPPING = {
@@ -30,10 +47,220 @@ ASSET_NAMES = {
     "GLD": "SPDR Gold Trust"
 }
 
+# Listado extendido de activos para diversificación
+EXTENDED_ASSETS = [
+    {"ticker": "TLT", "name": "iShares 20+ Year Treasury Bond ETF", "reason": "Bonos del tesoro estadounidense a largo plazo."},
+    {"ticker": "JNJ", "name": "Johnson & Johnson", "reason": "Empresa farmacéutica estable con dividendos."},
+    {"ticker": "MSFT", "name": "Microsoft Corporation", "reason": "Líder tecnológico global."},
+    {"ticker": "EMB", "name": "iShares Emerging Markets Bond ETF", "reason": "Bonos de mercados emergentes."},
+    {"ticker": "VT", "name": "Vanguard Total World Stock ETF", "reason": "Cobertura global diversificada."},
+    {"ticker": "NVDA", "name": "NVIDIA Corporation", "reason": "Tecnología y semiconductores."},
+    {"ticker": "BTC-USD", "name": "Bitcoin USD", "reason": "Criptomoneda líder, alta volatilidad."},
+    {"ticker": "GLD", "name": "SPDR Gold Trust", "reason": "Oro físico, protección contra inflación."},
+    {"ticker": "AAPL", "name": "Apple Inc.", "reason": "Innovación y consumo global."},
+    {"ticker": "GOOGL", "name": "Alphabet Inc.", "reason": "Tecnología y publicidad digital."},
+    {"ticker": "AMZN", "name": "Amazon.com Inc.", "reason": "E-commerce y servicios en la nube."},
+    {"ticker": "XLF", "name": "Financial Select Sector SPDR Fund", "reason": "Sector financiero diversificado."},
+    {"ticker": "XLE", "name": "Energy Select Sector SPDR Fund", "reason": "Sector energético diversificado."}
+]
+
 def generate_portfolio(user_profile: Dict[str, Any], preferences: Dict[str, Any]) -> Dict[str, Any]:
     """
     Genera un portafolio de inversión basado en el perfil de usuario y preferencias.
-    Versión simple: reglas básicas según el nivel de riesgo.
+
+    Optimiza media-varianza sobre EXTENDED_ASSETS con los retornos cacheados del
+    almacén de precios; si no hay historial suficiente usa las reglas fijas.
+
+    Args:
+        user_profile: Perfil del usuario ('risk_level': 'low', 'medium' o 'high')
+        preferences: Preferencias; admite 'objective' ('min_variance', 'max_sharpe',
+            'target_risk') y 'target_risk' (volatilidad anual, ej: 0.12) para
+            elegir el punto de la frontera en lugar del nivel de riesgo, y
+            'estimator' ('sample', 'ewma', 'shrinkage') para la covarianza
+
+    Returns:
+        Diccionario con 'assets' (ticker, name, allocation_pct, reason) y 'metrics'
+    """
+    try:
+        return generate_optimized_portfolio(user_profile, preferences)
+    except Exception as e:
+        logger.warning(f"No se pudo optimizar el portafolio, se usan las reglas fijas: {str(e)}")
+        return generate_rule_based_portfolio(user_profile, preferences)
+
+
+def _risk_level(user_profile: Dict[str, Any]) -> str:
+    risk_level = user_profile.get("risk_level", "medium")
+    return risk_level if risk_level in ("low", "medium") else "high"
+
+
+def resolve_objective(risk_level: str, objective: Optional[str] = None, target_risk: Optional[float] = None) -> str:
+    """
+    Objetivo de optimización efectivo: el explícito, 'target_risk' si se pidió una
+    volatilidad, o el que corresponde al nivel de riesgo
+
+    Raises:
+        ValueError: Si el objetivo no existe
+    """
+    if target_risk is not None:
+        objective = "target_risk"
+    objective = objective or RISK_LEVEL_OBJECTIVES[risk_level]
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Objetivo desconocido: {objective}. Opciones: {', '.join(OBJECTIVES)}")
+    return objective
+
+
+def select_frontier_point(
+    table: FrontierTable,
+    risk_level: str,
+    objective: Optional[str] = None,
+    target_risk: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Elige el portafolio de la frontera que corresponde al perfil
+
+    Args:
+        table: Frontera precalculada del universo
+        risk_level: 'low' (mínima varianza), 'medium' (máximo Sharpe) o 'high'
+            (a mitad de camino entre el máximo Sharpe y el máximo retorno)
+        objective: Objetivo explícito que reemplaza al del nivel de riesgo
+        target_risk: Volatilidad anual objetivo (implica objective='target_risk')
+    """
+    objective = resolve_objective(risk_level, objective, target_risk)
+    if objective == "min_variance":
+        return table.min_variance()
+    if objective == "max_sharpe":
+        return table.max_sharpe()
+    if target_risk is None:
+        tangent = table.max_sharpe()["volatility"]
+        highest = float(table.volatility[-1])
+        target_risk = tangent + HIGH_RISK_FRONTIER_POSITION * (highest - tangent)
+    return table.lookup(float(target_risk))
+
+
+def weights_to_assets(tickers: List[str], weights: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Convierte pesos en la lista de activos del portafolio, descartando asignaciones
+    mínimas y redondeando a dos decimales de modo que sumen exactamente 100
+    """
+    pct = np.asarray(weights) * 100.0
+    keep = pct >= MIN_ALLOCATION_PCT
+    pct = np.where(keep, pct, 0.0)
+    pct = np.round(pct * 100.0 / pct.sum(), 2)
+    # El residuo del redondeo va al activo de mayor peso
+    pct[np.argmax(pct)] += round(100.0 - float(pct.sum()), 2)
+
+    assets_by_ticker = {asset["ticker"]: asset for asset in EXTENDED_ASSETS}
+    order = np.argsort(-pct)
+    return [
+        {
+            "ticker": tickers[i],
+            "name": assets_by_ticker.get(tickers[i], {}).get("name", ASSET_NAMES.get(tickers[i], tickers[i])),
+            "allocation_pct": round(float(pct[i]), 2),
+            "reason": assets_by_ticker.get(tickers[i], {}).get("reason"),
+        }
+        for i in order
+        if pct[i] > 0
+    ]
+
+
+def frontier_table(estimator: Optional[str] = None) -> FrontierTable:
+    """
+    Frontera precalculada de EXTENDED_ASSETS con la estimación de covarianza indicada
+
+    Raises:
+        ValueError: Si no hay historial suficiente o el estimador no existe
+    """
+    # La tabla ya está calculada (el precalentador la rehace con cada barra nueva): aquí sólo se lee
+    return frontier_service.get([asset["ticker"] for asset in EXTENDED_ASSETS], estimator)
+
+
+def optimize_profile(table: FrontierTable, user_profile: Dict[str, Any], preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """Portafolio de un perfil por consulta a la frontera precalculada"""
+    risk_level = _risk_level(user_profile)
+    objective = resolve_objective(risk_level, preferences.get("objective"), preferences.get("target_risk"))
+    point = select_frontier_point(table, risk_level, objective, preferences.get("target_risk"))
+
+    return {
+        "assets": weights_to_assets(table.tickers, point["weights"]),
+        "metrics": {
+            "expected_return": round(point["expected_return"], 4),
+            "risk": round(point["volatility"], 4),
+            "sharpe_ratio": round(point["sharpe_ratio"], 4),
+            "method": "mean_variance",
+            "objective": objective,
+            "estimator": table.estimator,
+            "observations": table.observations,
+        },
+    }
+
+
+def generate_optimized_portfolio(user_profile: Dict[str, Any], preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Portafolio media-varianza sobre EXTENDED_ASSETS (ver `generate_portfolio`)
+
+    Raises:
+        ValueError: Si no hay historial suficiente o el objetivo pedido no existe
+    """
+    return optimize_profile(frontier_table(preferences.get("estimator")), user_profile, preferences)
+
+
+def profile_signature(user_profile: Dict[str, Any], preferences: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Datos que determinan la asignación: perfiles con la misma firma reciben el mismo portafolio"""
+    target_risk = preferences.get("target_risk")
+    return (
+        _risk_level(user_profile),
+        preferences.get("objective"),
+        float(target_risk) if target_risk is not None else None,
+        preferences.get("estimator") or COVARIANCE_ESTIMATOR,
+    )
+
+
+def generate_portfolios(profiles: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Genera los portafolios de muchos perfiles a la vez
+
+    Los perfiles se agrupan por firma (nivel de riesgo, objetivo, riesgo objetivo,
+    estimador) y cada firma distinta se resuelve una sola vez con una consulta a
+    la frontera precalculada de su estimador.
+
+    Args:
+        profiles: Lista de (user_profile, preferences)
+
+    Returns:
+        Un portafolio por perfil, en el mismo orden (los resultados de una misma
+        firma comparten los datos, hay que copiarlos antes de modificarlos)
+    """
+    signatures = [profile_signature(user_profile, preferences) for user_profile, preferences in profiles]
+    solved: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    tables: Dict[str, Optional[FrontierTable]] = {}
+
+    for signature, (user_profile, preferences) in zip(signatures, profiles):
+        if signature in solved:
+            continue
+        estimator = signature[3]
+        if estimator not in tables:
+            try:
+                tables[estimator] = frontier_table(estimator)
+            except Exception as e:
+                logger.warning(f"No se pudo preparar la frontera ({estimator}), se usan las reglas fijas: {str(e)}")
+                tables[estimator] = None
+        try:
+            if tables[estimator] is None:
+                raise ValueError("Frontera no disponible")
+            solved[signature] = optimize_profile(tables[estimator], user_profile, preferences)
+        except Exception as e:
+            logger.warning(f"No se pudo optimizar el perfil {signature}, se usan las reglas fijas: {str(e)}")
+            solved[signature] = generate_rule_based_portfolio(user_profile, preferences)
+
+    logger.info(f"{len(profiles)} portafolios generados a partir de {len(solved)} perfiles distintos")
+    return [solved[signature] for signature in signatures]
+
+
+def generate_rule_based_portfolio(user_profile: Dict[str, Any], preferences: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Genera un portafolio de inversión basado en el perfil de usuario y preferencias.
+    Versión simple: reglas básicas según el nivel de riesgo. Se usa cuando no hay
+    historial suficiente para optimizar.
     """
     risk_level = user_profile.get("risk_level", "medium") # 'low', 'medium', 'high'
     investment_amount = preferences.get("amount", 10000)
@@ -42,23 +269,6 @@ def generate_portfolio(user_profile: Dict[str, Any], preferences: Dict[str, Any]
     expected_return = 0.0
     risk = 0.0
 
-    # Listado extendido de activos para diversificación
-    EXTENDED_ASSETS = [
-        {"ticker": "TLT", "name": "iShares 20+ Year Treasury Bond ETF", "reason": "Bonos del tesoro estadounidense a largo plazo."},
-        {"ticker": "JNJ", "name": "Johnson & Johnson", "reason": "Empresa farmacéutica estable con dividendos."},
-        {"ticker": "MSFT", "name": "Microsoft Corporation", "reason": "Líder tecnológico global."},
-        {"ticker": "EMB", "name": "iShares Emerging Markets Bond ETF", "reason": "Bonos de mercados emergentes."},
-        {"ticker": "VT", "name": "Vanguard Total World Stock ETF", "reason": "Cobertura global diversificada."},
-        {"ticker": "NVDA", "name": "NVIDIA Corporation", "reason": "Tecnología y semiconductores."},
-        {"ticker": "BTC-USD", "name": "Bitcoin USD", "reason": "Criptomoneda líder, alta volatilidad."},
-        {"ticker": "GLD", "name": "SPDR Gold Trust", "reason": "Oro físico, protección contra inflación."},
-        {"ticker": "AAPL", "name": "Apple Inc.", "reason": "Innovación y consumo global."},
-        {"ticker": "GOOGL", "name": "Alphabet Inc.", "reason": "Tecnología y publicidad digital."},
-        {"ticker": "AMZN", "name": "Amazon.com Inc.", "reason": "E-commerce y servicios en la nube."},
-        {"ticker": "XLF", "name": "Financial Select Sector SPDR Fund", "reason": "Sector financiero diversificado."},
-        {"ticker": "XLE", "name": "Energy Select Sector SPDR Fund", "reason": "Sector energético diversificado."}
-    ]
-
     # Selección y asignación según perfil
     if risk_level == "low":
         selected = EXTENDED_ASSETS[:5]
@@ -101,53 +311,5 @@ def generate_portfolio(user_profile: Dict[str, Any], preferences: Dict[str, Any]
 
     return {
         "assets": portfolio_assets,
-        "metrics": {"expected_return": expected_return, "risk": risk}
-    }
-
-
-# Versión avanzada (comentada) usando PyPortfolioOpt
-"""
-def generate_portfolio_advanced(user_profile: Dict[str, Any], preferences: Dict[str, Any]) -> Dict[str, Any]:
-    # Ejemplo de tickers, esto debería venir de una base de datos o ser dinámico
-    tickers = ['SPY', 'GLD', 'AGG', 'QQQ'] # S&P 500, Oro, Bonos, Nasdaq 100
-
-    # Descargar datos históricos
-    data = yf.download(tickers, start="2015-01-01", end="2023-01-01")['Adj Close']
-
-    # Calcular retornos esperados y matriz de covarianza
-    mu = expected_returns.mean_historical_return(data)
-    S = risk_models.sample_cov(data)
-
-    # Optimización del portafolio (ejemplo: maximizar Sharpe Ratio)
-    ef = EfficientFrontier(mu, S)
-    weights = ef.max_sharpe()
-    cleaned_weights = ef.clean_weights()
-
-    # Convertir pesos a porcentajes y formato de salida
-    portfolio_assets: List[Dict[str, Any]] = []
-    for ticker, allocation in cleaned_weights.items():
-        if allocation > 0.001: # Solo incluir activos con asignación significativa
-            portfolio_assets.append({
-                "ticker": ticker,
-                "name": f"Nombre de {ticker}", # Aquí se debería buscar el nombre real del activo
-                "allocation_pct": round(allocation * 100, 2),
-                "reason": f"Asignación basada en optimización de Sharpe Ratio para {ticker}."
-            })
-
-    # Asegurar que la suma de porcentajes sea 100
-    total_pct = sum(asset["allocation_pct"] for asset in portfolio_assets)
-    if total_pct != 100.0:
-        adjustment_factor = 100.0 / total_pct
-        for asset in portfolio_assets:
-            asset["allocation_pct"] = round(asset["allocation_pct"] * adjustment_factor, 2)
-
-    # Calcular métricas del portafolio optimizado
-    latest_returns = expected_returns.returns_from_prices(data)
-    ef.portfolio_performance(verbose=True)
-    # expected_return, volatility, sharpe_ratio = ef.portfolio_performance()
-
-    return {
-        "assets": portfolio_assets,
-        "metrics": {"expected_return": expected_return, "risk": volatility} # Usar los valores reales de ef.portfolio_performance()
+        "metrics": {"expected_return": expected_return, "risk": risk, "method": "rule_based"}
     }
-"""
@@ -0,0 +1,178 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.database import db
+from app.services.covariance_estimator import covariance_service
+from app.services.frontier_table import frontier_service
+from app.services.optimizer_service import EXTENDED_ASSETS
+from app.services.price_store import price_store
+from app.services.risk_metrics import RISK_BENCHMARK
+from app.services.upstream_guard import upstream_guard
+from app.services.yahoo_finance_service import YahooFinanceService
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "true").lower() in ("1", "true", "yes")
+# Por defecto algo menor que el TTL de la cache de cotizaciones, para que no llegue a vencer
+PREWARM_INTERVAL_SECONDS = float(os.getenv("PREWARM_INTERVAL_SECONDS", "45"))
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "4"))
+PREWARM_JITTER_SECONDS = float(os.getenv("PREWARM_JITTER_SECONDS", "2"))
+# Tickers por llamada de cotizaciones (el mismo límite que /stock-data)
+PREWARM_QUOTE_BATCH = 50
+
+
+class MarketDataPrewarmer:
+    """
+    Refresca en segundo plano las cotizaciones y las barras diarias del universo
+    de tickers que sabemos que se van a pedir: los activos de EXTENDED_ASSETS, el
+    índice de referencia de la beta y todos los tickers presentes en db.portfolios. Así las solicitudes de los
+    usuarios encuentran la cache y el almacén de precios ya actualizados.
+    """
+
+    def __init__(
+        self,
+        interval: float = PREWARM_INTERVAL_SECONDS,
+        concurrency: int = PREWARM_CONCURRENCY,
+        jitter: float = PREWARM_JITTER_SECONDS,
+    ):
+        """
+        Args:
+            interval: Segundos entre dos rondas de refresco
+            concurrency: Tickers que se sincronizan a la vez en el almacén de precios
+            jitter: Segundos máximos de espera aleatoria antes de cada llamada, para no pegarle a Yahoo en ráfaga
+        """
+        self.interval = interval
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._last_run: Optional[Dict[str, Any]] = None
+
+    def universe(self) -> List[str]:
+        """
+        Tickers a mantener calientes: EXTENDED_ASSETS, el índice de referencia de
+        las métricas de riesgo y los de todos los portafolios guardados
+        """
+        tickers = [asset["ticker"] for asset in EXTENDED_ASSETS]
+        if RISK_BENCHMARK:
+            tickers.append(RISK_BENCHMARK)
+        try:
+            tickers.extend(t for t in db.portfolios.distinct("assets.ticker") if t)
+        except Exception as e:
+            logger.error(f"No se pudieron leer los tickers de los portafolios: {str(e)}")
+        return list(dict.fromkeys(tickers))
+
+    def _record(self, ticker: str, field: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            entry = self._status.setdefault(ticker, {"quote_refreshed_at": None, "bars_refreshed_at": None, "error": None})
+            if error:
+                entry["error"] = error
+            else:
+                entry[field] = datetime.utcnow().isoformat()
+                entry["error"] = None
+
+    def _sleep_jitter(self) -> None:
+        if self.jitter > 0:
+            self._stop.wait(random.uniform(0, self.jitter))
+
+    def _refresh_quotes(self, tickers: List[str]) -> None:
+        for i in range(0, len(tickers), PREWARM_QUOTE_BATCH):
+            if self._stop.is_set():
+                return
+            batch = tickers[i:i + PREWARM_QUOTE_BATCH]
+            self._sleep_jitter()
+            try:
+                quotes = YahooFinanceService.refresh_quotes(batch)
+                for ticker in batch:
+                    quote = quotes.get(ticker) or {}
+                    self._record(ticker, "quote_refreshed_at", quote.get("error"))
+            except Exception as e:
+                logger.error(f"Error al precalentar cotizaciones: {str(e)}")
+                for ticker in batch:
+                    self._record(ticker, "quote_refreshed_at", str(e))
+
+    def _refresh_bars(self, ticker: str) -> None:
+        if self._stop.is_set():
+            return
+        self._sleep_jitter()
+        try:
+            if price_store.sync(ticker) is None:
+                self._record(ticker, "bars_refreshed_at", "No se encontraron datos históricos")
+            else:
+                self._record(ticker, "bars_refreshed_at")
+        except Exception as e:
+            logger.error(f"Error al precalentar barras de {ticker}: {str(e)}")
+            self._record(ticker, "bars_refreshed_at", str(e))
+
+    def refresh_once(self) -> None:
+        """Ejecuta una ronda completa de refresco sobre el universo actual"""
+        if upstream_guard.breaker.state == "open":
+            logger.info("Circuito de datos de mercado abierto, se saltea la ronda de precalentamiento")
+            return
+        started = time.monotonic()
+        tickers = self.universe()
+        self._refresh_quotes(tickers)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="prewarm") as executor:
+            list(executor.map(self._refresh_bars, tickers))
+        # Con las barras al día, incorporar los retornos nuevos a las covarianzas del optimizador
+        covariance_service.refresh_all()
+        # y recalcular las fronteras precalculadas cuyas estimaciones cambiaron
+        frontier_service.refresh_all()
+        with self._lock:
+            self._last_run = {
+                "finished_at": datetime.utcnow().isoformat(),
+                "duration_seconds": round(time.monotonic() - started, 3),
+                "tickers": len(tickers),
+            }
+        logger.info(f"Precalentamiento de {len(tickers)} tickers completado")
+
+    def _run(self) -> None:
+        self._sleep_jitter()
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error(f"Error en la ronda de precalentamiento: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Arranca el hilo de refresco (no hace nada si ya está corriendo)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-prewarmer", daemon=True)
+        self._thread.start()
+        logger.info(f"Precalentador de datos de mercado iniciado (cada {self.interval}s)")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Detiene el hilo de refresco y espera a que termine la ronda en curso"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("Precalentador de datos de mercado detenido")
+
+    def status(self) -> Dict[str, Any]:
+        """Estado del precalentador y última actualización por ticker"""
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "interval_seconds": self.interval,
+                "concurrency": self.concurrency,
+                "last_run": self._last_run,
+                "tickers": {ticker: dict(entry) for ticker, entry in self._status.items()},
+            }
+
+
+prewarmer = MarketDataPrewarmer()
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from app.services.history_format import BAR_DTYPE, frame_to_bars, slice_period
+from app.services.market_data_provider import get_provider
+from dotenv import load_dotenv
+import os
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR")
+# Segundos mínimos entre dos consultas incrementales a Yahoo para el mismo ticker
+PRICE_STORE_SYNC_INTERVAL = float(os.getenv("PRICE_STORE_SYNC_INTERVAL", "900"))
+
+# Barras que se vuelven a pedir al actualizar, para detectar ajustes por dividendos/splits
+OVERLAP_BARS = 5
+# Tickers que sync_many sincroniza a la vez
+SYNC_MANY_CONCURRENCY = 4
+
+
+class PriceStore:
+    """
+    Almacén local de precios diarios OHLCV, un archivo por ticker.
+
+    La primera consulta descarga el historial completo ('max'); las siguientes
+    sólo piden a Yahoo las barras posteriores a la última guardada y las agregan
+    al final. Si las barras solapadas no coinciden (Yahoo reajustó la serie por
+    dividendos o splits) el archivo se reconstruye completo.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = PRICE_STORE_DIR,
+        sync_interval: float = PRICE_STORE_SYNC_INTERVAL,
+        provider: Optional[Any] = None,
+        offline: bool = False,
+    ):
+        """
+        Args:
+            directory: Carpeta de los archivos .npy. Por defecto data/prices, o
+                data/prices_<proveedor> si el proveedor no es Yahoo (para no mezclar
+                datos grabados con datos reales)
+            sync_interval: Segundos mínimos entre dos actualizaciones del mismo ticker
+            provider: Proveedor de datos de mercado (por defecto el configurado por entorno)
+            offline: Sólo leer lo guardado, sin consultar al proveedor (procesos de
+                cálculo, que dependen del proceso principal para actualizar el disco)
+        """
+        self.provider = provider or get_provider()
+        if directory is None:
+            folder = "prices" if self.provider.name == "yahoo" else f"prices_{self.provider.name}"
+            directory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", folder)
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.offline = offline
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._synced_at: Dict[str, float] = {}
+
+    def _path(self, ticker: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9._-]", "_", ticker.upper())
+        return os.path.join(self.directory, f"{safe}.npy")
+
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(ticker.upper(), threading.Lock())
+
+    def read(self, ticker: str) -> Optional[np.ndarray]:
+        """Devuelve las barras guardadas del ticker (mapeadas en memoria, sólo lectura) o None"""
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def _write(self, ticker: str, bars: np.ndarray) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(ticker)
+        # Sufijo por proceso: varios workers del servidor pueden escribir el mismo archivo
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, bars)
+        os.replace(tmp_path, path)
+
+    def sync(self, ticker: str, force: bool = False) -> Optional[np.ndarray]:
+        """
+        Completa el archivo del ticker con las barras que falten
+
+        Args:
+            ticker: Símbolo de la acción
+            force: Ignorar el intervalo mínimo entre sincronizaciones
+
+        Returns:
+            Barras guardadas luego de sincronizar, o None si no hay datos
+        """
+        with self._lock(ticker):
+            key = ticker.upper()
+            stored = self.read(ticker)
+            if self.offline:
+                return stored
+            last_sync = self._synced_at.get(key)
+            if (
+                not force
+                and stored is not None
+                and last_sync is not None
+                and time.monotonic() - last_sync < self.sync_interval
+            ):
+                return stored
+
+            if stored is None or len(stored) == 0:
+                bars = frame_to_bars(self.provider.get_history(ticker, period="max"))
+                if len(bars) == 0:
+                    logger.warning(f"No se encontraron datos históricos para {ticker}")
+                    return None
+                self._write(ticker, bars)
+                logger.info(f"Historial completo de {ticker} guardado ({len(bars)} barras)")
+            else:
+                overlap = stored[-OVERLAP_BARS:]
+                start = pd.Timestamp(overlap["date"][0]).strftime("%Y-%m-%d")
+                try:
+                    fresh = frame_to_bars(self.provider.get_history(ticker, start=start))
+                    bars = self._merge(ticker, stored, fresh)
+                except Exception as e:
+                    # Sin acceso a la fuente (límite, circuito abierto) se sirve lo ya guardado
+                    logger.warning(f"No se pudo actualizar el historial de {ticker}, se usan las barras guardadas: {str(e)}")
+                    return stored
+                if bars is not None:
+                    self._write(ticker, bars)
+
+            self._synced_at[key] = time.monotonic()
+            return self.read(ticker)
+
+    def _merge(self, ticker: str, stored: np.ndarray, fresh: np.ndarray) -> Optional[np.ndarray]:
+        """Agrega al final las barras nuevas; None si no hay nada que escribir"""
+        if len(fresh) == 0:
+            return None
+
+        # La última barra guardada puede haber sido parcial (mercado abierto), no se compara
+        finalized = stored[-OVERLAP_BARS:-1]
+        common, stored_idx, fresh_idx = np.intersect1d(finalized["date"], fresh["date"], return_indices=True)
+        if len(common) and not np.allclose(finalized["close"][stored_idx], fresh["close"][fresh_idx], rtol=1e-4):
+            logger.info(f"Serie de {ticker} reajustada en origen, se reconstruye el historial completo")
+            rebuilt = frame_to_bars(self.provider.get_history(ticker, period="max"))
+            if len(rebuilt) == 0:
+                # Descarga fallida o limitada: mejor el historial viejo que uno vacío
+                logger.warning(f"La descarga completa de {ticker} vino vacía, se conserva el historial guardado")
+                return None
+            return rebuilt
+
+        first_new = fresh["date"][0]
+        keep = stored[stored["date"] < first_new]
+        bars = np.concatenate([keep, fresh])
+        if len(bars) == len(stored) and np.array_equal(bars, stored):
+            return None
+        logger.info(f"Historial de {ticker} actualizado: {len(bars) - len(keep)} barras nuevas o revisadas")
+        return bars
+
+    def sync_many(self, tickers: List[str]) -> List[str]:
+        """
+        Sincroniza varios tickers; lo usa el proceso principal antes de mandar
+        trabajo al pool de cálculo, cuyos procesos sólo leen el disco
+
+        Los tickers sincronizados hace menos de sync_interval no se consultan.
+
+        Returns:
+            Tickers que quedaron sin datos (sin historial o con error al descargar)
+        """
+        def sync_one(ticker: str) -> bool:
+            try:
+                return self.sync(ticker) is not None
+            except Exception as e:
+                logger.warning(f"No se pudo sincronizar el historial de {ticker}: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=SYNC_MANY_CONCURRENCY, thread_name_prefix="price-sync") as executor:
+            synced = list(executor.map(sync_one, tickers))
+        return [ticker for ticker, ok in zip(tickers, synced) if not ok]
+
+    def get(self, ticker: str, period: str = "1y") -> np.ndarray:
+        """
+        Devuelve las barras del ticker para un período, sincronizando antes si hace falta
+
+        Args:
+            ticker: Símbolo de la acción
+            period: Período de tiempo ('1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max')
+
+        Returns:
+            Arreglo estructurado con las barras del período (vacío si no hay datos)
+        """
+        bars = self.sync(ticker)
+        if bars is None:
+            return np.empty(0, dtype=BAR_DTYPE)
+        as_of = pd.Timestamp(bars["date"][-1]) if self.provider.periods_from_last_bar and len(bars) else None
+        return slice_period(bars, period, as_of=as_of)
+
+
+# Almacén compartido por los servicios de datos históricos
+price_store = PriceStore()
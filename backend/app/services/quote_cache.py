@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+import os
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", "60"))
+QUOTE_CACHE_STALE_TTL = float(os.getenv("QUOTE_CACHE_STALE_TTL", "300"))
+QUOTE_CACHE_MAX_SIZE = int(os.getenv("QUOTE_CACHE_MAX_SIZE", "1000"))
+# Los fundamentales (nombre, market cap, P/E, sector...) cambian poco: TTL mucho más largo
+FUNDAMENTALS_CACHE_TTL = float(os.getenv("FUNDAMENTALS_CACHE_TTL", "21600"))
+FUNDAMENTALS_CACHE_STALE_TTL = float(os.getenv("FUNDAMENTALS_CACHE_STALE_TTL", "86400"))
+
+
+class QuoteCache:
+    """
+    Cache en memoria de cotizaciones por ticker con TTL, límite LRU y
+    stale-while-revalidate: una entrada vencida pero dentro de la ventana
+    `stale_ttl` se devuelve al instante y se refresca en segundo plano. Si la
+    recarga de una entrada ya vencida falla (p. ej. Yahoo limitando o circuito
+    abierto), se devuelve el último valor conocido en lugar del error.
+    """
+
+    def __init__(
+        self,
+        ttl: float = QUOTE_CACHE_TTL,
+        stale_ttl: float = QUOTE_CACHE_STALE_TTL,
+        max_size: int = QUOTE_CACHE_MAX_SIZE,
+        refresh_workers: int = 2,
+    ):
+        """
+        Args:
+            ttl: Segundos durante los que una cotización se considera fresca
+            stale_ttl: Segundos adicionales durante los que se sirve vencida mientras se refresca
+            max_size: Cantidad máxima de tickers en cache (se descarta el menos usado)
+            refresh_workers: Hilos dedicados a los refrescos en segundo plano
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix="quote-refresh"
+        )
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "evictions": 0, "fallbacks": 0}
+
+    def get_many(
+        self,
+        keys: List[str],
+        loader: Callable[[List[str]], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Devuelve los valores de `keys`, cargando de una sola vez los que faltan
+
+        Args:
+            keys: Tickers solicitados
+            loader: Función que recibe la lista de tickers faltantes y devuelve ticker -> valor
+
+        Returns:
+            Diccionario ticker -> valor para todos los tickers solicitados
+        """
+        found: Dict[str, Any] = {}
+        missing: List[str] = []
+        stale: List[str] = []
+        expired: Dict[str, Any] = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(key)
+                    self._counters["misses"] += 1
+                    continue
+                value, stored_at = entry
+                age = now - stored_at
+                if age <= self.ttl:
+                    self._counters["hits"] += 1
+                elif age <= self.ttl + self.stale_ttl:
+                    self._counters["stale_hits"] += 1
+                    stale.append(key)
+                else:
+                    missing.append(key)
+                    expired[key] = value
+                    self._counters["misses"] += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+
+        if stale:
+            self._schedule_refresh(stale, loader)
+
+        if missing:
+            loaded = loader(missing)
+            self.set_many(loaded)
+            found.update(loaded)
+            fallbacks = [
+                key for key in expired
+                if isinstance(loaded.get(key), dict) and "error" in loaded[key]
+            ]
+            for key in fallbacks:
+                found[key] = expired[key]
+            if fallbacks:
+                with self._lock:
+                    self._counters["fallbacks"] += len(fallbacks)
+
+        return found
+
+    def set_many(self, values: Dict[str, Any]) -> None:
+        """Guarda valores en cache; las cotizaciones con error no se guardan"""
+        now = time.monotonic()
+        with self._lock:
+            for key, value in values.items():
+                if isinstance(value, dict) and "error" in value:
+                    continue
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _schedule_refresh(self, keys: List[str], loader: Callable[[List[str]], Dict[str, Any]]) -> None:
+        """Refresca en segundo plano las entradas vencidas que no se estén refrescando ya"""
+        with self._lock:
+            pending = [key for key in keys if key not in self._refreshing]
+            self._refreshing.update(pending)
+        if not pending:
+            return
+
+        def refresh():
+            try:
+                self.set_many(loader(pending))
+                with self._lock:
+                    self._counters["refreshes"] += 1
+            except Exception as e:
+                logger.error(f"Error al refrescar cotizaciones {pending}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(pending)
+
+        self._refresh_executor.submit(refresh)
+
+    def invalidate(self, keys: Optional[List[str]] = None) -> None:
+        """Elimina las entradas indicadas, o todas si no se indica ninguna"""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos y configuración actual de la cache"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["stale_hits"] + counters["misses"]
+        return {
+            **counters,
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hit_ratio": round((counters["hits"] + counters["stale_hits"]) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Cache compartida por todos los endpoints de cotizaciones (precios)
+quote_cache = QuoteCache()
+
+# Cache de fundamentales (`.info`), separada de los precios
+fundamentals_cache = QuoteCache(ttl=FUNDAMENTALS_CACHE_TTL, stale_ttl=FUNDAMENTALS_CACHE_STALE_TTL)
@@ -0,0 +1,157 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional, Set
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.yahoo_finance_service import YahooFinanceService
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre dos refrescos compartidos de las cotizaciones suscriptas
+QUOTE_STREAM_INTERVAL = float(os.getenv("QUOTE_STREAM_INTERVAL", "5"))
+# Tickers máximos por suscripción (mismo límite que /stock-data)
+QUOTE_STREAM_MAX_TICKERS = 50
+
+
+class QuoteSubscription:
+    """Suscripción de un cliente: tickers seguidos, último estado enviado y cola de mensajes"""
+
+    def __init__(self, tickers: Iterable[str]):
+        self.tickers: Set[str] = set(tickers)
+        # Último valor enviado de cada campo, por ticker, para calcular los deltas
+        self.last_sent: Dict[str, Dict[str, Any]] = {}
+        # Cola de un solo mensaje: si el cliente es lento no se encola más, y el
+        # próximo delta acumula todos los cambios que todavía no recibió
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+
+class QuoteHub:
+    """
+    Distribuye cotizaciones a los clientes suscriptos (WebSocket o SSE).
+
+    Un único ciclo refresca la unión de tickers de todas las suscripciones (a
+    través de la cache compartida) y a cada cliente le envía sólo los campos que
+    cambiaron desde su último mensaje. El ciclo arranca con el primer suscriptor
+    y se detiene cuando no queda ninguno. Un campo que desaparece de la
+    cotización se envía en null para que el cliente lo borre.
+    """
+
+    def __init__(self, interval: float = QUOTE_STREAM_INTERVAL):
+        self.interval = interval
+        self._subscriptions: Set[QuoteSubscription] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._counters = {"upstream_refreshes": 0, "messages_sent": 0, "messages_skipped": 0}
+
+    def subscribe(self, tickers: Iterable[str] = ()) -> QuoteSubscription:
+        """Registra un cliente nuevo y arranca el ciclo de refresco si hace falta"""
+        subscription = QuoteSubscription(self._normalize(tickers))
+        self._subscriptions.add(subscription)
+        self._ensure_running()
+        return subscription
+
+    def update(self, subscription: QuoteSubscription, add: Iterable[str] = (), remove: Iterable[str] = ()) -> None:
+        """Agrega o quita tickers de una suscripción existente"""
+        removed = self._normalize(remove)
+        subscription.tickers.difference_update(removed)
+        for ticker in removed:
+            subscription.last_sent.pop(ticker, None)
+        added = self._normalize(add)
+        if len(subscription.tickers | added) > QUOTE_STREAM_MAX_TICKERS:
+            raise ValueError(f"Máximo {QUOTE_STREAM_MAX_TICKERS} tickers por suscripción")
+        subscription.tickers.update(added)
+        if added:
+            self._ensure_running()
+
+    def unsubscribe(self, subscription: QuoteSubscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    @staticmethod
+    def _normalize(tickers: Iterable[str]) -> Set[str]:
+        return {ticker.strip().upper() for ticker in tickers if ticker and ticker.strip()}
+
+    def _ensure_running(self) -> None:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        # Despertar el ciclo para que el cliente reciba su primer mensaje sin esperar el intervalo
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._subscriptions:
+            self._wake.clear()
+            tickers = sorted(set().union(*(s.tickers for s in self._subscriptions)))
+            if tickers:
+                try:
+                    quotes = await run_in_threadpool(YahooFinanceService.get_stock_data, tickers)
+                    self._counters["upstream_refreshes"] += 1
+                    self._fan_out({quote["ticker"].upper(): quote for quote in quotes})
+                except Exception as e:
+                    logger.error(f"Error al refrescar cotizaciones del stream: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+        self._task = None
+
+    def _fan_out(self, quotes: Dict[str, Dict[str, Any]]) -> None:
+        for subscription in list(self._subscriptions):
+            if subscription.queue.full():
+                self._counters["messages_skipped"] += 1
+                continue
+            changes = []
+            for ticker in subscription.tickers:
+                quote = quotes.get(ticker)
+                if quote is None:
+                    continue
+                previous = subscription.last_sent.get(ticker)
+                if previous is None:
+                    # Primer mensaje del ticker: cotización completa
+                    changed = dict(quote)
+                else:
+                    changed = {field: value for field, value in quote.items() if previous.get(field) != value}
+                    # Campos que ya no vienen (p. ej. error o partial al recuperarse): se envían en null
+                    changed.update({field: None for field in previous if field not in quote})
+                if changed:
+                    changes.append((ticker, changed))
+            if not changes:
+                continue
+            for ticker, changed in changes:
+                last_sent = subscription.last_sent.setdefault(ticker, {})
+                for field, value in changed.items():
+                    if value is None and field not in quotes[ticker]:
+                        last_sent.pop(field, None)
+                    else:
+                        last_sent[field] = value
+            subscription.queue.put_nowait({
+                "type": "quotes",
+                "quotes": [{"ticker": ticker, **changed} for ticker, changed in changes],
+            })
+            self._counters["messages_sent"] += 1
+
+    async def stop(self) -> None:
+        """Cancela el ciclo de refresco (al apagar la aplicación)"""
+        self._subscriptions.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "subscribers": len(self._subscriptions),
+            "tickers": len(set().union(*(s.tickers for s in self._subscriptions))) if self._subscriptions else 0,
+            "interval_seconds": self.interval,
+        }
+
+
+quote_hub = QuoteHub()
@@ -0,0 +1,187 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.price_store import PriceStore, price_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Desvío absoluto de peso (0-1) de un activo que dispara el rebalanceo por umbral
+REBALANCE_THRESHOLD = float(os.getenv("REBALANCE_THRESHOLD", "0.05"))
+# Días corridos entre rebalanceos con la regla de calendario
+REBALANCE_PERIOD_DAYS = int(os.getenv("REBALANCE_PERIOD_DAYS", "90"))
+# Operaciones menores a este peso (0-1) no se emiten; su neto lo absorbe la mayor del portafolio
+REBALANCE_MIN_TRADE = float(os.getenv("REBALANCE_MIN_TRADE", "0.005"))
+
+# Reglas de disparo disponibles
+REBALANCE_RULES = ("threshold", "calendar")
+
+
+def _anchor_date(portfolio: Dict[str, Any]) -> Optional[pd.Timestamp]:
+    """Fecha desde la que se mide la deriva: último rebalanceo o, si no hubo, la generación"""
+    value = portfolio.get("last_rebalanced_at") or portfolio.get("generated_at")
+    if isinstance(value, dict):
+        value = value.get("$date")
+    try:
+        return pd.Timestamp(value).tz_localize(None).normalize() if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RebalancingEngine:
+    """
+    Deriva y operaciones de rebalanceo de todos los portafolios a la vez.
+
+    Los portafolios se cargan en una matriz de pesos objetivo (portafolios x
+    tickers). Para cada fecha de anclaje distinta se arma un vector de retornos
+    brutos de precio (último cierre / cierre de la fecha), y los pesos actuales
+    salen de una sola operación vectorizada sobre toda la matriz.
+    """
+
+    def __init__(self, store: Optional[PriceStore] = None):
+        """
+        Args:
+            store: Almacén de precios diarios (por defecto el compartido)
+        """
+        self.store = store or price_store
+
+    def _closes(self, tickers: List[str]) -> Dict[str, np.ndarray]:
+        series = {}
+        for ticker in tickers:
+            try:
+                bars = self.store.get(ticker, "max")
+            except Exception as e:
+                logger.error(f"Error al leer precios de {ticker} para el rebalanceo: {str(e)}")
+                continue
+            if len(bars):
+                series[ticker] = bars
+        return series
+
+    def plan(
+        self,
+        portfolios: List[Dict[str, Any]],
+        rule: str = "threshold",
+        threshold: float = REBALANCE_THRESHOLD,
+        period_days: int = REBALANCE_PERIOD_DAYS,
+        min_trade: float = REBALANCE_MIN_TRADE,
+        only_triggered: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Calcula la deriva de cada portafolio y la lista mínima de operaciones
+
+        Args:
+            portfolios: Documentos con '_id', 'assets' y 'generated_at' (y opcionalmente
+                'user_id' y 'last_rebalanced_at')
+            rule: 'threshold' (algún activo se desvió al menos `threshold`) o
+                'calendar' (pasaron al menos `period_days` desde el anclaje)
+            threshold: Desvío absoluto de peso que dispara la regla de umbral
+            period_days: Días corridos de la regla de calendario
+            min_trade: Peso mínimo de una operación
+            only_triggered: Devolver sólo los portafolios que hay que rebalancear
+
+        Returns:
+            Diccionario con as_of, evaluated, triggered, missing_prices y el detalle
+            por portafolio (deriva máxima, rotación y operaciones en puntos porcentuales)
+
+        Raises:
+            ValueError: Si la regla no existe
+        """
+        if rule not in REBALANCE_RULES:
+            raise ValueError(f"Regla desconocida: {rule}. Opciones: {', '.join(REBALANCE_RULES)}")
+
+        tickers = sorted({asset["ticker"] for p in portfolios for asset in p.get("assets") or [] if asset.get("ticker")})
+        columns = {ticker: col for col, ticker in enumerate(tickers)}
+        targets = np.zeros((len(portfolios), len(tickers)))
+        for row, portfolio in enumerate(portfolios):
+            for asset in portfolio.get("assets") or []:
+                if asset.get("ticker") in columns:
+                    targets[row, columns[asset["ticker"]]] += float(asset.get("allocation_pct") or 0.0) / 100.0
+        totals = targets.sum(axis=1, keepdims=True)
+        targets = np.divide(targets, totals, out=np.zeros_like(targets), where=totals > 0)
+
+        series = self._closes(tickers)
+        as_of = max((pd.Timestamp(bars["date"][-1]) for bars in series.values()), default=pd.Timestamp(datetime.utcnow()))
+        as_of = as_of.normalize()
+        anchors = [_anchor_date(portfolio) or as_of for portfolio in portfolios]
+
+        # Una fila de retornos brutos por fecha de anclaje distinta (sin precios: retorno 1)
+        anchor_dates, anchor_index = np.unique(np.array(anchors, dtype="datetime64[D]"), return_inverse=True)
+        gross = np.ones((len(anchor_dates), len(tickers)))
+        for ticker, bars in series.items():
+            dates = bars["date"].astype("datetime64[D]")
+            positions = np.clip(np.searchsorted(dates, anchor_dates, side="right") - 1, 0, len(bars) - 1)
+            gross[:, columns[ticker]] = bars["close"][-1] / bars["close"][positions]
+
+        values = targets * gross[anchor_index]
+        totals = values.sum(axis=1, keepdims=True)
+        current = np.divide(values, totals, out=np.zeros_like(values), where=totals > 0)
+        drift = current - targets
+        max_drift = np.abs(drift).max(axis=1) if len(tickers) else np.zeros(len(portfolios))
+
+        if rule == "threshold":
+            triggered = max_drift >= threshold
+        else:
+            age_days = (np.datetime64(as_of.date(), "D") - anchor_dates[anchor_index]).astype(int)
+            triggered = age_days >= period_days
+        triggered &= totals[:, 0] > 0
+
+        # Operaciones: volver al objetivo, sin polvo; el neto descartado va a la mayor operación
+        trades = np.where(triggered[:, None], -drift, 0.0)
+        dust = np.abs(trades) < min_trade
+        residual = np.where(dust, trades, 0.0).sum(axis=1)
+        trades[dust] = 0.0
+        if len(tickers):
+            largest = np.abs(trades).argmax(axis=1)
+            trades[np.arange(len(portfolios)), largest] += np.where(triggered, residual, 0.0)
+        turnover = np.abs(trades).sum(axis=1) / 2.0
+
+        details = []
+        for row in np.flatnonzero(triggered) if only_triggered else range(len(portfolios)):
+            held = np.flatnonzero((targets[row] > 0) | (trades[row] != 0))
+            order = held[np.argsort(-np.abs(trades[row, held]))]
+            details.append({
+                "_id": str(portfolios[row]["_id"]),
+                "user_id": portfolios[row].get("user_id"),
+                "anchor_date": str(anchor_dates[anchor_index[row]]),
+                "triggered": bool(triggered[row]),
+                "max_drift_pct": round(float(max_drift[row]) * 100, 2),
+                "turnover_pct": round(float(turnover[row]) * 100, 2),
+                "drift": {tickers[col]: round(float(drift[row, col]) * 100, 2) for col in held},
+                "trades": [
+                    {
+                        "ticker": tickers[col],
+                        "action": "buy" if trades[row, col] > 0 else "sell",
+                        "weight_pct": round(abs(float(trades[row, col])) * 100, 2),
+                    }
+                    for col in order
+                    if trades[row, col] != 0
+                ],
+            })
+
+        logger.info(
+            f"Rebalanceo ({rule}) de {len(portfolios)} portafolios al {as_of.date()}: "
+            f"{int(triggered.sum())} superan la regla"
+        )
+        return {
+            "as_of": str(as_of.date()),
+            "rule": rule,
+            "evaluated": len(portfolios),
+            "triggered": int(triggered.sum()),
+            "missing_prices": [ticker for ticker in tickers if ticker not in series],
+            "portfolios": details,
+        }
+
+
+def plan_rebalancing(portfolios: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+    """Plan de rebalanceo con el motor compartido (función de módulo, para el pool de procesos)"""
+    return rebalancing_engine.plan(portfolios, **options)
+
+
+# Motor compartido por las rutas de administración
+rebalancing_engine = RebalancingEngine()
@@ -0,0 +1,147 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.price_store import PriceStore, price_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Segundos durante los que se reutiliza una matriz de retornos (por defecto, lo mismo que tarda en re-sincronizarse el almacén)
+RETURNS_CACHE_TTL = float(os.getenv("RETURNS_CACHE_TTL", os.getenv("PRICE_STORE_SYNC_INTERVAL", "900")))
+# Período de historia usado para estimar retornos y covarianzas
+RETURNS_LOOKBACK = os.getenv("RETURNS_LOOKBACK", "3y")
+# Sesiones por año para anualizar
+TRADING_DAYS = 252
+# Cantidad mínima de retornos diarios en común para considerar válida la matriz
+MIN_OBSERVATIONS = 60
+# En las matrices de muchos portafolios, fracción mínima de la historia más larga
+# que debe cubrir un activo (uno recién listado acortaría la ventana de todos)
+BATCH_MIN_HISTORY = 0.8
+
+
+class ReturnMatrix:
+    """
+    Retornos diarios alineados por fecha de un conjunto de tickers, con la media
+    y la covarianza anualizadas ya calculadas.
+    """
+
+    def __init__(self, tickers: List[str], dates: np.ndarray, returns: np.ndarray):
+        """
+        Args:
+            tickers: Tickers en el orden de las columnas
+            dates: Fecha de cada fila de retornos (la del cierre final)
+            returns: Matriz (días x tickers) de retornos simples diarios
+        """
+        self.tickers = tickers
+        self.dates = dates
+        self.returns = returns
+        self.mean = returns.mean(axis=0) * TRADING_DAYS
+        self.cov = np.cov(returns, rowvar=False) * TRADING_DAYS
+        self.built_at = time.monotonic()
+
+    @property
+    def observations(self) -> int:
+        return len(self.returns)
+
+
+def align_closes(series: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Alinea los cierres de varios tickers en las fechas que tienen todos en común
+
+    Args:
+        series: ticker -> barras (arreglo estructurado con 'date' y 'close')
+
+    Returns:
+        Tupla (fechas comunes, matriz fechas x tickers de cierres) en el orden de `series`
+    """
+    common = None
+    for bars in series.values():
+        common = bars["date"] if common is None else np.intersect1d(common, bars["date"], assume_unique=True)
+    closes = np.empty((len(common), len(series)))
+    for col, bars in enumerate(series.values()):
+        closes[:, col] = bars["close"][np.searchsorted(bars["date"], common)]
+    return common, closes
+
+
+class ReturnMatrixCache:
+    """
+    Cache de matrices de retornos construidas desde el almacén de precios, para
+    que los optimizadores no toquen la red ni relean archivos en cada solicitud.
+    """
+
+    def __init__(self, store: Optional[PriceStore] = None, ttl: float = RETURNS_CACHE_TTL):
+        self.store = store or price_store
+        self.ttl = ttl
+        self._entries: Dict[Tuple[Tuple[str, ...], str, Optional[float]], ReturnMatrix] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tickers: List[str], lookback: str = RETURNS_LOOKBACK, min_history: Optional[float] = None) -> ReturnMatrix:
+        """
+        Devuelve la matriz de retornos de los tickers (los que no tienen datos se omiten)
+
+        Args:
+            tickers: Tickers del universo
+            lookback: Período de historia ('1y', '3y', '5y', ...)
+            min_history: Si se indica, también se omiten los tickers cuya historia
+                cubre menos que esta fracción de la más larga (ver BATCH_MIN_HISTORY)
+
+        Raises:
+            ValueError: Si quedan menos de dos tickers con datos o muy pocos días en común
+        """
+        key = (tuple(tickers), lookback, min_history)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and time.monotonic() - cached.built_at < self.ttl:
+                return cached
+
+        matrix = self._build(tickers, lookback, min_history)
+        with self._lock:
+            self._entries[key] = matrix
+        return matrix
+
+    def _build(self, tickers: List[str], lookback: str, min_history: Optional[float] = None) -> ReturnMatrix:
+        series = {}
+        for ticker in tickers:
+            try:
+                bars = self.store.get(ticker, lookback)
+            except Exception as e:
+                logger.error(f"Error al leer precios de {ticker} para la matriz de retornos: {str(e)}")
+                continue
+            if len(bars) > 1:
+                series[ticker] = bars
+            else:
+                logger.warning(f"Sin historial suficiente para {ticker}, se excluye de la matriz de retornos")
+
+        if min_history is not None and series:
+            last = max(bars["date"][-1] for bars in series.values())
+            spans = {ticker: last - bars["date"][0] for ticker, bars in series.items()}
+            longest = max(spans.values())
+            for ticker, span in spans.items():
+                if span < min_history * longest:
+                    logger.warning(f"Historial de {ticker} demasiado corto ({span}), se excluye de la matriz de retornos")
+                    del series[ticker]
+
+        if len(series) < 2:
+            raise ValueError("Se necesitan al menos dos activos con historial para armar la matriz de retornos")
+
+        dates, closes = align_closes(series)
+        if len(dates) <= MIN_OBSERVATIONS:
+            raise ValueError(f"Sólo hay {max(len(dates) - 1, 0)} retornos diarios en común (mínimo {MIN_OBSERVATIONS})")
+
+        returns = closes[1:] / closes[:-1] - 1.0
+        logger.info(f"Matriz de retornos construida: {len(series)} activos x {len(returns)} días")
+        return ReturnMatrix(list(series), dates[1:], returns)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Cache compartida por los servicios de optimización y riesgo
+return_matrix_cache = ReturnMatrixCache()
@@ -0,0 +1,217 @@
+import hashlib
+from datetime import datetime
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.frontier_table import RISK_FREE_RATE
+from app.services.return_matrix import BATCH_MIN_HISTORY, TRADING_DAYS, ReturnMatrixCache, return_matrix_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Período de historia sobre el que se miden los riesgos realizados
+RISK_LOOKBACK = os.getenv("RISK_LOOKBACK", "1y")
+# Nivel de confianza del VaR/CVaR diario
+RISK_VAR_CONFIDENCE = float(os.getenv("RISK_VAR_CONFIDENCE", "0.95"))
+# Índice de referencia para la beta
+RISK_BENCHMARK = os.getenv("RISK_BENCHMARK", "SPY")
+# Portafolios por bloque en el modo masivo (acota la matriz días x portafolios en memoria)
+RISK_CHUNK_PORTFOLIOS = 2048
+
+
+def portfolio_weights(assets: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Pesos (0-1) por ticker a partir de las asignaciones porcentuales del portafolio"""
+    weights: Dict[str, float] = {}
+    for asset in assets or []:
+        ticker = asset.get("ticker")
+        if ticker:
+            weights[ticker] = weights.get(ticker, 0.0) + float(asset.get("allocation_pct") or 0.0) / 100.0
+    return weights
+
+
+def weights_fingerprint(weights: Dict[str, float]) -> str:
+    """Huella de la composición: si cambian los pesos, las métricas guardadas dejan de valer"""
+    canonical = ",".join(f"{ticker}:{weight:.6f}" for ticker, weight in sorted(weights.items()))
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def compute_risk_metrics(
+    returns: np.ndarray,
+    weights: np.ndarray,
+    benchmark: Optional[np.ndarray] = None,
+    confidence: float = RISK_VAR_CONFIDENCE,
+    risk_free: float = RISK_FREE_RATE,
+) -> Dict[str, np.ndarray]:
+    """
+    Métricas de riesgo de muchos portafolios a la vez con operaciones matriciales
+
+    Args:
+        returns: Retornos diarios de los activos (días x activos)
+        weights: Pesos de cada portafolio (portafolios x activos, filas que suman 1)
+        benchmark: Retornos diarios del índice de referencia (días), para la beta
+        confidence: Nivel de confianza del VaR/CVaR
+        risk_free: Tasa libre de riesgo anual del Sharpe
+
+    Returns:
+        Arreglos (uno por portafolio) de volatilidad y retorno anualizados, Sharpe,
+        VaR y CVaR diarios históricos y paramétricos (como pérdida positiva),
+        máxima caída y beta (NaN sin índice de referencia)
+    """
+    series = returns @ weights.T  # días x portafolios
+    daily_mean = series.mean(axis=0)
+    daily_std = series.std(axis=0, ddof=1)
+    volatility = daily_std * np.sqrt(TRADING_DAYS)
+    annual_return = daily_mean * TRADING_DAYS
+    sharpe = np.divide(annual_return - risk_free, volatility, out=np.zeros_like(volatility), where=volatility > 0)
+
+    # Históricos: cuantil empírico de las pérdidas y promedio de la cola que lo supera
+    var_historical = -np.quantile(series, 1.0 - confidence, axis=0)
+    tail = series <= -var_historical
+    cvar_historical = -np.where(tail, series, 0.0).sum(axis=0) / np.maximum(tail.sum(axis=0), 1)
+
+    # Paramétricos: retornos normales con la media y el desvío observados
+    z = NormalDist().inv_cdf(1.0 - confidence)
+    var_parametric = -(daily_mean + z * daily_std)
+    cvar_parametric = -(daily_mean - daily_std * NormalDist().pdf(z) / (1.0 - confidence))
+
+    wealth = np.cumprod(1.0 + series, axis=0)
+    peaks = np.maximum.accumulate(np.maximum(wealth, 1.0), axis=0)
+    max_drawdown = (1.0 - wealth / peaks).max(axis=0)
+
+    if benchmark is not None and benchmark.var(ddof=1) > 0:
+        centered = benchmark - benchmark.mean()
+        beta = centered @ (series - daily_mean) / (len(benchmark) - 1) / benchmark.var(ddof=1)
+    else:
+        beta = np.full(len(weights), np.nan)
+
+    return {
+        "volatility": volatility,
+        "annual_return": annual_return,
+        "sharpe_ratio": sharpe,
+        "var_historical": var_historical,
+        "cvar_historical": cvar_historical,
+        "var_parametric": var_parametric,
+        "cvar_parametric": cvar_parametric,
+        "max_drawdown": max_drawdown,
+        "beta": beta,
+    }
+
+
+class RiskEngine:
+    """
+    Métricas de riesgo realizadas de portafolios guardados, desde los retornos
+    diarios cacheados del almacén de precios.
+
+    El resultado de cada portafolio vale para una fecha de cierre (as_of) y una
+    composición (huella de pesos): quien lo guarda junto al portafolio puede
+    pasarlo de vuelta en 'risk_metrics' y sólo se recalculan los que cambiaron.
+    """
+
+    def __init__(
+        self,
+        matrices: Optional[ReturnMatrixCache] = None,
+        lookback: str = RISK_LOOKBACK,
+        benchmark: Optional[str] = RISK_BENCHMARK,
+        confidence: float = RISK_VAR_CONFIDENCE,
+        risk_free: float = RISK_FREE_RATE,
+    ):
+        """
+        Args:
+            matrices: Cache de matrices de retornos (por defecto la compartida)
+            lookback: Período de historia ('6mo', '1y', '3y', ...)
+            benchmark: Ticker del índice de referencia para la beta (None para omitirla)
+            confidence: Nivel de confianza del VaR/CVaR
+            risk_free: Tasa libre de riesgo anual
+        """
+        self.matrices = matrices or return_matrix_cache
+        self.lookback = lookback
+        self.benchmark = benchmark
+        self.confidence = confidence
+        self.risk_free = risk_free
+
+    def score(self, portfolios: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Métricas de riesgo de varios portafolios en una sola pasada
+
+        Con varios portafolios, los activos de historia corta (ver
+        BATCH_MIN_HISTORY) se excluyen como los que no tienen datos, para que
+        no acorten la ventana de todos; cada resultado informa su cobertura y
+        los activos excluidos.
+
+        Args:
+            portfolios: Documentos con '_id', 'assets' y opcionalmente las
+                'risk_metrics' guardadas de una evaluación anterior
+
+        Returns:
+            _id (str) -> métricas. Las que se calcularon ahora llevan 'computed_at';
+            las reutilizadas se devuelven tal cual estaban guardadas.
+
+        Raises:
+            ValueError: Si no hay historial suficiente para ningún activo
+        """
+        weights = {str(p["_id"]): portfolio_weights(p.get("assets")) for p in portfolios}
+        universe = sorted(set().union(*weights.values()) | ({self.benchmark} if self.benchmark else set()))
+        matrix = self.matrices.get(universe, self.lookback, BATCH_MIN_HISTORY if len(portfolios) > 1 else None)
+        as_of = str(pd.Timestamp(matrix.dates[-1]).date())
+
+        results: Dict[str, Dict[str, Any]] = {}
+        stale = []
+        for portfolio in portfolios:
+            portfolio_id = str(portfolio["_id"])
+            fingerprint = weights_fingerprint(weights[portfolio_id])
+            saved = portfolio.get("risk_metrics") or {}
+            if saved.get("as_of") == as_of and saved.get("fingerprint") == fingerprint:
+                results[portfolio_id] = saved
+            else:
+                stale.append((portfolio_id, fingerprint))
+
+        columns = {ticker: col for col, ticker in enumerate(matrix.tickers)}
+        benchmark = matrix.returns[:, columns[self.benchmark]] if self.benchmark in columns else None
+        for start in range(0, len(stale), RISK_CHUNK_PORTFOLIOS):
+            chunk = stale[start:start + RISK_CHUNK_PORTFOLIOS]
+            matrix_weights = np.zeros((len(chunk), len(matrix.tickers)))
+            for row, (portfolio_id, _) in enumerate(chunk):
+                for ticker, weight in weights[portfolio_id].items():
+                    if ticker in columns:
+                        matrix_weights[row, columns[ticker]] += weight
+            # Los activos sin historial se excluyen y el resto se reescala; se informa la cobertura
+            coverage = matrix_weights.sum(axis=1)
+            priced = coverage > 0
+            matrix_weights[priced] /= coverage[priced, None]
+            metrics = compute_risk_metrics(matrix.returns, matrix_weights, benchmark, self.confidence, self.risk_free)
+
+            computed_at = datetime.utcnow().isoformat()
+            for row, (portfolio_id, fingerprint) in enumerate(chunk):
+                result = {
+                    "as_of": as_of,
+                    "fingerprint": fingerprint,
+                    "lookback": self.lookback,
+                    "observations": matrix.observations,
+                    "confidence": self.confidence,
+                    "benchmark": self.benchmark if benchmark is not None else None,
+                    "coverage": round(float(coverage[row]), 4),
+                    "excluded": sorted(ticker for ticker in weights[portfolio_id] if ticker not in columns),
+                    "computed_at": computed_at,
+                }
+                for name, values in metrics.items():
+                    value = float(values[row])
+                    result[name] = round(value, 6) if priced[row] and np.isfinite(value) else None
+                results[portfolio_id] = result
+
+        logger.info(f"Riesgo de {len(portfolios)} portafolios al {as_of}: {len(stale)} recalculados")
+        return results
+
+
+def score_portfolios(portfolios: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Métricas de riesgo con el motor compartido (función de módulo, para el pool de procesos)"""
+    return risk_engine.score(portfolios)
+
+
+# Motor compartido por las rutas de portafolio y de administración
+risk_engine = RiskEngine()
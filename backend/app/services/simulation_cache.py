@@ -0,0 +1,180 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.database import db
+from app.services.monte_carlo import MonteCarloEngine, monte_carlo_engine, resolve_simulation_params
+from app.services.risk_metrics import portfolio_weights
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Resultados que se mantienen en memoria (se descarta el menos usado)
+SIMULATION_CACHE_MAX_SIZE = int(os.getenv("SIMULATION_CACHE_MAX_SIZE", "256"))
+# Horas que un resultado sigue valiendo (en memoria y en Mongo, que lo borra al vencer)
+SIMULATION_CACHE_TTL_HOURS = float(os.getenv("SIMULATION_CACHE_TTL_HOURS", "24"))
+# Subir cuando cambie el motor de simulación: invalida todas las claves anteriores
+SIMULATION_CACHE_VERSION = 1
+
+
+def simulation_key(weights: Dict[str, float], params: Dict[str, Any], market_version: str) -> str:
+    """
+    Clave de contenido de una simulación: hash de los pesos, los parámetros y
+    la versión de los datos de mercado con que se calibra
+
+    Args:
+        weights: Pesos (0-1) por ticker
+        params: Parámetros efectivos; seed None significa "cualquier semilla"
+        market_version: Versión de la matriz de retornos (ver SimulationCache.market_version)
+    """
+    canonical = json.dumps(
+        {
+            "version": SIMULATION_CACHE_VERSION,
+            "weights": {ticker: round(weight, 6) for ticker, weight in sorted(weights.items()) if weight},
+            "params": params,
+            "market": market_version,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class SimulationCache:
+    """
+    Cache de resultados de simulación direccionada por contenido.
+
+    Un LRU en memoria atiende las repeticiones en este proceso; detrás, la
+    colección simulation_cache (con índice TTL sobre expire_at) comparte los
+    resultados entre workers y reinicios. La clave incluye la versión de los
+    datos de mercado (último cierre y cantidad de retornos de la matriz con que
+    se calibra), así que un cierre nuevo invalida las entradas sin borrarlas.
+
+    Se guarda lo mismo que devuelve el motor: bandas de percentiles,
+    percentiles e histograma del valor final; nunca los caminos.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[MonteCarloEngine] = None,
+        max_size: int = SIMULATION_CACHE_MAX_SIZE,
+        ttl_hours: float = SIMULATION_CACHE_TTL_HOURS,
+    ):
+        """
+        Args:
+            engine: Motor cuyos resultados se cachean (define la calibración)
+            max_size: Entradas máximas en memoria
+            ttl_hours: Horas de validez de un resultado
+        """
+        self.engine = engine or monte_carlo_engine
+        self.max_size = max_size
+        self.ttl = timedelta(hours=ttl_hours)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "store_hits": 0, "misses": 0, "evictions": 0}
+
+    def start(self) -> None:
+        """Crea el índice TTL de la colección"""
+        try:
+            db.simulation_cache.create_index("expire_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"No se pudo preparar la colección simulation_cache: {str(e)}")
+
+    def market_version(self, tickers: List[str]) -> Optional[str]:
+        """Versión de los datos de mercado de la calibración, o None si no hay historial"""
+        try:
+            matrix = self.engine.matrices.get(sorted(tickers), self.engine.lookback)
+        except ValueError:
+            return None
+        last_close = pd.Timestamp(matrix.dates[-1]).date()
+        return f"{self.engine.lookback}:{last_close}:{matrix.observations}:{','.join(matrix.tickers)}"
+
+    def key_for(self, assets: List[Dict[str, Any]], params: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Clave de la simulación pedida, o None si no se puede cachear
+
+        Sin semilla en la solicitud, la clave no la incluye: cualquier corrida con
+        los mismos parámetros sirve, y la respuesta trae la semilla usada para
+        repetirla.
+
+        Raises:
+            ValueError: Si los parámetros son inválidos
+        """
+        resolved = resolve_simulation_params(params)
+        if (params or {}).get("seed") is None:
+            resolved["seed"] = None
+        weights = portfolio_weights(assets)
+        version = self.market_version(list(weights))
+        return simulation_key(weights, resolved, version) if version else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Entrada {params, result, cached_at} o None si no existe o venció"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        try:
+            document = db.simulation_cache.find_one({"_id": key, "expire_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            logger.error(f"Error al leer la cache de simulaciones: {str(e)}")
+            document = None
+        if document is None:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+
+        expire_at = document.pop("expire_at")
+        document.pop("_id")
+        remaining = (expire_at - datetime.utcnow()).total_seconds()
+        with self._lock:
+            self._counters["store_hits"] += 1
+            self._remember(key, now + remaining, document)
+        return document
+
+    def put(self, key: str, params: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """Guarda el resultado (sin los parámetros) de una simulación recién calculada"""
+        cached_at = datetime.utcnow()
+        entry = {"params": params, "result": result, "cached_at": cached_at.isoformat()}
+        with self._lock:
+            self._remember(key, time.time() + self.ttl.total_seconds(), entry)
+        try:
+            db.simulation_cache.replace_one(
+                {"_id": key}, {**entry, "expire_at": cached_at + self.ttl}, upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error al guardar en la cache de simulaciones: {str(e)}")
+
+    def _remember(self, key: str, expires: float, entry: Dict[str, Any]) -> None:
+        self._entries[key] = (expires, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """Vacía la cache en memoria (las entradas en Mongo vencen solas)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, **self._counters}
+
+
+# Cache compartida por las rutas y la cola de simulaciones
+simulation_cache = SimulationCache()
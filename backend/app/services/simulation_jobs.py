@@ -0,0 +1,292 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.database import db
+from app.services.compute_pool import ComputePool, ComputePoolSaturated, ComputeTimeout, compute_pool
+from app.services.monte_carlo import SimulationCancelled, monte_carlo_engine, resolve_simulation_params
+from app.services.simulation_cache import SimulationCache, simulation_cache
+from app.services.simulation_store import simulation_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Trabajos en curso (en cola o ejecutándose) permitidos por usuario
+SIMULATION_JOBS_PER_USER = int(os.getenv("SIMULATION_JOBS_PER_USER", "2"))
+# Horas que se conserva un trabajo terminado antes de que Mongo lo borre
+SIMULATION_JOB_RETENTION_HOURS = float(os.getenv("SIMULATION_JOB_RETENTION_HOURS", "24"))
+# Segundos máximos de ejecución de un trabajo
+SIMULATION_JOB_TIMEOUT = float(os.getenv("SIMULATION_JOB_TIMEOUT", "900"))
+# Segundos entre actualizaciones de progreso (y controles de cancelación) en Mongo
+SIMULATION_JOB_POLL_SECONDS = 1.0
+# Un trabajo activo sin latido durante este tiempo quedó huérfano (su proceso se reinició)
+SIMULATION_JOB_STALE_SECONDS = 60
+
+# Estados de un trabajo
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobLimitExceeded(Exception):
+    """El usuario ya tiene el máximo de trabajos en curso"""
+
+
+def simulate_with_progress(assets: List[Dict[str, Any]], params: Dict[str, Any], progress, cancel) -> Dict[str, Any]:
+    """
+    Simulación para el pool de procesos que informa el avance y atiende la cancelación
+
+    Args:
+        assets: Activos del portafolio
+        params: Parámetros de la simulación
+        progress: Valor compartido con los caminos terminados
+        cancel: Evento compartido; si se activa, la simulación se corta al terminar el grupo de caminos
+
+    Raises:
+        SimulationCancelled: Si se pidió cancelar
+    """
+    def report(done: int, total: int, bands) -> None:
+        progress.value = done
+        if cancel.is_set():
+            raise SimulationCancelled()
+
+    return monte_carlo_engine.simulate(assets, params, progress=report)
+
+
+class SimulationJobManager:
+    """
+    Cola de trabajos de simulación en segundo plano.
+
+    Cada trabajo es una tarea asyncio del proceso de la API que delega el
+    cálculo en el pool de procesos; el estado, el avance y el resultado quedan
+    en la colección simulation_jobs, así que cualquier worker del servidor puede
+    responder la consulta o registrar una cancelación. El avance y la cancelación
+    cruzan al proceso de cálculo con objetos compartidos del Manager del pool.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[ComputePool] = None,
+        per_user: int = SIMULATION_JOBS_PER_USER,
+        retention_hours: float = SIMULATION_JOB_RETENTION_HOURS,
+        timeout: float = SIMULATION_JOB_TIMEOUT,
+        cache: Optional[SimulationCache] = None,
+    ):
+        """
+        Args:
+            pool: Pool de cálculo (por defecto el compartido)
+            per_user: Trabajos en curso permitidos por usuario
+            retention_hours: Horas que se conservan los trabajos terminados
+            timeout: Segundos máximos de ejecución de un trabajo
+            cache: Cache de resultados (por defecto la compartida)
+        """
+        self.pool = pool or compute_pool
+        self.per_user = per_user
+        self.retention = timedelta(hours=retention_hours)
+        self.timeout = timeout
+        self.cache = cache or simulation_cache
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self) -> None:
+        """Prepara la colección y marca como fallidos los trabajos huérfanos de un reinicio"""
+        try:
+            # Mongo borra los trabajos terminados al llegar a expire_at
+            db.simulation_jobs.create_index("expire_at", expireAfterSeconds=0)
+            db.simulation_jobs.create_index([("user_id", 1), ("status", 1)])
+            now = datetime.utcnow()
+            interrupted = db.simulation_jobs.update_many(
+                {
+                    "status": {"$in": list(ACTIVE_STATUSES)},
+                    "heartbeat_at": {"$lt": now - timedelta(seconds=SIMULATION_JOB_STALE_SECONDS)},
+                },
+                {"$set": {
+                    "status": "failed",
+                    "error": "Interrumpido por un reinicio del servidor",
+                    "finished_at": now,
+                    "expire_at": now + self.retention,
+                }},
+            )
+            if interrupted.modified_count:
+                logger.warning(f"{interrupted.modified_count} trabajos de simulación interrumpidos marcados como fallidos")
+        except Exception as e:
+            logger.error(f"No se pudo preparar la colección de trabajos de simulación: {str(e)}")
+
+    async def stop(self) -> None:
+        """Cancela los trabajos de este proceso"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    def _shared(self):
+        manager = self.pool.manager()
+        return manager.Value("i", 0), manager.Event()
+
+    async def submit(self, user_id: str, portfolio_id: str, assets: List[Dict[str, Any]], params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Registra un trabajo y lo lanza en segundo plano
+
+        Si el resultado ya está en la cache, el trabajo se registra terminado
+        (cached=True) sin pasar por el pool.
+
+        Returns:
+            Documento del trabajo en estado 'queued' (o 'completed' si vino de la cache)
+
+        Raises:
+            ValueError: Si los parámetros son inválidos
+            JobLimitExceeded: Si el usuario ya tiene el máximo de trabajos en curso
+        """
+        # La clave arma la matriz de retornos (puede leer disco o la red): fuera del event loop
+        cache_key = await asyncio.to_thread(self.cache.key_for, assets, params)
+        params = resolve_simulation_params(params)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached:
+            now = datetime.utcnow()
+            job = {
+                "user_id": user_id,
+                "portfolio_id": portfolio_id,
+                "params": cached["params"],
+                "status": "completed",
+                "cached": True,
+                "progress": {"done": cached["params"]["paths"], "total": cached["params"]["paths"]},
+                "result": cached["result"],
+                "created_at": now,
+                "finished_at": now,
+                "expire_at": now + self.retention,
+            }
+            job["_id"] = db.simulation_jobs.insert_one(job).inserted_id
+            simulation_store.save(user_id, portfolio_id, cached["params"], cached["result"], job_id=str(job["_id"]), cached=True)
+            return job
+
+        active = db.simulation_jobs.count_documents({"user_id": user_id, "status": {"$in": list(ACTIVE_STATUSES)}})
+        if active >= self.per_user:
+            raise JobLimitExceeded(f"Máximo {self.per_user} simulaciones en curso por usuario")
+
+        job = {
+            "user_id": user_id,
+            "portfolio_id": portfolio_id,
+            "params": params,
+            "status": "queued",
+            "progress": {"done": 0, "total": params["paths"]},
+            "cancel_requested": False,
+            "created_at": datetime.utcnow(),
+            "heartbeat_at": datetime.utcnow(),
+        }
+        job["_id"] = db.simulation_jobs.insert_one(job).inserted_id
+        job_id = str(job["_id"])
+        self._tasks[job_id] = asyncio.create_task(self._run(job["_id"], assets, params, cache_key))
+        self._tasks[job_id].add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        logger.info(f"Trabajo de simulación {job_id} encolado ({params['method']}, {params['paths']} caminos)")
+        return job
+
+    def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Trabajo por id (del usuario, si se indica) o None"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        query = {"_id": ObjectId(job_id)}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return db.simulation_jobs.find_one(query)
+
+    def list_jobs(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Trabajos del usuario, los más recientes primero (sin el resultado)"""
+        return list(
+            db.simulation_jobs.find({"user_id": user_id}, {"result": 0}).sort("created_at", -1).limit(limit)
+        )
+
+    def cancel(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Pide cancelar un trabajo en curso; el proceso que lo ejecuta lo detiene en
+        su próximo control de avance
+
+        Returns:
+            Documento actualizado, o None si no existe o no es del usuario
+        """
+        job = self.get(job_id, user_id)
+        if job is None:
+            return None
+        if job["status"] in ACTIVE_STATUSES:
+            db.simulation_jobs.update_one({"_id": job["_id"]}, {"$set": {"cancel_requested": True}})
+            task = self._tasks.get(job_id)
+            if task is not None and job["status"] == "queued":
+                # Todavía no entró al pool: alcanza con cancelar la tarea
+                task.cancel()
+            job = self.get(job_id, user_id)
+        return job
+
+    def _finish(self, job_id: ObjectId, status: str, **fields: Any) -> None:
+        now = datetime.utcnow()
+        db.simulation_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "finished_at": now, "expire_at": now + self.retention, **fields}},
+        )
+
+    async def _run(
+        self, job_id: ObjectId, assets: List[Dict[str, Any]], params: Dict[str, Any], cache_key: Optional[str]
+    ) -> None:
+        progress, cancel = await asyncio.to_thread(self._shared)
+        future = None
+        try:
+            # Si el pool está saturado el trabajo espera en cola en lugar de fallar
+            while True:
+                try:
+                    future = self.pool.submit(simulate_with_progress, assets, params, progress, cancel)
+                    break
+                except ComputePoolSaturated:
+                    job = db.simulation_jobs.find_one_and_update(
+                        {"_id": job_id},
+                        {"$set": {"heartbeat_at": datetime.utcnow()}},
+                        projection={"cancel_requested": 1},
+                    )
+                    if job and job.get("cancel_requested"):
+                        raise asyncio.CancelledError()
+                    await asyncio.sleep(SIMULATION_JOB_POLL_SECONDS)
+
+            db.simulation_jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "started_at": datetime.utcnow()}})
+            execution = asyncio.wrap_future(future)
+            deadline = asyncio.get_running_loop().time() + self.timeout
+            while not execution.done():
+                await asyncio.wait({execution}, timeout=SIMULATION_JOB_POLL_SECONDS)
+                job = db.simulation_jobs.find_one_and_update(
+                    {"_id": job_id},
+                    {"$set": {"progress.done": progress.value, "heartbeat_at": datetime.utcnow()}},
+                    projection={"cancel_requested": 1},
+                )
+                if job and job.get("cancel_requested"):
+                    cancel.set()
+                if not execution.done() and asyncio.get_running_loop().time() > deadline:
+                    raise ComputeTimeout(f"La simulación superó {self.timeout:g} s")
+            result = execution.result()
+        except (SimulationCancelled, asyncio.CancelledError):
+            # Si todavía no empezó se descarta de la cola del pool; si corre, corta en su próximo control
+            if future is not None:
+                future.cancel()
+            cancel.set()
+            self._finish(job_id, "cancelled")
+            logger.info(f"Trabajo de simulación {job_id} cancelado")
+            return
+        except ComputeTimeout as e:
+            # El proceso de cálculo corta en su próximo control y libera la plaza
+            cancel.set()
+            self._finish(job_id, "failed", error=str(e))
+            return
+        except Exception as e:
+            logger.error(f"Error en el trabajo de simulación {job_id}: {str(e)}")
+            self._finish(job_id, "failed", error=str(e))
+            return
+
+        result.pop("params", None)
+        if cache_key:
+            self.cache.put(cache_key, params, result)
+        self._finish(job_id, "completed", result=result, **{"progress.done": params["paths"]})
+        job = db.simulation_jobs.find_one({"_id": job_id}, {"portfolio_id": 1, "user_id": 1})
+        simulation_store.save(job["user_id"], job["portfolio_id"], params, result, job_id=str(job_id))
+        logger.info(f"Trabajo de simulación {job_id} completado")
+
+
+# Cola compartida por las rutas de simulación; se inicia y se detiene con la aplicación
+simulation_jobs = SimulationJobManager()
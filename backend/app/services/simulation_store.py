@@ -0,0 +1,196 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+import logging
+
+from app.database import db
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de página por defecto y máximo de los listados de simulaciones
+SIMULATION_PAGE_SIZE = 50
+SIMULATION_MAX_PAGE_SIZE = 500
+# Portafolios por lote al migrar el historial embebido
+SIMULATION_MIGRATION_BATCH = 500
+
+# Orden de los listados: las más recientes primero; _id desempata simulaciones del mismo instante
+SIMULATION_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+
+def encode_cursor(simulation: Dict[str, Any]) -> str:
+    """Cursor opaco que apunta a continuación de una simulación del listado"""
+    return f"{simulation['timestamp']}|{simulation['_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    """
+    Raises:
+        ValueError: Si el cursor no tiene el formato de encode_cursor
+    """
+    timestamp, _, simulation_id = cursor.rpartition("|")
+    if not timestamp or not ObjectId.is_valid(simulation_id):
+        raise ValueError("Cursor inválido")
+    return timestamp, ObjectId(simulation_id)
+
+
+class SimulationStore:
+    """
+    Historial de simulaciones en su propia colección (simulations), un
+    documento por corrida con portfolio_id, user_id, timestamp (ISO), params y
+    result.
+
+    Antes cada corrida se agregaba al arreglo simulation_history del
+    portafolio, que crecía sin límite y viajaba en cada lectura del portafolio.
+    Los listados se paginan por cursor sobre los índices (portfolio_id,
+    timestamp) y (user_id, timestamp): cada página es un recorrido acotado del
+    índice, sin skip.
+    """
+
+    def start(self) -> None:
+        """Crea los índices y migra el historial que todavía esté embebido en los portafolios"""
+        try:
+            db.simulations.create_index([("portfolio_id", ASCENDING), ("timestamp", DESCENDING)])
+            db.simulations.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING)])
+            db.simulations.create_index([("timestamp", DESCENDING)])
+            self.migrate()
+        except Exception as e:
+            logger.error(f"No se pudo preparar la colección de simulaciones: {str(e)}")
+
+    def migrate(self) -> int:
+        """
+        Mueve simulation_history de los portafolios a la colección simulations
+
+        Es idempotente: cada corrida se inserta sólo si no existe (misma
+        portfolio_id y timestamp) y recién después se borra el arreglo del
+        portafolio, así que una migración interrumpida se retoma sin duplicar.
+
+        Returns:
+            Cantidad de simulaciones migradas
+        """
+        migrated = 0
+        while True:
+            portfolios = list(
+                db.portfolios.find(
+                    {"simulation_history": {"$exists": True}},
+                    {"user_id": 1, "simulation_history": 1},
+                ).limit(SIMULATION_MIGRATION_BATCH)
+            )
+            if not portfolios:
+                break
+            operations = []
+            for portfolio in portfolios:
+                portfolio_id = str(portfolio["_id"])
+                for simulation in portfolio.get("simulation_history") or []:
+                    timestamp = simulation.get("timestamp") or datetime.utcnow().isoformat()
+                    document = {key: value for key, value in simulation.items() if key != "timestamp"}
+                    document.update({"user_id": portfolio.get("user_id"), "migrated_at": datetime.utcnow()})
+                    operations.append(UpdateOne(
+                        {"portfolio_id": portfolio_id, "timestamp": timestamp},
+                        {"$setOnInsert": document},
+                        upsert=True,
+                    ))
+            if operations:
+                migrated += db.simulations.bulk_write(operations, ordered=False).upserted_count
+            db.portfolios.update_many(
+                {"_id": {"$in": [portfolio["_id"] for portfolio in portfolios]}},
+                {"$unset": {"simulation_history": ""}},
+            )
+        if migrated:
+            logger.info(f"{migrated} simulaciones migradas del historial embebido a la colección simulations")
+        return migrated
+
+    def save(
+        self,
+        user_id: str,
+        portfolio_id: str,
+        params: Dict[str, Any],
+        result: Dict[str, Any],
+        **fields: Any,
+    ) -> Dict[str, Any]:
+        """
+        Guarda una corrida
+
+        Args:
+            user_id: Dueño del portafolio
+            portfolio_id: Portafolio simulado
+            params: Parámetros efectivos de la simulación
+            result: Resultado (sin los parámetros)
+            **fields: Campos adicionales (por ejemplo job_id)
+
+        Returns:
+            Documento guardado
+        """
+        simulation = {
+            "portfolio_id": portfolio_id,
+            "user_id": user_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "params": params,
+            "result": result,
+            **fields,
+        }
+        simulation["_id"] = db.simulations.insert_one(simulation).inserted_id
+        return simulation
+
+    def list_simulations(
+        self,
+        user_id: Optional[str] = None,
+        portfolio_id: Optional[str] = None,
+        limit: int = SIMULATION_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        include_result: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Una página de simulaciones, las más recientes primero
+
+        Args:
+            user_id: Sólo las de este usuario
+            portfolio_id: Sólo las de este portafolio
+            limit: Tamaño de la página (hasta SIMULATION_MAX_PAGE_SIZE)
+            cursor: next_cursor de la página anterior
+            include_result: Incluir el resultado completo de cada corrida
+
+        Returns:
+            (simulaciones, next_cursor); next_cursor es None en la última página
+
+        Raises:
+            ValueError: Si el cursor es inválido
+        """
+        query: Dict[str, Any] = {}
+        if user_id is not None:
+            query["user_id"] = user_id
+        if portfolio_id is not None:
+            query["portfolio_id"] = portfolio_id
+        if cursor:
+            timestamp, simulation_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": simulation_id}},
+            ]
+        limit = max(1, min(limit, SIMULATION_MAX_PAGE_SIZE))
+        projection = None if include_result else {"result": 0}
+        # Se pide uno de más para saber si hay otra página sin contar
+        page = list(db.simulations.find(query, projection).sort(SIMULATION_SORT).limit(limit + 1))
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    def delete(self, simulation_id: str, user_id: Optional[str] = None) -> bool:
+        """Borra una corrida (del usuario, si se indica); False si no existe"""
+        if not ObjectId.is_valid(simulation_id):
+            return False
+        query: Dict[str, Any] = {"_id": ObjectId(simulation_id)}
+        if user_id is not None:
+            query["user_id"] = user_id
+        return db.simulations.delete_one(query).deleted_count > 0
+
+    def delete_at(self, portfolio_id: str, timestamp: str) -> bool:
+        """Borra la corrida de un portafolio con ese timestamp; False si no existe"""
+        return db.simulations.delete_one({"portfolio_id": portfolio_id, "timestamp": timestamp}).deleted_count > 0
+
+    def delete_for_portfolio(self, portfolio_id: str) -> int:
+        """Borra todas las corridas de un portafolio y devuelve cuántas eran"""
+        return db.simulations.delete_many({"portfolio_id": portfolio_id}).deleted_count
+
+
+# Historial compartido por las rutas de simulación y la cola de trabajos
+simulation_store = SimulationStore()
@@ -0,0 +1,202 @@
+import asyncio
+import queue
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.compute_pool import ComputePool, compute_pool
+from app.services.monte_carlo import (
+    SimulationCancelled, band_times, monte_carlo_engine, resolve_simulation_params, summarize_bands
+)
+from app.services.simulation_cache import SimulationCache, simulation_cache
+from app.services.simulation_store import simulation_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Caminos por grupo en las simulaciones con avance: cada grupo terminado es una estimación parcial
+SIMULATION_STREAM_BATCH_PATHS = int(os.getenv("SIMULATION_STREAM_BATCH_PATHS", "4096"))
+# Segundos mínimos entre estimaciones parciales (calcular percentiles de todos los caminos cuesta)
+SIMULATION_STREAM_INTERVAL = float(os.getenv("SIMULATION_STREAM_INTERVAL", "0.5"))
+# Caminos máximos con que se estiman las bandas parciales (el valor final usa todos)
+SIMULATION_STREAM_SAMPLE_PATHS = 16384
+# Segundos de espera entre controles de la cola de avances (y del vencimiento)
+SIMULATION_STREAM_POLL_SECONDS = 0.5
+# Estimaciones seguidas por debajo de la tolerancia para dar las bandas por convergidas
+SIMULATION_STREAM_STABLE_UPDATES = 2
+
+
+def simulate_streaming(
+    assets: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    updates,
+    cancel,
+    batch_paths: int = SIMULATION_STREAM_BATCH_PATHS,
+    interval: float = SIMULATION_STREAM_INTERVAL,
+) -> Dict[str, Any]:
+    """
+    Simulación para el pool de procesos que publica estimaciones parciales
+
+    Args:
+        assets: Activos del portafolio
+        params: Parámetros efectivos (ya resueltos, con semilla)
+        updates: Cola compartida donde se publican las estimaciones
+        cancel: Evento compartido; si se activa, la simulación se corta al terminar el grupo
+        batch_paths: Caminos por grupo
+        interval: Segundos mínimos entre estimaciones
+
+    Raises:
+        SimulationCancelled: Si se pidió cancelar
+    """
+    last_update = [0.0]
+
+    def report(done: int, total: int, bands) -> None:
+        if cancel.is_set():
+            raise SimulationCancelled()
+        now = time.monotonic()
+        if done < total and now - last_update[0] >= interval:
+            last_update[0] = now
+            # Bandas sobre una muestra de caminos (son independientes), valor final sobre todos
+            estimate = summarize_bands(bands[::max(1, done // SIMULATION_STREAM_SAMPLE_PATHS)], params["amount"])
+            final = summarize_bands(bands[:, -1:], params["amount"])
+            estimate.update(terminal=final["terminal"], probability_of_loss=final["probability_of_loss"])
+            updates.put({"done": done, "total": total, **estimate})
+
+    return monte_carlo_engine.simulate(assets, params, progress=report, chunk_paths=batch_paths)
+
+
+def percentile_change(previous: Dict[str, Any], current: Dict[str, Any]) -> float:
+    """Mayor cambio relativo de un percentil del valor final entre dos estimaciones"""
+    return max(
+        abs(current["terminal"]["percentiles"][name] - value) / max(abs(value), 1e-9)
+        for name, value in previous["terminal"]["percentiles"].items()
+    )
+
+
+class SimulationStreamer:
+    """
+    Simulaciones que informan su avance mientras corren.
+
+    El cálculo corre en el pool de procesos en grupos de caminos; al terminar
+    cada grupo el proceso publica en una cola del Manager del pool los
+    percentiles de los caminos hechos hasta ese momento. Del lado de la API un
+    generador async reenvía esas estimaciones. Si quien consume el stream se va
+    (o las bandas convergen con la tolerancia pedida), se activa el evento de
+    cancelación y el proceso corta al terminar el grupo en curso, liberando la
+    plaza del pool.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[ComputePool] = None,
+        cache: Optional[SimulationCache] = None,
+        timeout: float = 300,
+    ):
+        """
+        Args:
+            pool: Pool de cálculo (por defecto el compartido)
+            cache: Cache de resultados (por defecto la compartida)
+            timeout: Segundos máximos de una simulación
+        """
+        self.pool = pool or compute_pool
+        self.cache = cache or simulation_cache
+        self.timeout = timeout
+
+    async def stream(
+        self,
+        user_id: str,
+        portfolio_id: str,
+        assets: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]],
+        tolerance: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Ejecuta la simulación y genera sus eventos; el resultado final se guarda
+        en el historial (y en la cache si la corrida se completó)
+
+        Eventos:
+            {"type": "started", "params", "cached", "time_years"}
+            {"type": "progress", "done", "total", "bands", "probability_of_loss", "terminal", "change"}
+            {"type": "result", "simulation", "cached", "converged"}
+            {"type": "error", "detail"}
+
+        Args:
+            tolerance: Si se indica, la simulación se detiene cuando los percentiles
+                del valor final cambian (en términos relativos) menos que esto en
+                SIMULATION_STREAM_STABLE_UPDATES estimaciones seguidas; el
+                resultado es la última estimación (sin histograma)
+            timeout: Segundos máximos (por defecto los del streamer)
+
+        Raises:
+            ValueError: Si los parámetros son inválidos (antes del primer evento)
+            ComputePoolSaturated: Si no hay plazas libres (antes del primer evento)
+        """
+        cache_key = await asyncio.to_thread(self.cache.key_for, assets, params)
+        params = resolve_simulation_params(params)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached:
+            yield {"type": "started", "params": cached["params"], "cached": True, "time_years": cached["result"].get("time_years")}
+            simulation = simulation_store.save(user_id, portfolio_id, cached["params"], cached["result"], cached=True)
+            yield {"type": "result", "simulation": simulation, "cached": True, "converged": False}
+            return
+
+        manager = await asyncio.to_thread(self.pool.manager)
+        updates, cancel = await asyncio.to_thread(lambda: (manager.Queue(), manager.Event()))
+        future = self.pool.submit(simulate_streaming, assets, params, updates, cancel)
+        try:
+            yield {"type": "started", "params": params, "cached": False, "time_years": band_times(params["horizon_years"])}
+            timeout = timeout or self.timeout
+            deadline = time.monotonic() + timeout
+            last, stable, converged = None, 0, False
+            while True:
+                if time.monotonic() > deadline:
+                    yield {"type": "error", "detail": f"La simulación superó {timeout:g} s"}
+                    return
+                try:
+                    update = await asyncio.to_thread(updates.get, True, SIMULATION_STREAM_POLL_SECONDS)
+                except queue.Empty:
+                    if future.done():
+                        break
+                    continue
+
+                update["change"] = round(percentile_change(last, update), 6) if last else None
+                yield {"type": "progress", **update}
+                if tolerance is not None and last is not None:
+                    stable = stable + 1 if update["change"] < tolerance else 0
+                    if stable >= SIMULATION_STREAM_STABLE_UPDATES:
+                        converged = True
+                        break
+                last = update
+
+            if converged:
+                # Se corta el cálculo y el resultado es la última estimación
+                cancel.set()
+                result = {key: value for key, value in update.items() if key not in ("done", "total", "change")}
+                result["time_years"] = band_times(params["horizon_years"])
+                params = {**params, "paths": update["done"]}
+                simulation = simulation_store.save(user_id, portfolio_id, params, result, converged=True)
+                logger.info(f"Simulación en stream convergida con {update['done']} de {update['total']} caminos")
+            else:
+                try:
+                    result = future.result()
+                except ValueError as e:
+                    yield {"type": "error", "detail": str(e)}
+                    return
+                params = result.pop("params")
+                if cache_key:
+                    self.cache.put(cache_key, params, result)
+                simulation = simulation_store.save(user_id, portfolio_id, params, result)
+            yield {"type": "result", "simulation": simulation, "cached": False, "converged": converged}
+        finally:
+            # Cliente desconectado, error o convergencia: el proceso corta en su próximo control
+            if not future.done():
+                cancel.set()
+                future.cancel()
+
+
+# Streams de simulación de las rutas
+simulation_streamer = SimulationStreamer()
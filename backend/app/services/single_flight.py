@@ -0,0 +1,126 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class _Call:
+    """Llamada en curso compartida por todos los que piden la misma clave"""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas idénticas: mientras una llamada a Yahoo para una
+    clave (ticker, tipo de dato, período) está en curso, las demás solicitudes
+    de esa misma clave esperan y reciben su resultado (o su error) en lugar de
+    lanzar otra llamada.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._counters = {"executions": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Ejecuta `fn` una sola vez por clave entre todas las solicitudes concurrentes
+
+        Args:
+            key: Identificador de la llamada, p. ej. ("AAPL", "info", None)
+            fn: Función que realiza la llamada real
+
+        Returns:
+            El resultado de `fn`; si `fn` falla, todos los que esperaban reciben la excepción
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._counters["executions"] += 1
+            else:
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def do_many(self, keys: List[Hashable], loader: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """
+        Variante por lotes de `do`: las claves que ya están en curso se esperan y
+        el resto se carga con una sola llamada a `loader`
+
+        Args:
+            keys: Claves solicitadas
+            loader: Función que recibe las claves a cargar y devuelve clave -> resultado
+
+        Returns:
+            Diccionario clave -> resultado (None si `loader` no devolvió la clave)
+        """
+        own: Dict[Hashable, _Call] = {}
+        waiting: Dict[Hashable, _Call] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    own[key] = call
+                else:
+                    waiting[key] = call
+            if own:
+                self._counters["executions"] += 1
+            self._counters["coalesced"] += len(waiting)
+
+        results: Dict[Hashable, Any] = {}
+        if own:
+            try:
+                loaded = loader(list(own))
+                for key, call in own.items():
+                    call.result = loaded.get(key)
+                    results[key] = call.result
+            except BaseException as e:
+                for call in own.values():
+                    call.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in own:
+                        self._calls.pop(key, None)
+                for call in own.values():
+                    call.event.set()
+
+        for key, call in waiting.items():
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            results[key] = call.result
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        """Llamadas realmente ejecutadas, solicitudes coalescidas y llamadas en curso"""
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls)}
+
+
+# Instancia compartida para todas las llamadas a Yahoo Finance
+upstream_flight = SingleFlight()
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv
+import os
+import logging
+
+from app.services.optimizer_service import ASSET_NAMES, EXTENDED_ASSETS, TICKER_MAPPING
+from app.services.risk_metrics import portfolio_weights, weights_fingerprint
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Escenarios cuyo resultado se mantiene en memoria (se descarta el menos usado)
+STRESS_CACHE_MAX_SIZE = int(os.getenv("STRESS_CACHE_MAX_SIZE", "128"))
+# Portafolios más golpeados que se devuelven por escenario (por defecto y máximo)
+STRESS_TOP_PORTFOLIOS = 10
+STRESS_MAX_TOP_PORTFOLIOS = 100
+# Percentiles de la distribución de retornos y barras del histograma
+STRESS_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+STRESS_HISTOGRAM_BINS = 20
+# Subir cuando cambie el cálculo o las clases de activos: invalida los resultados cacheados
+STRESS_CACHE_VERSION = 1
+
+# Clase de activo según el prefijo de la clave de TICKER_MAPPING (BONO_ESTABLE -> bonds, ...)
+MAPPING_PREFIX_CLASSES = {
+    "BONO": "bonds",
+    "CEDEAR": "equity",
+    "ETF": "equity",
+    "ACCION": "equity",
+    "CRYPTO": "crypto",
+    "COMMODITY": "commodities",
+}
+# Sectores: grupos más finos que la clase; un shock de sector pisa al de la clase
+ASSET_SECTORS = {
+    "tech": ["MSFT", "NVDA", "AAPL", "GOOGL", "AMZN"],
+    "gold": ["GLD"],
+    "financials": ["XLF"],
+    "energy": ["XLE"],
+    "healthcare": ["JNJ"],
+    "emerging_markets": ["EMB"],
+}
+
+# Escenarios predefinidos (retornos instantáneos, en fracción)
+STRESS_SCENARIOS = {
+    "tech_crash": {"tech": -0.30, "gold": 0.10},
+    "equity_bear": {"equity": -0.25, "bonds": 0.05, "gold": 0.08},
+    "rates_shock": {"bonds": -0.15, "equity": -0.10},
+    "crypto_winter": {"crypto": -0.60},
+    "emerging_crisis": {"emerging_markets": -0.20, "equity": -0.08, "gold": 0.05},
+}
+
+
+def asset_classes() -> Dict[str, List[str]]:
+    """
+    Tickers de cada clase de activo, derivadas de TICKER_MAPPING
+
+    Los activos de EXTENDED_ASSETS que no están en el mapeo (acciones y ETFs
+    sectoriales) se consideran 'equity'.
+    """
+    classes: Dict[str, List[str]] = {}
+    for key, ticker in TICKER_MAPPING.items():
+        classes.setdefault(MAPPING_PREFIX_CLASSES[key.split("_")[0]], []).append(ticker)
+    mapped = set(TICKER_MAPPING.values())
+    classes["equity"].extend(asset["ticker"] for asset in EXTENDED_ASSETS if asset["ticker"] not in mapped)
+    return classes
+
+
+# Clases y sectores disponibles como destino de un shock
+ASSET_CLASSES = asset_classes()
+
+
+def resolve_shocks(shocks: Dict[str, float], tickers: List[str]) -> np.ndarray:
+    """
+    Vector de retornos por ticker de un escenario
+
+    Las claves pueden ser tickers, sectores (ASSET_SECTORS) o clases
+    (ASSET_CLASSES). Gana lo más específico: ticker, luego sector, luego clase.
+
+    Args:
+        shocks: Clave -> retorno instantáneo en fracción (-0.30 = cae 30%)
+        tickers: Columnas del vector
+
+    Raises:
+        ValueError: Si una clave no es ticker, sector ni clase, o un shock es <= -100%
+    """
+    columns = {ticker: col for col, ticker in enumerate(tickers)}
+    known = set(ASSET_NAMES) | {asset["ticker"] for asset in EXTENDED_ASSETS} | set(columns)
+    vector = np.zeros(len(tickers))
+    levels = {0: {}, 1: {}, 2: {}}
+    for key, shock in shocks.items():
+        shock = float(shock)
+        if shock <= -1.0:
+            raise ValueError(f"El shock de {key} debe ser mayor a -1 (-100%)")
+        if key in ASSET_CLASSES:
+            levels[0].update({ticker: shock for ticker in ASSET_CLASSES[key]})
+        elif key in ASSET_SECTORS:
+            levels[1].update({ticker: shock for ticker in ASSET_SECTORS[key]})
+        elif key in known:
+            levels[2][key] = shock
+        else:
+            raise ValueError(
+                f"Destino de shock desconocido: {key}. Use un ticker, un sector "
+                f"({', '.join(ASSET_SECTORS)}) o una clase ({', '.join(ASSET_CLASSES)})"
+            )
+    for level in (0, 1, 2):
+        for ticker, shock in levels[level].items():
+            if ticker in columns:
+                vector[columns[ticker]] = shock
+    return vector
+
+
+def resolve_scenarios(scenarios: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Normaliza la lista de escenarios: nombres de STRESS_SCENARIOS o {'name', 'shocks'}
+
+    Raises:
+        ValueError: Si un escenario no existe, no tiene shocks o alguno no es
+            un número mayor a -1
+    """
+    if not isinstance(scenarios, list):
+        raise ValueError("scenarios debe ser una lista")
+    resolved = []
+    for scenario in scenarios:
+        if isinstance(scenario, str):
+            if scenario not in STRESS_SCENARIOS:
+                raise ValueError(f"Escenario desconocido: {scenario}. Predefinidos: {', '.join(STRESS_SCENARIOS)}")
+            scenario = {"name": scenario, "shocks": STRESS_SCENARIOS[scenario]}
+        if not isinstance(scenario, dict):
+            raise ValueError("Cada escenario debe ser un nombre predefinido o un objeto {name, shocks}")
+        name = scenario.get("name")
+        if name is not None and not isinstance(name, str):
+            raise ValueError("El nombre de un escenario debe ser texto")
+        shocks = scenario.get("shocks")
+        if not isinstance(shocks, dict) or not shocks:
+            raise ValueError(f"El escenario {name or 'sin nombre'} no tiene shocks (objeto destino -> retorno)")
+        for key, shock in shocks.items():
+            # bool es int en Python, pero True como shock es un error del cliente
+            if isinstance(shock, bool) or not isinstance(shock, (int, float)) or not math.isfinite(shock):
+                raise ValueError(f"El shock de {key} debe ser un número")
+            if shock <= -1.0:
+                raise ValueError(f"El shock de {key} debe ser mayor a -1 (-100%)")
+        resolved.append({"name": name or ",".join(f"{k}:{v}" for k, v in shocks.items()), "shocks": shocks})
+    return resolved
+
+
+def portfolios_fingerprint(portfolios: List[Dict[str, Any]]) -> str:
+    """Huella del conjunto de portafolios (ids y composiciones): si cambia, los resultados dejan de valer"""
+    digest = hashlib.sha1()
+    for portfolio in sorted(portfolios, key=lambda p: str(p["_id"])):
+        digest.update(f"{portfolio['_id']}:{weights_fingerprint(portfolio_weights(portfolio.get('assets')))};".encode())
+    return digest.hexdigest()
+
+
+def scenario_key(scenario: Dict[str, Any], fingerprint: str, top: int) -> str:
+    """Clave de cache de un escenario sobre un conjunto de portafolios"""
+    canonical = json.dumps(
+        {"version": STRESS_CACHE_VERSION, "shocks": scenario["shocks"], "portfolios": fingerprint, "top": top},
+        sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class StressTestEngine:
+    """
+    Pruebas de estrés de todos los portafolios a la vez.
+
+    Los portafolios se cargan en una matriz de pesos (portafolios x tickers) y
+    los escenarios en una matriz de shocks (tickers x escenarios): el retorno de
+    cada portafolio en cada escenario sale de un único producto de matrices.
+    """
+
+    def run(
+        self,
+        portfolios: List[Dict[str, Any]],
+        scenarios: List[Dict[str, Any]],
+        top: int = STRESS_TOP_PORTFOLIOS,
+    ) -> List[Dict[str, Any]]:
+        """
+        Aplica los escenarios a los portafolios
+
+        Args:
+            portfolios: Documentos con '_id', 'assets' y opcionalmente 'user_id'
+            scenarios: Escenarios ya normalizados ({'name', 'shocks'})
+            top: Portafolios más golpeados a devolver por escenario
+
+        Returns:
+            Por escenario: shocks por ticker, distribución de retornos (media,
+            percentiles, histograma, portafolios con pérdida) y los más golpeados
+            con la contribución de cada activo
+
+        Raises:
+            ValueError: Si un escenario tiene shocks inválidos
+        """
+        allocations = [portfolio_weights(p.get("assets")) for p in portfolios]
+        tickers = sorted(set().union(*allocations))
+        columns = {ticker: col for col, ticker in enumerate(tickers)}
+        weights = np.zeros((len(portfolios), len(tickers)))
+        for row, allocation in enumerate(allocations):
+            for ticker, weight in allocation.items():
+                weights[row, columns[ticker]] += weight
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+        shocks = np.column_stack([resolve_shocks(s["shocks"], tickers) for s in scenarios]) if tickers else np.zeros((0, len(scenarios)))
+        returns = weights @ shocks  # portafolios x escenarios
+        shocked_weight = weights @ (shocks != 0)
+
+        results = []
+        for col, scenario in enumerate(scenarios):
+            scenario_returns = returns[:, col]
+            counts, edges = np.histogram(scenario_returns, bins=STRESS_HISTOGRAM_BINS)
+            worst = np.argsort(scenario_returns, kind="stable")[:top]
+            hit = np.flatnonzero(shocks[:, col])
+            results.append({
+                "name": scenario["name"],
+                "shocks": {tickers[i]: float(shocks[i, col]) for i in hit},
+                "portfolios": len(portfolios),
+                "mean_return": round(float(scenario_returns.mean()), 6),
+                "percentiles": {
+                    f"p{p}": round(float(v), 6)
+                    for p, v in zip(STRESS_PERCENTILES, np.percentile(scenario_returns, STRESS_PERCENTILES))
+                },
+                "losing": int((scenario_returns < 0).sum()),
+                "histogram": {"edges": [round(float(e), 6) for e in edges], "counts": counts.tolist()},
+                "worst_hit": [
+                    {
+                        "_id": str(portfolios[row]["_id"]),
+                        "user_id": portfolios[row].get("user_id"),
+                        "return": round(float(scenario_returns[row]), 6),
+                        "shocked_weight": round(float(shocked_weight[row, col]), 4),
+                        "contributions": {
+                            tickers[i]: round(float(weights[row, i] * shocks[i, col]), 6)
+                            for i in hit
+                            if weights[row, i] > 0
+                        },
+                    }
+                    for row in worst
+                ],
+            })
+
+        logger.info(f"Estrés de {len(portfolios)} portafolios x {len(scenarios)} escenarios ({len(tickers)} activos)")
+        return results
+
+
+def run_stress_test(portfolios: List[Dict[str, Any]], scenarios: List[Dict[str, Any]], top: int) -> List[Dict[str, Any]]:
+    """Pruebas de estrés con el motor compartido (función de módulo, para el pool de procesos)"""
+    return stress_test_engine.run(portfolios, scenarios, top)
+
+
+class StressResultCache:
+    """
+    Resultados por escenario, en memoria del proceso de la API, con límite LRU.
+    La clave incluye la huella de los portafolios: al cambiar cualquier
+    composición los resultados viejos dejan de encontrarse.
+    """
+
+    def __init__(self, max_size: int = STRESS_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_many(self, keys: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """(encontrados, claves faltantes)"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(keys) - len(found)
+        return found, [key for key in keys if key not in found]
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, **self._counters}
+
+
+# Motor y cache compartidos por las rutas de administración
+stress_test_engine = StressTestEngine()
+stress_result_cache = StressResultCache()
@@ -0,0 +1,325 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from yfinance.exceptions import YFRateLimitError
+from dotenv import load_dotenv
+import os
+import logging
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_GUARD_ENABLED = os.getenv("UPSTREAM_GUARD_ENABLED", "true").lower() in ("1", "true", "yes")
+# Token bucket: llamadas por segundo sostenidas y ráfaga máxima
+UPSTREAM_RATE_PER_SECOND = float(os.getenv("UPSTREAM_RATE_PER_SECOND", "5"))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "10"))
+# Segundos máximos que una llamada espera un token o un lugar libre antes de rendirse
+UPSTREAM_MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "2"))
+# Concurrencia adaptativa (AIMD): límites y latencia objetivo por llamada
+UPSTREAM_MIN_CONCURRENCY = int(os.getenv("UPSTREAM_MIN_CONCURRENCY", "1"))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "8"))
+UPSTREAM_LATENCY_TARGET_SECONDS = float(os.getenv("UPSTREAM_LATENCY_TARGET_SECONDS", "3"))
+# Circuit breaker: se abre si falla al menos este porcentaje de las últimas llamadas
+UPSTREAM_FAILURE_THRESHOLD = float(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "0.5"))
+UPSTREAM_FAILURE_WINDOW = int(os.getenv("UPSTREAM_FAILURE_WINDOW", "20"))
+UPSTREAM_MIN_CALLS = int(os.getenv("UPSTREAM_MIN_CALLS", "5"))
+UPSTREAM_OPEN_SECONDS = float(os.getenv("UPSTREAM_OPEN_SECONDS", "30"))
+
+
+class UpstreamUnavailable(Exception):
+    """La llamada no se hizo: circuito abierto o sin capacidad disponible a tiempo"""
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """
+    Indica si un error es de la fuente (red, límite 429 o 5xx) y no del pedido
+
+    Los errores de datos (ticker inexistente, sin precios, 404) los provoca
+    la entrada del usuario: no dicen nada de la salud de la fuente y no deben
+    abrir el circuito para todos.
+    """
+    if isinstance(error, YFRateLimitError):
+        return True
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    # requests y curl_cffi derivan sus errores de transporte de OSError (conexión, timeout, DNS)
+    return isinstance(error, OSError)
+
+
+class TokenBucket:
+    """Limitador de tasa: `rate` tokens por segundo con capacidad para ráfagas de `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float) -> bool:
+        """
+        Toma un token, esperando como mucho `max_wait` segundos
+
+        Returns:
+            True si se obtuvo el token, False si habría que esperar más de `max_wait`
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # El token se reserva ya (saldo negativo) para que las esperas queden en fila
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if wait > max_wait:
+                return False
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def available(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            return min(self.burst, self._tokens + (now - self._updated) * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por tasa de fallos sobre las últimas `window` llamadas.
+
+    closed: las llamadas pasan. open: se rechazan al instante durante
+    `open_seconds`. half_open: pasa una sola llamada de prueba; si sale bien el
+    circuito se cierra y si falla vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold: float, window: int, min_calls: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == "open" and now - self._opened_at >= self.open_seconds:
+            self._state = "half_open"
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Indica si la llamada puede hacerse (en half_open sólo la primera)"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def cancel(self) -> None:
+        """La llamada autorizada no llegó a hacerse: libera la prueba de half_open sin contarla"""
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self._state == "half_open":
+                self._probing = False
+                if success:
+                    self._state = "closed"
+                    self._outcomes.clear()
+                    logger.info("Circuito de datos de mercado cerrado")
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            if self._state == "closed" and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_threshold:
+                    self._open()
+
+    def _open(self) -> None:
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._counters["opened"] += 1
+        logger.warning(f"Circuito de datos de mercado abierto por {self.open_seconds}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            return {
+                **self._counters,
+                "state": state,
+                "recent_failure_rate": round(self._outcomes.count(False) / len(self._outcomes), 4) if self._outcomes else 0.0,
+                "retry_in_seconds": round(max(0.0, self.open_seconds - (now - self._opened_at)), 1) if state == "open" else 0.0,
+            }
+
+
+class AdaptiveConcurrency:
+    """
+    Límite de llamadas simultáneas con ajuste AIMD: sube de a un lugar por cada
+    "ventana" de llamadas rápidas y exitosas, y se reduce a la mitad ante un
+    error o una llamada más lenta que la latencia objetivo.
+    """
+
+    def __init__(self, minimum: int, maximum: int, latency_target: float, decrease_interval: float = 1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.latency_target = latency_target
+        self.decrease_interval = decrease_interval
+        self._limit = float(self.maximum)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    def acquire(self, max_wait: float) -> bool:
+        deadline = time.monotonic() + max_wait
+        with self._cond:
+            while self._in_flight >= self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._in_flight += 1
+            return True
+
+    def release(self, success: bool, latency: float) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if success and latency <= self.latency_target:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            elif now - self._last_decrease >= self.decrease_interval:
+                # Una sola reducción por intervalo: varios fallos simultáneos son la misma señal
+                self._limit = max(self.minimum, self._limit / 2)
+                self._last_decrease = now
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"limit": self.limit, "in_flight": self._in_flight, "maximum": self.maximum}
+
+
+class UpstreamGuard:
+    """
+    Protección compartida de todas las llamadas a la fuente de datos de mercado:
+    circuit breaker, token bucket y concurrencia adaptativa. Cuando Yahoo limita
+    o falla, las llamadas se rechazan al instante con UpstreamUnavailable en vez
+    de esperar cada una su timeout.
+    """
+
+    def __init__(
+        self,
+        rate: float = UPSTREAM_RATE_PER_SECOND,
+        burst: int = UPSTREAM_BURST,
+        max_wait: float = UPSTREAM_MAX_WAIT_SECONDS,
+        min_concurrency: int = UPSTREAM_MIN_CONCURRENCY,
+        max_concurrency: int = UPSTREAM_MAX_CONCURRENCY,
+        latency_target: float = UPSTREAM_LATENCY_TARGET_SECONDS,
+        failure_threshold: float = UPSTREAM_FAILURE_THRESHOLD,
+        failure_window: int = UPSTREAM_FAILURE_WINDOW,
+        min_calls: int = UPSTREAM_MIN_CALLS,
+        open_seconds: float = UPSTREAM_OPEN_SECONDS,
+    ):
+        """
+        Args:
+            rate: Llamadas por segundo sostenidas
+            burst: Llamadas que pueden hacerse de golpe tras un período sin uso
+            max_wait: Segundos máximos de espera por un token o un lugar libre
+            min_concurrency: Piso del límite de llamadas simultáneas
+            max_concurrency: Techo del límite de llamadas simultáneas
+            latency_target: Segundos por encima de los cuales una llamada cuenta como lenta
+            failure_threshold: Fracción de fallos que abre el circuito
+            failure_window: Cantidad de llamadas recientes consideradas
+            min_calls: Llamadas mínimas en la ventana antes de poder abrir el circuito
+            open_seconds: Segundos que el circuito queda abierto antes de probar de nuevo
+        """
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, failure_window, min_calls, open_seconds)
+        self.concurrency = AdaptiveConcurrency(min_concurrency, max_concurrency, latency_target)
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "failures": 0, "data_errors": 0, "throttled": 0}
+
+    def call(self, fn: Callable[[], Any], label: Optional[str] = None) -> Any:
+        """
+        Ejecuta una llamada a la fuente de datos respetando los límites
+
+        Args:
+            fn: Función que realiza la llamada real
+            label: Descripción para los logs (p. ej. "info AAPL")
+
+        Sólo los errores de la fuente (ver is_upstream_failure) cuentan como
+        fallos para el circuito y la concurrencia; los errores de datos se
+        relanzan sin afectarlos.
+
+        Raises:
+            UpstreamUnavailable: Si el circuito está abierto o no hubo capacidad a tiempo
+        """
+        if not self.breaker.allow():
+            raise UpstreamUnavailable("Fuente de datos de mercado no disponible temporalmente (circuito abierto)")
+        if not self.bucket.acquire(self.max_wait):
+            self.breaker.cancel()
+            self._count("throttled")
+            raise UpstreamUnavailable("Límite de llamadas a la fuente de datos de mercado alcanzado")
+        if not self.concurrency.acquire(self.max_wait):
+            self.breaker.cancel()
+            self._count("throttled")
+            raise UpstreamUnavailable("Demasiadas llamadas simultáneas a la fuente de datos de mercado")
+
+        started = time.monotonic()
+        healthy = False
+        try:
+            result = fn()
+            healthy = True
+            return result
+        except Exception as e:
+            if is_upstream_failure(e):
+                self._count("failures")
+                logger.warning(f"Falló la llamada a la fuente de datos{f' ({label})' if label else ''}: {str(e)}")
+            else:
+                # La fuente respondió: el error es del pedido
+                healthy = True
+                self._count("data_errors")
+            raise
+        finally:
+            self.concurrency.release(healthy, time.monotonic() - started)
+            self.breaker.record(healthy)
+            self._count("calls")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "circuit": self.breaker.stats(),
+            "concurrency": self.concurrency.stats(),
+            "tokens_available": round(self.bucket.available(), 2),
+        }
+
+
+# Protección compartida por todas las llamadas a Yahoo
+upstream_guard = UpstreamGuard()
@@ -1,133 +1,255 @@
-import yfinance as yf
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set
+from app.services.batch_fetcher import BatchQuoteFetcher
+from app.services.quote_cache import quote_cache, fundamentals_cache
+from app.services.price_store import price_store
+from app.services.history_format import downsample_history, serialize_history
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Motor compartido de descarga por lotes (historial masivo + metadatos en paralelo)
+batch_fetcher = BatchQuoteFetcher()
+
+# Campos que salen del historial reciente (baratos, cambian durante el día)
+PRICE_FIELDS = ["current_price", "previous_close", "price_change", "price_change_percent", "volume", "day_high", "day_low"]
+# Campos que salen de `.info` (la llamada más lenta, cambian poco)
+FUNDAMENTAL_FIELDS = [
+    "name", "currency", "market_cap", "avg_volume", "fifty_two_week_high", "fifty_two_week_low",
+    "pe_ratio", "dividend_yield", "sector", "industry"
+]
+# Orden de los campos en la respuesta
+QUOTE_FIELDS = [
+    "name", "current_price", "previous_close", "price_change", "price_change_percent", "currency",
+    "market_cap", "volume", "avg_volume", "day_high", "day_low", "fifty_two_week_high",
+    "fifty_two_week_low", "pe_ratio", "dividend_yield", "sector", "industry"
+]
+
 class YahooFinanceService:
-    """Servicio para obtener datos de Yahoo Finance"""
+    """
+    Servicio para obtener datos de Yahoo Finance
+    
+    El origen real de los datos es el proveedor configurado con MARKET_DATA_PROVIDER
+    (ver market_data_provider), por lo que también puede servir fixtures locales.
+    """
     
     @staticmethod
-    def get_stock_data(tickers: List[str]) -> List[Dict[str, Any]]:
+    def get_stock_data(tickers: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """
         Obtiene datos actuales de acciones desde Yahoo Finance
         
+        Cada cotización tiene dos partes con caches separadas: los precios, que salen
+        del historial reciente (una sola descarga para todos los tickers, TTL corto),
+        y los fundamentales, que salen de `.info` (la llamada más lenta, TTL largo).
+        Sólo se consulta la parte que cubre los campos pedidos.
+        
         Args:
             tickers: Lista de símbolos de acciones (ej: ['AAPL', 'GOOGL', 'MSFT'])
+            fields: Campos a devolver (ej: ['current_price', 'price_change_percent']);
+                por defecto todos. Ver QUOTE_FIELDS.
             
         Returns:
             Lista de diccionarios con información de cada acción
         """
-        results = []
+        requested = YahooFinanceService.resolve_fields(fields)
+        prices: Dict[str, Dict[str, Any]] = {}
+        fundamentals: Dict[str, Dict[str, Any]] = {}
+        if requested & set(PRICE_FIELDS):
+            prices = quote_cache.get_many(tickers, YahooFinanceService._fetch_prices)
+        if requested & set(FUNDAMENTAL_FIELDS):
+            fundamentals = fundamentals_cache.get_many(tickers, YahooFinanceService._fetch_fundamentals)
+        return [
+            YahooFinanceService._merge_quote(ticker, prices.get(ticker), fundamentals.get(ticker), requested)
+            for ticker in tickers
+        ]
+
+    @staticmethod
+    def resolve_fields(fields: Optional[List[str]]) -> Set[str]:
+        """
+        Valida los campos pedidos
         
-        for ticker in tickers:
-            try:
-                # Obtener información de la acción
-                stock = yf.Ticker(ticker)
-                info = stock.info
-                history = stock.history(period="5d")  # Últimos 5 días
-                
-                # Verificar si tenemos datos válidos
-                if history.empty or not info:
-                    logger.warning(f"No se encontraron datos para {ticker}")
-                    results.append({
-                        "ticker": ticker,
-                        "name": ticker,
-                        "current_price": 0,
-                        "previous_close": 0,
-                        "price_change": 0,
-                        "price_change_percent": 0,
-                        "currency": "USD",
-                        "error": "No se encontraron datos"
-                    })
-                    continue
-                
-                # Obtener precio actual y anterior
-                current_price = history['Close'].iloc[-1] if len(history) > 0 else 0
-                previous_close = info.get('previousClose', history['Close'].iloc[-2] if len(history) > 1 else current_price)
-                
-                # Calcular cambio
-                price_change = current_price - previous_close
-                price_change_percent = (price_change / previous_close * 100) if previous_close > 0 else 0
-                
-                # Obtener nombre de la empresa
-                company_name = info.get('longName') or info.get('shortName') or ticker
-                
-                # Obtener moneda
-                currency = info.get('currency', 'USD')
-                
-                results.append({
-                    "ticker": ticker,
-                    "name": company_name,
-                    "current_price": round(current_price, 2),
-                    "previous_close": round(previous_close, 2),
-                    "price_change": round(price_change, 2),
-                    "price_change_percent": round(price_change_percent, 2),
-                    "currency": currency,
-                    "market_cap": info.get('marketCap'),
-                    "volume": info.get('volume'),
-                    "avg_volume": info.get('averageVolume'),
-                    "day_high": info.get('dayHigh'),
-                    "day_low": info.get('dayLow'),
-                    "fifty_two_week_high": info.get('fiftyTwoWeekHigh'),
-                    "fifty_two_week_low": info.get('fiftyTwoWeekLow'),
-                    "pe_ratio": info.get('trailingPE'),
-                    "dividend_yield": info.get('dividendYield'),
-                    "sector": info.get('sector'),
-                    "industry": info.get('industry')
-                })
-                
-                logger.info(f"Datos obtenidos exitosamente para {ticker}: {company_name}")
-                
-            except Exception as e:
-                logger.error(f"Error al obtener datos para {ticker}: {str(e)}")
-                results.append({
-                    "ticker": ticker,
-                    "name": ticker,
-                    "current_price": 0,
-                    "previous_close": 0,
-                    "price_change": 0,
-                    "price_change_percent": 0,
-                    "currency": "USD",
-                    "error": f"Error: {str(e)}"
-                })
+        Raises:
+            ValueError: Si algún campo no existe
+        """
+        if not fields:
+            return set(QUOTE_FIELDS)
+        unknown = [field for field in fields if field not in QUOTE_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconocidos: {', '.join(unknown)}. Opciones: {', '.join(QUOTE_FIELDS)}")
+        return set(fields)
+
+    @staticmethod
+    def refresh_quotes(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Consulta los precios sin pasar por la cache y guarda el resultado en ella
         
-        return results
+        Args:
+            tickers: Lista de símbolos de acciones
+            
+        Returns:
+            Diccionario ticker -> precios recién obtenidos
+        """
+        prices = YahooFinanceService._fetch_prices(tickers)
+        quote_cache.set_many(prices)
+        return prices
+
+    @staticmethod
+    def _fetch_prices(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Descarga el historial reciente de los tickers que no están en cache (sin `.info`)"""
+        fetched = batch_fetcher.fetch(tickers, include_info=False)
+        return {ticker: YahooFinanceService._build_prices(ticker, fetched[ticker]) for ticker in tickers}
+
+    @staticmethod
+    def _fetch_fundamentals(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Consulta `.info` de los tickers que no están en cache"""
+        fetched = batch_fetcher.fetch(tickers, include_history=False)
+        return {ticker: YahooFinanceService._build_fundamentals(ticker, fetched[ticker]) for ticker in tickers}
+
+    @staticmethod
+    def _build_prices(ticker: str, fetched: Dict[str, Any]) -> Dict[str, Any]:
+        """Precios del día calculados a partir del historial reciente de un ticker"""
+        if fetched["error"]:
+            logger.error(f"Error al obtener datos para {ticker}: {fetched['error']}")
+            return {"error": fetched["error"]}
+
+        history = fetched["history"]
+        try:
+            # Verificar si tenemos datos válidos
+            if history is None or history.empty:
+                logger.warning(f"No se encontraron datos para {ticker}")
+                return {"error": "No se encontraron datos"}
+            
+            # Obtener precio actual y anterior
+            current_price = float(history['Close'].iloc[-1])
+            previous_close = float(history['Close'].iloc[-2]) if len(history) > 1 else current_price
+            
+            # Calcular cambio
+            price_change = current_price - previous_close
+            price_change_percent = (price_change / previous_close * 100) if previous_close > 0 else 0
+            
+            return {
+                "current_price": round(current_price, 2),
+                "previous_close": round(previous_close, 2),
+                "price_change": round(price_change, 2),
+                "price_change_percent": round(price_change_percent, 2),
+                "volume": int(history['Volume'].iloc[-1]),
+                "day_high": round(float(history['High'].iloc[-1]), 2),
+                "day_low": round(float(history['Low'].iloc[-1]), 2)
+            }
+            
+        except Exception as e:
+            logger.error(f"Error al obtener datos para {ticker}: {str(e)}")
+            return {"error": f"Error: {str(e)}"}
+
+    @staticmethod
+    def _build_fundamentals(ticker: str, fetched: Dict[str, Any]) -> Dict[str, Any]:
+        """Nombre, moneda y fundamentales de un ticker a partir de `.info`"""
+        info = fetched["info"]
+        if not info:
+            # Metadatos con error o fuera de tiempo: no se guardan en cache
+            logger.warning(f"Datos parciales para {ticker}: metadatos no disponibles")
+            return {"error": "Metadatos no disponibles"}
+
+        # Obtener nombre de la empresa
+        company_name = info.get('longName') or info.get('shortName') or ticker
+        logger.info(f"Datos obtenidos exitosamente para {ticker}: {company_name}")
+        return {
+            "name": company_name,
+            "currency": info.get('currency', 'USD'),
+            "market_cap": info.get('marketCap'),
+            "avg_volume": info.get('averageVolume'),
+            "fifty_two_week_high": info.get('fiftyTwoWeekHigh'),
+            "fifty_two_week_low": info.get('fiftyTwoWeekLow'),
+            "pe_ratio": info.get('trailingPE'),
+            "dividend_yield": info.get('dividendYield'),
+            "sector": info.get('sector'),
+            "industry": info.get('industry')
+        }
+
+    @staticmethod
+    def _merge_quote(
+        ticker: str,
+        prices: Optional[Dict[str, Any]],
+        fundamentals: Optional[Dict[str, Any]],
+        requested: Set[str],
+    ) -> Dict[str, Any]:
+        """Arma la cotización con los campos pedidos a partir de sus dos partes"""
+        if prices is not None and "error" in prices:
+            return YahooFinanceService._error_quote(ticker, prices["error"], requested)
+
+        partial = fundamentals is not None and "error" in fundamentals
+        defaults = {"name": ticker, "currency": "USD"}
+        quote = {"ticker": ticker}
+        for field in QUOTE_FIELDS:
+            if field not in requested:
+                continue
+            source = prices if field in PRICE_FIELDS else fundamentals
+            if source is None or "error" in source:
+                quote[field] = defaults.get(field)
+            else:
+                quote[field] = source.get(field)
+        if partial:
+            # Si los metadatos no llegaron a tiempo se responde sólo con los precios
+            quote["partial"] = True
+        return quote
+
+    @staticmethod
+    def _error_quote(ticker: str, error: str, requested: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """Cotización vacía que se devuelve cuando no hay datos para un ticker"""
+        quote = {
+            "ticker": ticker,
+            "name": ticker,
+            "current_price": 0,
+            "previous_close": 0,
+            "price_change": 0,
+            "price_change_percent": 0,
+            "currency": "USD",
+            "error": error
+        }
+        if requested is not None:
+            quote = {key: value for key, value in quote.items() if key in requested or key in ("ticker", "error")}
+        return quote
     
     @staticmethod
-    def get_historical_data(ticker: str, period: str = "1y") -> Dict[str, Any]:
+    def get_historical_data(
+        ticker: str,
+        period: str = "1y",
+        data_format: str = "rows",
+        max_points: Optional[int] = None,
+        chart: str = "line",
+    ) -> Dict[str, Any]:
         """
         Obtiene datos históricos de una acción
         
         Args:
             ticker: Símbolo de la acción
             period: Período de tiempo ('1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max')
+            data_format: 'rows' (lista de barras) o 'columns' (una lista por campo)
+            max_points: Cantidad máxima de puntos a devolver (None devuelve todas las barras)
+            chart: 'line' (barras diarias representativas) o 'candles' (velas agregadas)
             
         Returns:
             Diccionario con datos históricos
         """
         try:
-            stock = yf.Ticker(ticker)
-            history = stock.history(period=period)
+            # Se sirve desde el almacén local; sólo se descargan las barras faltantes
+            bars = price_store.get(ticker, period)
             
-            if history.empty:
+            if len(bars) == 0:
                 return {"error": "No se encontraron datos históricos"}
             
-            # Convertir a lista de diccionarios
-            data = []
-            for date, row in history.iterrows():
-                data.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "open": round(row['Open'], 2),
-                    "high": round(row['High'], 2),
-                    "low": round(row['Low'], 2),
-                    "close": round(row['Close'], 2),
-                    "volume": int(row['Volume'])
-                })
+            total_points = len(bars)
+            bars, resolution = downsample_history(bars, max_points, chart)
+            
+            # Conversión por columnas completas (sin iterar fila por fila)
+            data = serialize_history(bars, data_format)
             
             return {
                 "ticker": ticker,
                 "period": period,
+                "format": data_format,
+                "resolution": resolution,
+                "points": len(bars),
+                "total_points": total_points,
                 "data": data
             }
             
@@ -0,0 +1,72 @@
+"""
+Benchmark de latencia vs. cantidad de tickers para la obtención de cotizaciones.
+
+Compara el recorrido serial original (info + history por ticker) con
+BatchQuoteFetcher (una descarga masiva + metadatos en paralelo) usando un
+proveedor falso local con latencia simulada, sin tocar Yahoo Finance.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_batch_fetch
+"""
+import time
+import numpy as np
+import pandas as pd
+from app.services.batch_fetcher import BatchQuoteFetcher
+from app.services.market_data_provider import MarketDataProvider
+
+INFO_LATENCY = 0.08       # segundos por llamada a .info
+HISTORY_LATENCY = 0.05    # segundos por llamada a .history de un ticker
+DOWNLOAD_LATENCY = 0.15   # segundos fijos de la descarga masiva
+DOWNLOAD_PER_TICKER = 0.002
+TICKER_COUNTS = [1, 5, 10, 25, 50]
+
+
+class FakeProvider(MarketDataProvider):
+    """Proveedor local que imita la latencia de Yahoo Finance"""
+
+    name = "fake"
+
+    def _history(self) -> pd.DataFrame:
+        index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=5, freq="B")
+        close = np.linspace(100, 104, 5)
+        return pd.DataFrame({
+            "Open": close, "High": close + 1, "Low": close - 1, "Close": close, "Volume": 1000
+        }, index=index)
+
+    def get_history(self, ticker, period=None, start=None):
+        time.sleep(HISTORY_LATENCY)
+        return self._history()
+
+    def download_history(self, tickers, period):
+        time.sleep(DOWNLOAD_LATENCY + DOWNLOAD_PER_TICKER * len(tickers))
+        return {ticker: self._history() for ticker in tickers}
+
+    def get_info(self, ticker):
+        time.sleep(INFO_LATENCY)
+        return {"longName": ticker, "currency": "USD", "previousClose": 103.0}
+
+
+def serial_fetch(provider: FakeProvider, tickers):
+    return {ticker: (provider.get_info(ticker), provider.get_history(ticker, period="5d")) for ticker in tickers}
+
+
+def main():
+    provider = FakeProvider()
+    fetcher = BatchQuoteFetcher(provider=provider, max_workers=8)
+    print(f"{'tickers':>8} {'serial (s)':>12} {'lotes (s)':>12} {'speedup':>9}")
+    for count in TICKER_COUNTS:
+        tickers = [f"T{i:03d}" for i in range(count)]
+
+        start = time.perf_counter()
+        serial_fetch(provider, tickers)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fetcher.fetch(tickers)
+        batched = time.perf_counter() - start
+
+        print(f"{count:>8} {serial:>12.3f} {batched:>12.3f} {serial / batched:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark de serialización de históricos: fila por fila vs. columnar.
+
+Compara, para series del tamaño de 1y / 10y / max:
+  - iterrows: la conversión original (DataFrame.iterrows + dict por fila)
+  - rows: la conversión vectorizada con el mismo formato de respuesta
+  - columns: el payload columnar opt-in ({"date": [...], "close": [...]})
+e informa tiempo de codificación, tamaño del JSON y tiempo de parseo (json.loads).
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_history_format
+"""
+import json
+import time
+import numpy as np
+import pandas as pd
+from app.services.history_format import BAR_DTYPE, bars_to_rows, bars_to_columns
+
+SIZES = {"1y": 252, "10y": 2520, "max": 11000}
+REPEATS = 5
+
+
+def make_bars(count: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    bars = np.empty(count, dtype=BAR_DTYPE)
+    bars["date"] = np.datetime64("1980-01-01") + np.arange(count)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    bars["open"] = close * 0.999
+    bars["high"] = close * 1.01
+    bars["low"] = close * 0.99
+    bars["close"] = close
+    bars["volume"] = rng.integers(1_000, 10_000_000, count)
+    return bars
+
+
+def iterrows_encode(history: pd.DataFrame):
+    data = []
+    for date, row in history.iterrows():
+        data.append({
+            "date": date.strftime("%Y-%m-%d"),
+            "open": round(row['Open'], 2),
+            "high": round(row['High'], 2),
+            "low": round(row['Low'], 2),
+            "close": round(row['Close'], 2),
+            "volume": int(row['Volume'])
+        })
+    return data
+
+
+def best_of(fn, *args):
+    best = float("inf")
+    result = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    print(f"{'período':>8} {'filas':>6} {'modo':>9} {'encode (ms)':>12} {'bytes':>10} {'parse (ms)':>11}")
+    for period, count in SIZES.items():
+        bars = make_bars(count)
+        history = pd.DataFrame({
+            "Open": bars["open"], "High": bars["high"], "Low": bars["low"],
+            "Close": bars["close"], "Volume": bars["volume"],
+        }, index=pd.DatetimeIndex(bars["date"]))
+
+        for mode, fn, arg in [
+            ("iterrows", iterrows_encode, history),
+            ("rows", bars_to_rows, bars),
+            ("columns", bars_to_columns, bars),
+        ]:
+            encode_time, data = best_of(fn, arg)
+            payload = json.dumps({"data": data})
+            parse_time, _ = best_of(json.loads, payload)
+            print(f"{period:>8} {count:>6} {mode:>9} {encode_time * 1000:>12.2f} "
+                  f"{len(payload):>10} {parse_time * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark de latencia del optimizador media-varianza.
+
+Para universos de 5 a 50 activos con retornos sintéticos mide el tiempo por
+solicitud (construir el optimizador + resolver) de mínima varianza, máximo
+Sharpe y riesgo objetivo, y lo compara con PyPortfolioOpt (cvxpy) si está
+instalado. También informa la diferencia de Sharpe entre ambos como control,
+y verifica que los puntos de la frontera trazada coincidan con los de resolver
+cada τ por separado con el método de conjunto activo.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_optimizer
+"""
+import time
+import numpy as np
+from app.services.mean_variance import MeanVarianceOptimizer, solve_long_only
+from app.services.return_matrix import TRADING_DAYS
+
+try:
+    from pypfopt.efficient_frontier import EfficientFrontier
+except ImportError:
+    EfficientFrontier = None
+
+ASSET_COUNTS = [5, 10, 15, 25, 50]
+OBSERVATIONS = 756  # 3 años de sesiones
+MAX_WEIGHT = 0.35
+RISK_FREE = 0.04
+REPEATS = 50
+# Control de la frontera: casos (semillas) y grilla de τ contra solve_long_only
+FRONTIER_CHECK_CASES = 200
+FRONTIER_CHECK_TAUS = np.linspace(0.0, 2.0, 41)
+FRONTIER_CHECK_TOL = 1e-8
+
+
+def make_inputs(assets: int, seed: int = 0):
+    """Retornos diarios con un factor común, medias y volatilidades heterogéneas"""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0004, 0.01, OBSERVATIONS)
+    betas = rng.uniform(0.2, 1.5, assets)
+    noise = rng.normal(0, 1, (OBSERVATIONS, assets)) * rng.uniform(0.005, 0.03, assets)
+    returns = market[:, None] * betas + noise + rng.uniform(-0.0002, 0.0008, assets)
+    return returns.mean(axis=0) * TRADING_DAYS, np.cov(returns, rowvar=False) * TRADING_DAYS
+
+
+def timed(fn, repeats: int = REPEATS):
+    """Mediana y p99 en milisegundos, junto con el último resultado"""
+    samples = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples)), float(np.percentile(samples, 99)), result
+
+
+def numpy_solvers(mean, cov):
+    def min_variance():
+        return MeanVarianceOptimizer(mean, cov, MAX_WEIGHT, RISK_FREE).min_variance()
+
+    def max_sharpe():
+        return MeanVarianceOptimizer(mean, cov, MAX_WEIGHT, RISK_FREE).max_sharpe()
+
+    def target_risk():
+        optimizer = MeanVarianceOptimizer(mean, cov, MAX_WEIGHT, RISK_FREE)
+        lowest, highest = optimizer.min_variance()["volatility"], optimizer.max_return()["volatility"]
+        return optimizer.target_risk((lowest + highest) / 2)
+
+    return {"min_variance": min_variance, "max_sharpe": max_sharpe, "target_risk": target_risk}
+
+
+def pypfopt_solvers(mean, cov):
+    if EfficientFrontier is None:
+        return {}
+
+    def run(method, *args):
+        def solve():
+            frontier = EfficientFrontier(mean, cov, weight_bounds=(0, MAX_WEIGHT))
+            getattr(frontier, method)(*args)
+            expected_return, volatility, sharpe = frontier.portfolio_performance(risk_free_rate=RISK_FREE)
+            return {"expected_return": expected_return, "volatility": volatility, "sharpe_ratio": sharpe}
+        return solve
+
+    return {"min_variance": run("min_volatility"), "max_sharpe": run("max_sharpe", RISK_FREE)}
+
+
+def check_frontier(cases: int = FRONTIER_CHECK_CASES) -> int:
+    """
+    Compara frontier_point(τ) con solve_long_only(cov, τ·μ, max_weight) sobre una
+    grilla de τ, para universos y pesos máximos al azar
+
+    Returns:
+        Cantidad de casos en que la frontera queda peor que la solución directa
+    """
+    def objective(cov, mean, tau, weights):
+        return 0.5 * weights @ cov @ weights - tau * mean @ weights
+
+    failures = 0
+    for seed in range(cases):
+        rng = np.random.default_rng(seed)
+        assets = int(rng.integers(3, 30))
+        max_weight = float(rng.uniform(1.0 / assets, 0.6))
+        mean, cov = make_inputs(assets, seed)
+        optimizer = MeanVarianceOptimizer(mean, cov, max_weight)
+        gap = max(
+            objective(cov, mean, tau, optimizer.frontier_point(tau)["weights"])
+            - objective(cov, mean, tau, solve_long_only(cov, tau * mean, max_weight)[0])
+            for tau in FRONTIER_CHECK_TAUS
+        )
+        if gap > FRONTIER_CHECK_TOL:
+            failures += 1
+            print(f"frontera subóptima: semilla {seed}, {assets} activos, peso máximo {max_weight:.3f}, Δ {gap:.3g}")
+    return failures
+
+
+def main():
+    failures = check_frontier()
+    print(f"control de la frontera: {failures} de {FRONTIER_CHECK_CASES} casos subóptimos\n")
+    print(f"{'activos':>7} {'objetivo':>13} {'numpy p50':>10} {'numpy p99':>10} "
+          f"{'pypfopt p50':>12} {'Δ sharpe':>9}")
+    for assets in ASSET_COUNTS:
+        mean, cov = make_inputs(assets)
+        reference = pypfopt_solvers(mean, cov)
+        for objective, solve in numpy_solvers(mean, cov).items():
+            p50, p99, point = timed(solve)
+            if objective in reference:
+                ref_p50, _, ref_point = timed(reference[objective], repeats=5)
+                ref_cell = f"{ref_p50:>12.2f}"
+                delta = f"{point['sharpe_ratio'] - ref_point['sharpe_ratio']:>+9.4f}"
+            else:
+                ref_cell, delta = f"{'-':>12}", f"{'-':>9}"
+            print(f"{assets:>7} {objective:>13} {p50:>10.3f} {p99:>10.3f} {ref_cell} {delta}")
+
+
+if __name__ == "__main__":
+    main()